@@ -0,0 +1,109 @@
+"""
+Caché de audios direccionada por contenido.
+
+Cada resumen en audio se guarda con el hash SHA-256 del guion (y del motor TTS
+que lo sintetizó), de modo que un guion idéntico nunca se vuelve a sintetizar.
+El directorio es compartido por todas las sesiones del proceso: los audios sin
+usar por más de `ttl_seconds` se eliminan y, si se supera `max_bytes`, se
+desalojan los usados hace más tiempo. Un audio desalojado se vuelve a
+sintetizar la próxima vez que se pida.
+"""
+
+import os
+import time
+import hashlib
+import tempfile
+from typing import Optional
+
+
+DEFAULT_AUDIO_PATH = os.path.join(tempfile.gettempdir(), "seguros_cache", "audio")
+
+
+class AudioCache:
+    """Guarda archivos de audio en disco indexados por hash del guion, con TTL y tope de tamaño"""
+
+    def __init__(self, root: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_bytes: Optional[int] = None, sweep_interval: float = 60.0):
+        self.root = root or os.environ.get("AUDIO_CACHE_PATH", DEFAULT_AUDIO_PATH)
+        self.ttl_seconds = (ttl_seconds if ttl_seconds is not None
+                            else int(os.environ.get("AUDIO_CACHE_TTL_SECONDS", 3 * 24 * 3600)))
+        self.max_bytes = (max_bytes if max_bytes is not None
+                          else int(os.environ.get("AUDIO_CACHE_MAX_MB", "256")) * 1024 * 1024)
+        self.sweep_interval = sweep_interval
+        os.makedirs(self.root, exist_ok=True)
+        self._last_sweep = 0.0
+        self._evict()
+
+    @staticmethod
+    def key(backend_name: str, script: str) -> str:
+        """Clave del audio: hash del motor + guion"""
+        return hashlib.sha256(f"{backend_name}:{script}".encode("utf-8")).hexdigest()
+
+    def path(self, key: str, extension: str) -> str:
+        """Ruta en disco del audio"""
+        return os.path.join(self.root, f"resumen_poliza_{key[:32]}.{extension}")
+
+    def get(self, key: str, extension: str) -> Optional[str]:
+        """Ruta del audio si ya existe, o None"""
+        path = self.path(key, extension)
+        try:
+            # La fecha de modificación hace de "último uso" para el desalojo
+            os.utime(path)
+        except OSError:
+            return None
+        return path
+
+    def put(self, key: str, extension: str, data: bytes) -> str:
+        """Guarda los bytes de forma atómica y devuelve la ruta"""
+        path = self.path(key, extension)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            tmp_file.write(data)
+        os.replace(tmp_path, path)
+        if time.monotonic() - self._last_sweep >= self.sweep_interval:
+            self._evict()
+        return path
+
+    def _evict(self) -> None:
+        """Elimina audios expirados y, si se excede `max_bytes`, los usados hace más tiempo"""
+        self._last_sweep = time.monotonic()
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.root) as scan:
+                for entry in scan:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    except OSError:
+                        continue
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            expired = self.ttl_seconds and now - mtime > self.ttl_seconds
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+        if removed:
+            print(f"[DEBUG] Caché de audio: {removed} archivo(s) desalojado(s), {total / 1024 / 1024:.1f} MB en uso")
+
+    def clear(self) -> int:
+        """Elimina todos los audios y devuelve cuántos se borraron"""
+        removed = 0
+        for filename in os.listdir(self.root):
+            try:
+                os.remove(os.path.join(self.root, filename))
+                removed += 1
+            except OSError:
+                pass
+        return removed
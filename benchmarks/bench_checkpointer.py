@@ -0,0 +1,85 @@
+"""
+Benchmark: latencia de escritura de checkpoints vs tamaño del estado.
+
+Uso:
+    python benchmarks/bench_checkpointer.py [--writes 200]
+
+Compara SQLiteCheckpointer (disco, WAL) con MemorySaver para estados con un
+número creciente de mensajes en la conversación.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.memory import MemorySaver
+
+from checkpointer import SQLiteCheckpointer
+from models import BusinessInfo, ConversationStep
+
+
+def build_state(message_count: int) -> dict:
+    """Estado representativo con message_count mensajes de ~400 caracteres"""
+    return {
+        "messages": [
+            {"role": "user" if i % 2 else "assistant", "content": "Texto de conversación " * 18}
+            for i in range(message_count)
+        ],
+        "current_step": ConversationStep.GATHERING_INFO,
+        "business_info": BusinessInfo(metraje=80.0, tipo_negocio="panadería", direccion="Av. Lima 123"),
+        "session_id": "bench",
+    }
+
+
+def bench_saver(saver, state: dict, writes: int) -> list:
+    """Escribe `writes` checkpoints consecutivos en un hilo y devuelve latencias en ms"""
+    config = {"configurable": {"thread_id": "bench", "checkpoint_ns": ""}}
+    versions = {key: saver.get_next_version(None, None) for key in state}
+    latencies = []
+
+    for _ in range(writes):
+        checkpoint = empty_checkpoint()
+        checkpoint["channel_values"] = state
+        checkpoint["channel_versions"] = versions
+
+        start = time.perf_counter()
+        config = saver.put(config, checkpoint, {"source": "loop", "step": 0}, versions)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--writes", type=int, default=200)
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix="bench_ckpt_")
+    print(f"{'mensajes':>9} {'estado KB':>10} {'sqlite p50 ms':>14} {'sqlite p95 ms':>14} {'memory p50 ms':>14} {'filas':>6}")
+
+    for message_count in [0, 10, 50, 200, 1000]:
+        state = build_state(message_count)
+
+        sqlite_saver = SQLiteCheckpointer(os.path.join(tmp_dir, f"bench_{message_count}.sqlite"),
+                                          max_checkpoints_per_thread=10)
+        state_kb = len(sqlite_saver.serde.dumps_typed(state)[1]) / 1024
+
+        sqlite_lat = bench_saver(sqlite_saver, state, args.writes)
+        memory_lat = bench_saver(MemorySaver(), state, args.writes)
+        rows = sqlite_saver.stats()["checkpoints"]
+        sqlite_saver.close()
+
+        print(f"{message_count:>9} {state_kb:>10.1f} "
+              f"{statistics.median(sqlite_lat):>14.3f} "
+              f"{statistics.quantiles(sqlite_lat, n=20)[18]:>14.3f} "
+              f"{statistics.median(memory_lat):>14.3f} {rows:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Benchmark: extracción de texto de certificados en PDF/Word.
+
+Uso:
+    python benchmarks/bench_document_text.py [--pages 200] [--paragraphs 2000] [--max-chars 3000]
+
+Compara el camino anterior de `extract_text_from_document` (todas las páginas o
+párrafos con `text += ...`) con `document_text.extract_text_from_document`, que
+se detiene al llenar el presupuesto de caracteres. Se generan un PDF de texto y
+un DOCX con párrafos y tablas sintéticos.
+"""
+
+import os
+import io
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import PyPDF2
+import docx
+
+from document_text import PDF_MIME, DOCX_MIME, extract_text_from_document
+
+
+class NamedBuffer(io.BytesIO):
+    """BytesIO con atributo `type`, como los archivos subidos de Streamlit"""
+
+    def __init__(self, data: bytes, mime_type: str):
+        super().__init__(data)
+        self.type = mime_type
+
+
+def synthetic_pdf(pages: int, lines_per_page: int = 40) -> bytes:
+    """PDF mínimo con una fuente estándar y texto en cada página"""
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,  # Árbol de páginas, se completa al final
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    kids = []
+    for page in range(pages):
+        lines = [
+            f"BT /F1 9 Tf 40 {800 - 18 * i} Td (Pagina {page + 1} linea {i + 1}: AREA 80.00 M2 "
+            f"GIRO PANADERIA RUC 20123456789) Tj ET"
+            for i in range(lines_per_page)
+        ]
+        stream = "\n".join(lines).encode("latin-1")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % kid for kid in kids), pages
+    )
+
+    output = io.BytesIO()
+    output.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(output.tell())
+        output.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = output.tell()
+    output.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        output.write(b"%010d 00000 n \n" % offset)
+    output.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return output.getvalue()
+
+
+def synthetic_docx(paragraphs: int) -> bytes:
+    """DOCX con párrafos y una tabla cada 50 párrafos"""
+    document = docx.Document()
+    for i in range(paragraphs):
+        document.add_paragraph(f"Párrafo {i + 1}: certificado de funcionamiento, área 80.00 m2")
+        if i % 50 == 0:
+            table = document.add_table(rows=3, cols=2)
+            for row in table.rows:
+                row.cells[0].text = "GIRO"
+                row.cells[1].text = "PANADERÍA - PASTELERÍA"
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+def legacy_extract(uploaded_file) -> str:
+    """Flujo anterior: recorre todo el documento concatenando strings"""
+    text = ""
+    if uploaded_file.type == PDF_MIME:
+        pdf_reader = PyPDF2.PdfReader(uploaded_file)
+        for page in pdf_reader.pages:
+            text += page.extract_text() + "\n"
+    elif uploaded_file.type == DOCX_MIME:
+        doc = docx.Document(uploaded_file)
+        for paragraph in doc.paragraphs:
+            text += paragraph.text + "\n"
+    return text
+
+
+def run(label: str, func, data: bytes, mime_type: str, repeat: int):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        text = func(NamedBuffer(data, mime_type))
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{label:<22} {elapsed * 1000:>9.1f} ms   {len(text):>9} caracteres")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--paragraphs", type=int, default=2000)
+    parser.add_argument("--max-chars", type=int, default=3000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    pdf_data = synthetic_pdf(args.pages)
+    docx_data = synthetic_docx(args.paragraphs)
+    budgeted = lambda f: extract_text_from_document(f, max_chars=args.max_chars)
+
+    print(f"PDF: {args.pages} páginas, {len(pdf_data) / 1024:.0f} KB")
+    run("anterior", legacy_extract, pdf_data, PDF_MIME, args.repeat)
+    run("con presupuesto", budgeted, pdf_data, PDF_MIME, args.repeat)
+    run("subproceso (timeout)", lambda f: extract_text_from_document(f, max_chars=args.max_chars, timeout=30),
+        pdf_data, PDF_MIME, args.repeat)
+
+    print(f"DOCX: {args.paragraphs} párrafos, {len(docx_data) / 1024:.0f} KB")
+    run("anterior", legacy_extract, docx_data, DOCX_MIME, args.repeat)
+    run("con presupuesto", budgeted, docx_data, DOCX_MIME, args.repeat)
+
+
+if __name__ == "__main__":
+    main()
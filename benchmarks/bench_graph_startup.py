@@ -0,0 +1,62 @@
+"""
+Benchmark: costo de crear un InsuranceAgentGraph por sesión.
+
+Uso:
+    python benchmarks/bench_graph_startup.py [--sessions 50]
+
+Compara la construcción anterior (ConversationNodes nuevos, checkpointer SQLite
+nuevo y grafo recompilado en cada instancia) con el registro del proceso, donde
+solo la primera sesión paga la compilación y el resto reutiliza nodos y grafo.
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Checkpoints en un directorio descartable
+os.environ.setdefault("CHECKPOINT_DB_PATH", os.path.join(tempfile.mkdtemp(), "bench_checkpoints.sqlite"))
+
+from checkpointer import SQLiteCheckpointer
+from conversation_nodes import ConversationNodes
+from insurance_graph import InsuranceAgentGraph, clear_graph_registry
+
+
+def build_without_registry(api_key: str):
+    """Reproduce la construcción previa al registro"""
+    nodes = ConversationNodes(api_key)
+    checkpointer = SQLiteCheckpointer()
+    return InsuranceAgentGraph._build_graph(nodes, checkpointer)
+
+
+def bench(build, sessions: int) -> list:
+    timings = []
+    for _ in range(sessions):
+        start = time.perf_counter()
+        build("sk-bench")
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def report(label: str, timings: list) -> None:
+    print(f"{label:<16} primera={timings[0]:8.2f} ms  mediana={statistics.median(timings[1:] or timings):8.3f} ms  "
+          f"total={sum(timings):9.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=50, help="Instancias a crear por variante")
+    args = parser.parse_args()
+
+    report("sin registro", bench(build_without_registry, args.sessions))
+
+    clear_graph_registry()
+    report("con registro", bench(InsuranceAgentGraph, args.sessions))
+
+
+if __name__ == "__main__":
+    main()
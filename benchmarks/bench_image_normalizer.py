@@ -0,0 +1,110 @@
+"""
+Benchmark: normalización de fotos subidas.
+
+Uso:
+    python benchmarks/bench_image_normalizer.py [--corpus DIR] [--count 8] [--max-size-kb 500]
+
+Compara el camino anterior de `batch_process_uploaded_files` (verify + reabrir +
+resize + hasta cinco recodificaciones JPEG + codificación final de ImageRef) con
+`utils.normalize_image`. Sin --corpus se generan fotos sintéticas tipo celular
+(4032x3024, JPEG q92, orientación EXIF 6).
+"""
+
+import os
+import io
+import sys
+import glob
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw, ImageFilter
+
+from utils import normalize_image, resize_image_for_api, compress_image_if_needed
+
+
+def synthetic_phone_photo(seed: int) -> bytes:
+    """Foto sintética con ruido de sensor, bloques de color y orientación EXIF"""
+    rng = random.Random(seed)
+    size = (4032, 3024)
+    base = Image.new("RGB", size)
+    draw = ImageDraw.Draw(base)
+    for _ in range(120):
+        x, y = rng.randint(0, size[0]), rng.randint(0, size[1])
+        draw.rectangle(
+            (x, y, x + rng.randint(100, 1200), y + rng.randint(100, 900)),
+            fill=tuple(rng.randint(20, 235) for _ in range(3))
+        )
+    noise = Image.effect_noise(size, 30).convert("RGB")
+    image = Image.blend(base.filter(ImageFilter.GaussianBlur(3)), noise, 0.15)
+
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Rotada 90° como las fotos verticales de celular
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=92, exif=exif)
+    return buffer.getvalue()
+
+
+def legacy_path(data: bytes, max_size_kb: int) -> bytes:
+    """Flujo anterior de batch_process_uploaded_files (sin Streamlit)"""
+    source = io.BytesIO(data)
+    Image.open(source).verify()
+    source.seek(0)
+
+    image = Image.open(source)
+    image = resize_image_for_api(image)
+    image = compress_image_if_needed(image, max_size_kb)
+
+    # ImageRef.from_pil_image
+    if image.mode in ("RGBA", "P", "LA", "L"):
+        image = image.convert("RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def run(label: str, func, corpus, max_size_kb: int):
+    start = time.perf_counter()
+    outputs = [func(data, max_size_kb) for data in corpus]
+    elapsed = time.perf_counter() - start
+
+    sizes_kb = [len(out) / 1024 for out in outputs]
+    over_budget = sum(1 for size in sizes_kb if size > max_size_kb)
+    dims = Image.open(io.BytesIO(outputs[0])).size
+    print(f"{label:<12} {elapsed / len(corpus) * 1000:>9.1f} ms/img   "
+          f"{sum(sizes_kb) / len(sizes_kb):>7.1f} KB prom   "
+          f"sobre presupuesto: {over_budget}   primera: {dims[0]}x{dims[1]}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", help="Directorio con fotos JPEG/PNG")
+    parser.add_argument("--count", type=int, default=8, help="Fotos sintéticas si no hay corpus")
+    parser.add_argument("--max-size-kb", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.corpus:
+        paths = sorted(
+            path for pattern in ("*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG")
+            for path in glob.glob(os.path.join(args.corpus, pattern))
+        )
+        corpus = []
+        for path in paths:
+            with open(path, "rb") as image_file:
+                corpus.append(image_file.read())
+    else:
+        corpus = [synthetic_phone_photo(seed) for seed in range(args.count)]
+
+    if not corpus:
+        print("No hay imágenes en el corpus")
+        return
+
+    print(f"{len(corpus)} imágenes, {sum(len(d) for d in corpus) / len(corpus) / 1024:.0f} KB promedio")
+    run("anterior", legacy_path, corpus, args.max_size_kb)
+    run("una pasada", lambda data, kb: normalize_image(data, max_size_kb=kb), corpus, args.max_size_kb)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Benchmark: tiempo de importación del punto de entrada (arranque en frío).
+
+Uso:
+    python benchmarks/bench_import_time.py [--module streamlit_app] [--repeat 3]
+                                           [--budget-ms 1000] [--top 15]
+
+Importa el módulo en un intérprete nuevo con `-X importtime`, resume los
+módulos más costosos (tiempo acumulado y propio) y falla (código 1) si el total
+supera el presupuesto o si se importaron de entrada módulos que deben cargarse
+de forma diferida (por defecto langgraph y openai). El presupuesto también se
+puede fijar con STARTUP_BUDGET_MS, p. ej. en CI.
+"""
+
+import os
+import re
+import sys
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)$")
+
+
+def measure_imports(module: str) -> list:
+    """Devuelve (módulo, propio_us, acumulado_us, profundidad) de una importación en frío"""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        error_lines = completed.stderr.strip().splitlines()
+        raise RuntimeError(error_lines[-1] if error_lines else f"código de salida {completed.returncode}")
+
+    rows = []
+    for line in completed.stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), (len(indent) - 1) // 2))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="streamlit_app", help="Módulo a importar")
+    parser.add_argument("--repeat", type=int, default=3, help="Corridas; se informa la más rápida")
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", 1000)),
+                        help="Tiempo máximo de importación aceptado")
+    parser.add_argument("--forbid", default="langgraph,openai",
+                        help="Paquetes que no deben importarse de entrada (separados por coma, vacío para omitir)")
+    parser.add_argument("--top", type=int, default=15, help="Módulos a mostrar")
+    args = parser.parse_args()
+
+    # Primera corrida descartada: calienta los .pyc y la caché de disco
+    measure_imports(args.module)
+    runs = [measure_imports(args.module) for _ in range(args.repeat)]
+    rows = min(runs, key=lambda run: next(cumulative for name, _, cumulative, _ in run if name == args.module))
+    total_ms = next(cumulative for name, _, cumulative, _ in rows if name == args.module) / 1000
+
+    print(f"{'módulo':<60} {'propio ms':>10} {'acumulado ms':>13}")
+    for name, self_us, cumulative_us, depth in sorted(rows, key=lambda row: -row[2])[:args.top]:
+        print(f"{'  ' * min(depth, 6) + name:<60} {self_us / 1000:10.1f} {cumulative_us / 1000:13.1f}")
+    print(f"\nTotal import {args.module}: {total_ms:.1f} ms (presupuesto {args.budget_ms:.0f} ms, "
+          f"{len(rows)} módulos)")
+
+    failed = False
+    forbidden = [package for package in args.forbid.split(",") if package]
+    eager = sorted({name.split(".")[0] for name, _, _, _ in rows if name.split(".")[0] in forbidden})
+    if eager:
+        print(f"ERROR: se importan de entrada: {', '.join(eager)}")
+        failed = True
+    if total_ms > args.budget_ms:
+        print(f"ERROR: el arranque excede el presupuesto por {total_ms - args.budget_ms:.1f} ms")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+Micro-benchmark: clasificación de tipo de negocio y ubicación.
+
+Uso:
+    python benchmarks/bench_keyword_matcher.py [--iterations 200000]
+
+Compara la implementación anterior (dict reconstruido en cada llamada + escaneo
+`any(keyword in texto)`) con el matcher precompilado, con y sin la caché LRU.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from keyword_matcher import BUSINESS_TYPE_MATCHER, LOCATION_MATCHER, business_type_key, location_key
+
+
+TIPOS = [
+    "PANADERÍA - PASTELERÍA",
+    "VENTA AL POR MENOR DE ABARROTES - BODEGA",
+    "RESTAURANTE - CEVICHERÍA",
+    "OFICINAS ADMINISTRATIVAS",
+    "BOTICA - VENTA DE PRODUCTOS FARMACÉUTICOS",
+    "TALLER DE MECÁNICA AUTOMOTRIZ",
+    "CONSULTORIO DENTAL",
+    "SALÓN DE BELLEZA Y SPA",
+    "FERRETERÍA Y MATERIALES DE CONSTRUCCIÓN",
+    "LAVANDERÍA",
+]
+
+DIRECCIONES = [
+    "AV. JOSÉ LARCO 345, MIRAFLORES, LIMA",
+    "CALLE MERCADERES 210, CERCADO, AREQUIPA",
+    "JR. PIZARRO 560, TRUJILLO, LA LIBERTAD",
+    "AV. EL SOL 120, CUSCO",
+    "AV. GRAU 890, PIURA",
+]
+
+
+def legacy_business_type_key(tipo_negocio: str) -> str:
+    """Implementación original de ValuationEngine._get_business_type_key"""
+    if not tipo_negocio:
+        return "default"
+    tipo_lower = tipo_negocio.lower()
+    keyword_mapping = {
+        "restaurante": ["restaurante", "restaurant", "comida", "cocina", "cevichería"],
+        "tienda": ["tienda", "store", "comercio", "venta", "bodega", "minimarket"],
+        "oficina": ["oficina", "office", "administrativa", "servicios"],
+        "farmacia": ["farmacia", "botica", "medicinas", "droguería"],
+        "bar": ["bar", "cantina", "licores", "discoteca", "pub"],
+        "panadería": ["panadería", "bakery", "pan", "pastelería", "repostería"],
+        "taller": ["taller", "mecánica", "reparación", "automotriz"],
+        "consultorio": ["consultorio", "clínica", "médico", "dental", "veterinaria"],
+        "salon": ["salón", "peluquería", "spa", "belleza", "estética"]
+    }
+    for business_type, keywords in keyword_mapping.items():
+        if any(keyword in tipo_lower for keyword in keywords):
+            return business_type
+    return "default"
+
+
+def legacy_location_key(direccion: str) -> str:
+    """Implementación original de ValuationEngine._get_location_multiplier (sin el multiplicador)"""
+    if not direccion:
+        return "default"
+    direccion_lower = direccion.lower()
+    if any(zona in direccion_lower for zona in ["lima", "miraflores", "san isidro", "surco", "la molina"]):
+        return "lima"
+    elif "arequipa" in direccion_lower:
+        return "arequipa"
+    elif "trujillo" in direccion_lower:
+        return "trujillo"
+    elif "cusco" in direccion_lower:
+        return "cusco"
+    return "default"
+
+
+def per_call_ns(func, inputs) -> float:
+    start = time.perf_counter_ns()
+    for value in inputs:
+        func(value)
+    return (time.perf_counter_ns() - start) / len(inputs)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    random.seed(0)
+    tipos = [random.choice(TIPOS) for _ in range(args.iterations)]
+    direcciones = [random.choice(DIRECCIONES) for _ in range(args.iterations)]
+
+    # Mismo resultado que la implementación anterior en entradas con tildes
+    for tipo in TIPOS:
+        assert business_type_key(tipo) == legacy_business_type_key(tipo), tipo
+    for direccion in DIRECCIONES:
+        assert location_key(direccion) == legacy_location_key(direccion), direccion
+
+    rows = [
+        ("tipo_negocio: anterior", per_call_ns(legacy_business_type_key, tipos)),
+        ("tipo_negocio: regex", per_call_ns(BUSINESS_TYPE_MATCHER.match, tipos)),
+        ("tipo_negocio: regex + LRU", per_call_ns(business_type_key, tipos)),
+        ("direccion: anterior", per_call_ns(legacy_location_key, direcciones)),
+        ("direccion: regex", per_call_ns(LOCATION_MATCHER.match, direcciones)),
+        ("direccion: regex + LRU", per_call_ns(location_key, direcciones)),
+    ]
+
+    print(f"{'variante':<28} {'ns/llamada':>12}")
+    for name, ns in rows:
+        print(f"{name:<28} {ns:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
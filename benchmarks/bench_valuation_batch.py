@@ -0,0 +1,95 @@
+"""
+Benchmark: valuación de un portafolio fila a fila frente a `estimate_batch`.
+
+Uso:
+    python benchmarks/bench_valuation_batch.py [--rows 20000] [--seed 7]
+
+Genera un portafolio sintético (metrajes enteros y con decimales, tipos y
+direcciones variados, filas sin metraje o sin tipo), lo valoriza con
+`estimate_property_value` registro por registro y con `estimate_batch`, e
+informa ambos tiempos. Falla (código 1) si alguna fila difiere en montos,
+descripción o versión de tabla, o si el cálculo por lote no es más rápido.
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models import BusinessInfo
+from valuation_engine import ValuationEngine
+
+TIPOS = ["Restaurante", "bodega", "Farmacia Central", "oficina contable", "bar", "panadería",
+         "taller mecánico", "consultorio dental", "salón de belleza", "ferretería", "", None]
+DIRECCIONES = ["Av. Larco 123, Miraflores, Lima", "Calle Mercaderes 10, Arequipa",
+               "Jr. Pizarro 55, Trujillo", "Av. El Sol 300, Cusco", "Piura", "", None]
+COLUMNS = ("inventario", "mobiliario", "infraestructura", "total", "descripcion", "tabla_version")
+
+
+def build_portfolio(rows: int, seed: int) -> list:
+    rng = random.Random(seed)
+    portfolio = []
+    for i in range(rows):
+        choice = i % 4
+        if choice == 0:
+            metraje = rng.randint(10, 500)
+        elif choice == 1:
+            metraje = float(rng.randint(10, 500))
+        elif choice == 2:
+            # Decimales y más de 6 cifras significativas (12345.678)
+            metraje = round(rng.uniform(5, 800), 2) if i % 8 == 2 else round(rng.uniform(1000, 99999), 3)
+        else:
+            metraje = rng.choice([0, None, round(rng.uniform(5, 800), 1)])
+        portfolio.append(BusinessInfo(
+            tipo_negocio=rng.choice(TIPOS), metraje=metraje, direccion=rng.choice(DIRECCIONES)
+        ))
+    return portfolio
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="Registros del portafolio")
+    parser.add_argument("--seed", type=int, default=7, help="Semilla del portafolio sintético")
+    args = parser.parse_args()
+
+    engine = ValuationEngine()
+    portfolio = build_portfolio(args.rows, args.seed)
+    # Descarta la importación de pandas/NumPy del tiempo por lote
+    engine.estimate_batch(portfolio[:10])
+
+    start = time.perf_counter()
+    scalar = [engine.estimate_property_value(info) for info in portfolio]
+    scalar_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    batch = engine.estimate_batch(portfolio)
+    batch_ms = (time.perf_counter() - start) * 1000
+
+    print(f"fila a fila: {scalar_ms:9.1f} ms")
+    print(f"por lote:    {batch_ms:9.1f} ms  ({scalar_ms / batch_ms:.1f}x)")
+
+    mismatches = []
+    for i, (valuation, row) in enumerate(zip(scalar, batch.to_dict("records"))):
+        for column in COLUMNS:
+            if getattr(valuation, column) != row[column]:
+                mismatches.append((i, column, getattr(valuation, column), row[column]))
+
+    failed = False
+    for i, column, expected, got in mismatches[:10]:
+        print(f"ERROR fila {i} ({column}): fila a fila={expected!r} lote={got!r}")
+    if mismatches:
+        print(f"ERROR: {len(mismatches)} diferencias entre ambos cálculos")
+        failed = True
+    else:
+        print(f"{len(portfolio)} filas idénticas")
+    if batch_ms >= scalar_ms:
+        print("ERROR: el cálculo por lote no es más rápido que fila a fila")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+"""
+Servidor local que imita `/v1/chat/completions` de OpenAI para pruebas sin red.
+
+Uso:
+    python benchmarks/fake_openai_server.py [--port 8089] [--latency 0.2] [--error-rate 0.1]
+
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=sk-local \\
+        python bulk_ingest.py certificados/ --output resultados.jsonl
+
+Responde a las salidas estructuradas (`response_format` json_schema) con los
+datos de un certificado de ejemplo, en streaming o no, y a cualquier otra
+petición con un texto corto. Con --error-rate devuelve 429/500 al azar para
+ejercitar los reintentos, y con --latency simula la demora del modelo.
+"""
+
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+SAMPLE_CERTIFICATE = {
+    "tipo_imagen": "certificate",
+    "metraje": 80.0,
+    "tipo_negocio": "PANADERÍA - PASTELERÍA",
+    "direccion": "AV. ABANCAY 123, CERCADO DE LIMA",
+    "nombre_cliente": "COMERCIAL PEREZ S.A.C.",
+    "nombre_negocio": "PANADERÍA DULCE",
+    "ruc": "20123456789",
+    "numero_certificado": "1234-2021-MML",
+    "fecha_expedicion": "12/03/2021",
+    "zonificacion": "CZ",
+    "ocupantes_maximo": 12
+}
+
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.0"
+    latency = 0.0
+    error_rate = 0.0
+    requests_served = 0
+    lock = threading.Lock()
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with self.lock:
+            type(self).requests_served += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if random.random() < self.error_rate:
+            status = random.choice([429, 500])
+            payload = json.dumps({"error": {"message": "error simulado", "type": "server_error"}}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        content = self._content(body)
+        usage = {"prompt_tokens": 100, "completion_tokens": max(1, len(content) // 4), "total_tokens": 0,
+                 "prompt_tokens_details": {"cached_tokens": 0}}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        base = {"id": "fake", "created": int(time.time()), "model": body.get("model", "gpt-4o-mini")}
+
+        if body.get("stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for i in range(0, len(content), 16):
+                chunk = dict(base, object="chat.completion.chunk",
+                             choices=[{"index": 0, "delta": {"content": content[i:i + 16]}, "finish_reason": None}])
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            final = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (body.get("stream_options") or {}).get("include_usage"):
+                final["usage"] = usage
+            self.wfile.write(f"data: {json.dumps(final)}\n\n".encode())
+            self.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        payload = json.dumps(dict(base, object="chat.completion", usage=usage, choices=[{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }])).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _content(self, body: dict) -> str:
+        response_format = body.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            properties = response_format["json_schema"]["schema"]["properties"]
+            return json.dumps({name: SAMPLE_CERTIFICATE.get(name) for name in properties}, ensure_ascii=False)
+        return "Respuesta de prueba del servidor local."
+
+
+def start_fake_server(port: int = 0, latency: float = 0.0, error_rate: float = 0.0) -> str:
+    """Levanta el servidor en un hilo y devuelve su base_url"""
+    handler = type("Handler", (FakeOpenAIHandler,), {"latency": latency, "error_rate": error_rate})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}/v1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Segundos de demora por petición")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de peticiones con 429/500")
+    args = parser.parse_args()
+
+    base_url = start_fake_server(args.port, args.latency, args.error_rate)
+    print(f"Servidor OpenAI simulado en {base_url} (Ctrl+C para salir)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
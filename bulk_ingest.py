@@ -0,0 +1,276 @@
+"""
+Ingesta masiva de certificados de funcionamiento desde una carpeta.
+
+Uso:
+    python bulk_ingest.py CARPETA [--output resultados.jsonl] [--parquet resultados.parquet]
+                          [--workers 4] [--retries 3] [--with-policy] [--retry-failed]
+
+Recorre la carpeta (imágenes, PDF, Word y texto) sin listarla completa en
+memoria, extrae los datos con `CertificateAnalyzer` con concurrencia acotada y
+reintentos con backoff exponencial, calcula la valuación con `ValuationEngine`
+y la prima con `PolicyGenerator`. Cada resultado se agrega al JSONL apenas
+termina: ese archivo es también el checkpoint, de modo que al relanzar el
+comando se omiten los archivos ya procesados. Al final puede exportarse a Parquet.
+
+Para probar sin la API real, apuntar a un servidor local compatible:
+    python benchmarks/fake_openai_server.py --port 8089 &
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=sk-local python bulk_ingest.py certificados/
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import mimetypes
+import threading
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Dict, Iterator, Optional, Set
+
+import openai
+from PIL import Image, ImageOps
+
+from certificate_analyzer import CertificateAnalyzer
+from document_text import PDF_MIME, DOCX_MIME, TEXT_MIME, extract_text_from_document
+from valuation_engine import ValuationEngine
+from policy_generator import PolicyGenerator
+from openai_clients import get_rate_limit_metrics
+
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".webp", ".tif", ".tiff", ".bmp"}
+DOCUMENT_MIME_TYPES = {
+    ".pdf": PDF_MIME,
+    ".docx": DOCX_MIME,
+    ".txt": TEXT_MIME,
+}
+
+
+def iter_certificate_files(directory: str, recursive: bool = True) -> Iterator[str]:
+    """Genera las rutas de los archivos soportados en orden estable"""
+    with os.scandir(directory) as entries:
+        entries = sorted(entries, key=lambda entry: entry.name)
+    for entry in entries:
+        if entry.is_dir(follow_symlinks=False):
+            if recursive:
+                yield from iter_certificate_files(entry.path, recursive)
+            continue
+        extension = os.path.splitext(entry.name)[1].lower()
+        if extension in IMAGE_EXTENSIONS or extension in DOCUMENT_MIME_TYPES:
+            yield entry.path
+
+
+def is_retryable(error: Exception) -> bool:
+    """Errores transitorios de la API (red, 429, 5xx); un archivo corrupto no se reintenta"""
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+
+def load_checkpoint(output_path: str, retry_failed: bool = False) -> Set[str]:
+    """Archivos ya procesados según el JSONL de salida"""
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    with open(output_path, "r", encoding="utf-8") as output_file:
+        for line in output_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # Última línea cortada por una interrupción
+                continue
+            if record.get("status") == "ok" or not retry_failed:
+                done.add(record["file"])
+    return done
+
+
+class BulkIngester:
+    """
+    Extrae, valoriza y cotiza certificados en lote
+
+    Los reintentos ante errores de la API son los de `retries`; el analizador
+    debería crearse con `max_retries=0` para no sumar los del controlador.
+    """
+
+    def __init__(self, analyzer: CertificateAnalyzer, valuation_engine: Optional[ValuationEngine] = None,
+                 policy_generator: Optional[PolicyGenerator] = None, workers: int = 4,
+                 retries: int = 3, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 with_policy: bool = False):
+        self.analyzer = analyzer
+        self.valuation_engine = valuation_engine or ValuationEngine()
+        self.policy_generator = policy_generator or PolicyGenerator()
+        self.workers = workers
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.with_policy = with_policy
+        self.counts = {"ok": 0, "error": 0, "skipped": 0, "retries": 0}
+        self._lock = threading.Lock()
+
+    def run(self, directory: str, output_path: str, retry_failed: bool = False,
+            limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Procesa la carpeta agregando un registro por archivo al JSONL
+
+        Returns:
+            dict con los conteos, el rendimiento y las estadísticas por nivel de extracción
+        """
+        done = load_checkpoint(output_path, retry_failed)
+        start = time.perf_counter()
+        submitted = 0
+        # Como máximo 2 archivos en espera por hilo: la carpeta se consume de a poco
+        max_in_flight = self.workers * 2
+
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, "a", encoding="utf-8") as output_file, \
+                ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ingest") as executor:
+            in_flight = set()
+            for path in iter_certificate_files(directory):
+                relative_path = os.path.relpath(path, directory)
+                if relative_path in done:
+                    self.counts["skipped"] += 1
+                    continue
+                if limit is not None and submitted >= limit:
+                    break
+
+                if len(in_flight) >= max_in_flight:
+                    finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self._write(output_file, finished)
+                in_flight.add(executor.submit(self.process_file, path, relative_path))
+                submitted += 1
+
+            self._write(output_file, in_flight)
+
+        elapsed = time.perf_counter() - start
+        processed = self.counts["ok"] + self.counts["error"]
+        summary = dict(self.counts)
+        summary["elapsed_s"] = round(elapsed, 2)
+        summary["files_per_s"] = round(processed / elapsed, 2) if elapsed else 0.0
+        summary["tiers"] = self.analyzer.get_tier_stats()
+        summary["rate_limits"] = get_rate_limit_metrics()
+        return summary
+
+    def _write(self, output_file, futures) -> None:
+        """Escribe los registros terminados; cada línea queda en disco antes de seguir"""
+        for future in futures:
+            record = future.result()
+            self.counts[record["status"]] += 1
+            output_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            output_file.flush()
+            print(f"[DEBUG] {record['file']}: {record['status']} ({record['attempts']} intento(s))")
+
+    def process_file(self, path: str, relative_path: str) -> Dict[str, Any]:
+        """Extrae y valoriza un archivo; nunca lanza excepciones"""
+        record = {"file": relative_path, "status": "ok", "attempts": 0, "error": None}
+        start = time.perf_counter()
+        try:
+            business_info = self._extract_with_retries(path, record)
+            record.update(business_info.__dict__)
+
+            valuation = self.valuation_engine.estimate_property_value(business_info)
+            record.update({
+                "inventario": valuation.inventario,
+                "mobiliario": valuation.mobiliario,
+                "infraestructura": valuation.infraestructura,
+                "valor_total": valuation.total,
+                "valuacion_descripcion": valuation.descripcion,
+                "tabla_version": valuation.tabla_version,
+                "prima_anual": None
+            })
+            if valuation.total > 0:
+                policy = self.policy_generator.generate_policy(business_info, valuation)
+                record["prima_anual"] = policy.premium_annual
+                if self.with_policy:
+                    record["poliza"] = policy.content
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = f"{type(e).__name__}: {str(e)}"
+
+        record["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return record
+
+    def _extract_with_retries(self, path: str, record: Dict[str, Any]):
+        """Extracción con reintentos y backoff exponencial con jitter"""
+        while True:
+            record["attempts"] += 1
+            try:
+                return self._extract(path)
+            except Exception as e:
+                if record["attempts"] > self.retries or not is_retryable(e):
+                    raise
+                with self._lock:
+                    self.counts["retries"] += 1
+                delay = min(self.backoff_max, self.backoff_base * 2 ** (record["attempts"] - 1))
+                time.sleep(random.uniform(0, delay))
+
+    def _extract(self, path: str):
+        extension = os.path.splitext(path)[1].lower()
+        if extension in IMAGE_EXTENSIONS:
+            with Image.open(path) as image:
+                image = ImageOps.exif_transpose(image)
+                image.load()
+            return self.analyzer.analyze_image(image, raise_errors=True)
+
+        mime_type = DOCUMENT_MIME_TYPES.get(extension) or mimetypes.guess_type(path)[0]
+        with open(path, "rb") as document_file:
+            text = extract_text_from_document(document_file, mime_type=mime_type)
+        return self.analyzer.analyze_document(text, raise_errors=True)
+
+
+def export_parquet(jsonl_path: str, parquet_path: str) -> int:
+    """Convierte el JSONL (incluidas corridas anteriores) a Parquet; devuelve las filas escritas"""
+    import pandas as pd
+
+    records = {}
+    with open(jsonl_path, "r", encoding="utf-8") as jsonl_file:
+        for line in jsonl_file:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            # Si un archivo se reintentó, queda su último resultado
+            records[record["file"]] = record
+
+    df = pd.DataFrame(list(records.values()))
+    df.to_parquet(parquet_path, index=False)
+    return len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directory", help="Carpeta con certificados")
+    parser.add_argument("--output", default="resultados.jsonl", help="JSONL de resultados (y checkpoint)")
+    parser.add_argument("--parquet", help="Exportar además a este archivo Parquet")
+    parser.add_argument("--workers", type=int, default=4, help="Extracciones concurrentes")
+    parser.add_argument("--retries", type=int, default=3, help="Reintentos por archivo ante errores de la API")
+    parser.add_argument("--backoff", type=float, default=1.0, help="Espera base del backoff en segundos")
+    parser.add_argument("--limit", type=int, help="Procesar como máximo N archivos nuevos")
+    parser.add_argument("--retry-failed", action="store_true", help="Reprocesar los archivos que fallaron")
+    parser.add_argument("--with-policy", action="store_true", help="Incluir el texto de la póliza")
+    parser.add_argument("--api-key", default=os.environ.get("OPENAI_API_KEY"))
+    parser.add_argument("--base-url", default=os.environ.get("OPENAI_BASE_URL"),
+                        help="URL de un servidor compatible con OpenAI (p. ej. uno local de pruebas)")
+    args = parser.parse_args()
+
+    if not args.api_key:
+        parser.error("Falta la API key (--api-key u OPENAI_API_KEY)")
+    if not os.path.isdir(args.directory):
+        parser.error(f"No existe la carpeta {args.directory}")
+
+    # Una sola capa de reintentos: la del ingester (--retries), que además los cuenta
+    analyzer = CertificateAnalyzer(args.api_key, base_url=args.base_url, max_retries=0)
+    ingester = BulkIngester(analyzer, workers=args.workers, retries=args.retries,
+                            backoff_base=args.backoff, with_policy=args.with_policy)
+    summary = ingester.run(args.directory, args.output, retry_failed=args.retry_failed, limit=args.limit)
+
+    if args.parquet:
+        rows = export_parquet(args.output, args.parquet)
+        summary["parquet_rows"] = rows
+
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if summary["error"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,44 +1,23 @@
-import openai
-import json
 import base64
 import io
+import os
+import time
+import threading
 import hashlib
 import uuid
 from PIL import Image
 from datetime import datetime
-from typing import Dict, Any, Optional
-import PyPDF2
-import docx
+from typing import Dict, Any, List, Optional, Tuple
 import re
 
 from models import BusinessInfo
+from openai_clients import get_openai_client
+from extraction_cache import ExtractionCache
+from structured_output import IncrementalJSONParser, json_schema_response_format
+from document_text import DOCUMENT_CHAR_BUDGET, extract_text_from_document  # noqa: F401 (se reexporta)
 
-class CertificateAnalyzer:
-    """Analizador de certificados de funcionamiento"""
-    
-    def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
-    
-    def analyze_image(self, image: Image.Image) -> BusinessInfo:
-        """Analiza una imagen del certificado usando GPT-4 Vision"""
-        try:
-            # Convertir imagen a base64
-            buffer = io.BytesIO()
-            
-            # Redimensionar imagen para reducir tokens pero mantener calidad de lectura
-            image_resized = image.copy()
-            if image_resized.width > 1200:
-                ratio = 1200 / image_resized.width
-                new_height = int(image_resized.height * ratio)
-                image_resized = image_resized.resize((1200, new_height), Image.Resampling.LANCZOS)
-            
-            # Guardar como JPEG con mayor calidad para mejor OCR
-            image_resized.save(buffer, format='JPEG', quality=90)
-            image_data = buffer.getvalue()
-            img_str = base64.b64encode(image_data).decode()
-            
-            # Prompt mejorado para extraer información
-            enhanced_prompt = """
+# Prompt de extracción de campos del certificado
+EXTRACTION_PROMPT = """
 Analiza esta imagen del certificado de funcionamiento peruano y extrae la siguiente información:
 
 CAMPOS REQUERIDOS:
@@ -71,107 +50,430 @@ Responde SOLO en formato JSON válido:
     "fecha_expedicion": "texto_o_null",
     "zonificacion": "texto_o_null"
 }
-            """
-            
-            # Realizar petición a OpenAI
-            response = self.client.chat.completions.create(
-                model="gpt-4o-mini",
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": enhanced_prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{img_str}",
-                                    "detail": "high"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=800,
-                temperature=0
-            )
-            
-            result_text = response.choices[0].message.content.strip()
+"""
+
+# Variante que además clasifica la imagen (una sola llamada a Vision)
+CLASSIFY_AND_EXTRACT_PROMPT = """
+Primero determina si la imagen es:
+1. Un CERTIFICADO DE FUNCIONAMIENTO (documento oficial con texto, sellos, firmas)
+2. Una FOTO DEL LOCAL COMERCIAL (interior, exterior, inventario, mobiliario)
+
+Incluye el campo "tipo_imagen" con el valor "certificate" o "local_photo".
+Si es una foto del local, devuelve todos los demás campos en null.
+""" + EXTRACTION_PROMPT.replace(
+    '{\n    "metraje"', '{\n    "tipo_imagen": "certificate_o_local_photo",\n    "metraje"'
+)
+
+# Esquemas de salida estructurada derivados de BusinessInfo
+EXTRACTION_SCHEMA = BusinessInfo.json_schema()
+CLASSIFY_AND_EXTRACT_SCHEMA = BusinessInfo.json_schema(extra_properties={
+    "tipo_imagen": {"type": "string", "enum": ["certificate", "local_photo"]}
+})
+
+# Prompt para completar campos a partir del texto ya extraído (OCR o capa de texto)
+TEXT_EXTRACTION_PROMPT = """Del siguiente texto de un certificado de funcionamiento peruano extrae
+únicamente estos campos: {fields}.
+El texto puede venir de un OCR y contener errores de lectura. Si no encuentras un campo, devuelve null."""
+
+# Campos sin los cuales no se puede valorizar ni emitir la póliza; si el nivel
+# local los encuentra todos, no se llama al LLM
+ESSENTIAL_FIELDS = ("metraje", "tipo_negocio", "direccion", "nombre_cliente")
+
+# Texto local mínimo para intentar la extracción por texto en lugar de Vision
+MIN_TEXT_CHARS = 80
+
+# Parsers de campos con formato fijo
+_FIELD_PATTERNS = {
+    "metraje": re.compile(
+        r"(\d{1,5}(?:[.,]\d{1,2})?)\s*(?:m2|m²|m\^2|mts2|mt2|metros\s+cuadrados)", re.IGNORECASE
+    ),
+    "ruc": re.compile(r"\bR\.?\s?U\.?\s?C\.?[^\d\n]{0,10}(\d{11})\b", re.IGNORECASE),
+    "numero_certificado": re.compile(
+        r"CERTIFICADO[^\n]{0,60}?\bN(?:[°ºo]|RO|UM)?\.?\s*:?\s*(\d[\w\-/]*)", re.IGNORECASE
+    ),
+    "fecha_expedicion": re.compile(
+        r"(?:FECHA\s+(?:DE\s+)?(?:EXPEDICI[OÓ]N|EMISI[OÓ]N)|EXPEDIDO\s+EL)\s*:?\s*"
+        r"(\d{1,2}[/.\-]\d{1,2}[/.\-]\d{2,4}|\d{1,2}\s+DE\s+[A-ZÁÉÍÓÚ]+\s+DE(?:L)?\s+\d{4})",
+        re.IGNORECASE
+    ),
+    "zonificacion": re.compile(r"ZONIFICACI[OÓ]N\s*:?\s*([A-Z]{1,4}\d?)\b", re.IGNORECASE),
+}
+
+# Parsers de campos rotulados ("GIRO: PANADERÍA")
+_LABEL_PATTERNS = {
+    "tipo_negocio": re.compile(
+        r"^[ \t]*(?:GIRO(?:\s+AUTORIZADO)?|ACTIVIDAD(?:\s+COMERCIAL)?)[ \t]*:[ \t]*(.+)$",
+        re.IGNORECASE | re.MULTILINE
+    ),
+    "direccion": re.compile(
+        r"^[ \t]*(?:DIRECCI[OÓ]N|UBICACI[OÓ]N|DOMICILIO)(?:\s+DEL\s+ESTABLECIMIENTO)?[ \t]*:[ \t]*(.+)$",
+        re.IGNORECASE | re.MULTILINE
+    ),
+    "nombre_cliente": re.compile(
+        r"^[ \t]*(?:TITULAR|RAZ[OÓ]N\s+SOCIAL|PROPIETARIO|CONDUCTOR)[ \t]*:[ \t]*(.+)$",
+        re.IGNORECASE | re.MULTILINE
+    ),
+    "nombre_negocio": re.compile(
+        r"^[ \t]*NOMBRE\s+COMERCIAL[ \t]*:[ \t]*(.+)$", re.IGNORECASE | re.MULTILINE
+    ),
+}
+
+
+def parse_certificate_fields(text: str) -> Dict[str, Any]:
+    """Extrae con expresiones regulares los campos reconocibles del texto del certificado"""
+    fields = {}
+    if not text:
+        return fields
+    
+    for field, pattern in _FIELD_PATTERNS.items():
+        match = pattern.search(text)
+        if match:
+            fields[field] = match.group(1).strip()
+    
+    for field, pattern in _LABEL_PATTERNS.items():
+        match = pattern.search(text)
+        if match and match.group(1).strip():
+            fields[field] = match.group(1).strip()
+    
+    return fields
+
+
+_ocr_engine = None
+_ocr_engine_loaded = False
+
+
+def _get_ocr_engine():
+    """Módulo pytesseract si está instalado junto con el binario tesseract (None si no)"""
+    global _ocr_engine, _ocr_engine_loaded
+    if not _ocr_engine_loaded:
+        _ocr_engine_loaded = True
+        try:
+            import pytesseract
+            pytesseract.get_tesseract_version()
+            _ocr_engine = pytesseract
+        except Exception:
+            print("[DEBUG] OCR local no disponible (pytesseract/tesseract), se usará Vision")
+            _ocr_engine = None
+    return _ocr_engine
+
+
+def ocr_image_text(image: Image.Image) -> str:
+    """Texto de la imagen con el OCR local (cadena vacía si no está disponible)"""
+    engine = _get_ocr_engine()
+    if engine is None:
+        return ""
+    try:
+        gray = image.convert("L")
+        return engine.image_to_string(gray, lang=os.environ.get("OCR_LANG", "spa"))
+    except Exception as e:
+        print(f"Error en OCR local: {str(e)}")
+        return ""
+
+
+class CertificateAnalyzer:
+    """Analizador de certificados de funcionamiento"""
+    
+    # Cambiar al modificar el prompt, el esquema o los niveles de extracción para invalidar la caché
+    # (v2: salida estructurada con esquema JSON y tipo_imagen;
+    #  v3: extracción por niveles OCR/texto/Vision con prompt de texto)
+    PROMPT_VERSION = "v3"
+    
+    def __init__(self, api_key: str, cache: Optional[ExtractionCache] = None,
+                 base_url: Optional[str] = None, max_retries: Optional[int] = None):
+        self.client = get_openai_client(api_key, base_url, max_retries)
+        self.cache = cache if cache is not None else ExtractionCache()
+        # Por nivel: intentos, extracciones resueltas sin escalar y latencia acumulada
+        self.tier_stats = {
+            tier: {"calls": 0, "resolved": 0, "total_ms": 0.0}
+            for tier in ("cache", "ocr", "text_layer", "llm_text", "vision")
+        }
+        self._stats_lock = threading.Lock()
+    
+    def analyze_image(self, image: Image.Image, raise_errors: bool = False) -> BusinessInfo:
+        """
+        Analiza una imagen del certificado por niveles
+        
+        caché -> OCR local con parsers regex -> LLM sobre el texto OCR -> Vision,
+        escalando solo con los campos que el nivel anterior no encontró.
+        Con `raise_errors` los errores de la API se propagan (para reintentar)
+        en lugar de devolver un BusinessInfo vacío.
+        """
+        try:
+            image_data = self._encode_for_vision(image)
             
-            # Limpiar respuesta para extraer JSON
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].strip()
+            # Consultar caché por contenido antes de llamar a Vision
+            cache_key = self._cache_key(image_data)
+            cached_data = self._cached_extraction(cache_key)
+            if cached_data is not None:
+                return BusinessInfo.from_dict(cached_data)
             
-            # Parsear JSON
-            extracted_data = json.loads(result_text)
+            # OCR local + regex; el LLM solo completa los campos que falten
+            cleaned_data, complete = self._tiered_extract(image, image_data)
             
-            # Limpiar y validar datos
-            cleaned_data = self._clean_extracted_data(extracted_data)
+            # Guardar solo extracciones completas con algún dato útil
+            if complete and any(value is not None for value in cleaned_data.values()):
+                self.cache.set(cache_key, cleaned_data)
             
             return BusinessInfo.from_dict(cleaned_data)
             
-        except json.JSONDecodeError as e:
-            print(f"Error parseando JSON: {str(e)}")
-            print(f"Respuesta recibida: {result_text}")
-            return BusinessInfo()
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error analizando imagen del certificado: {str(e)}")
             return BusinessInfo()
     
-    def analyze_document(self, document_text: str) -> BusinessInfo:
-        """Analiza el texto del documento usando GPT-3.5-turbo"""
-        try:
-            response = self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=[
+    def classify_and_analyze(self, image: Image.Image) -> Tuple[str, BusinessInfo]:
+        """
+        Clasifica la imagen y, si es un certificado, extrae sus datos en una sola llamada
+        
+        La extracción se guarda en la misma caché que `analyze_image`, así que el
+        análisis posterior del mismo certificado no vuelve a llamar a Vision.
+        
+        Returns:
+            Tuple[str, BusinessInfo]: ("certificate" | "local_photo", datos extraídos)
+        
+        Raises:
+            Los errores de la API se propagan: un fallo no debe archivar un
+            certificado como foto del local sin extraerlo
+        """
+        image_data = self._encode_for_vision(image)
+        
+        cache_key = self._cache_key(image_data)
+        cached_data = self._cached_extraction(cache_key)
+        if cached_data is not None:
+            return "certificate", BusinessInfo.from_dict(cached_data)
+        
+        # Si el OCR reconoce campos propios del certificado no hace falta clasificar con Vision
+        ocr_text = self._timed_ocr(image)
+        if len(parse_certificate_fields(ocr_text)) >= 2:
+            cleaned_data, complete = self._tiered_extract(image, image_data, ocr_text)
+            if complete and any(value is not None for value in cleaned_data.values()):
+                self.cache.set(cache_key, cleaned_data)
+            return "certificate", BusinessInfo.from_dict(cleaned_data)
+        
+        start = time.perf_counter()
+        extracted_data, complete = self._vision_request(
+            CLASSIFY_AND_EXTRACT_PROMPT, image_data,
+            "classified_business_info", CLASSIFY_AND_EXTRACT_SCHEMA
+        )
+        self._record_tier("vision", True, start)
+        
+        image_type = str(extracted_data.pop("tipo_imagen", "") or "").lower()
+        if not image_type:
+            # Respuesta cortada antes de clasificar: no se sabe qué es la imagen
+            raise RuntimeError("La clasificación de la imagen no se completó")
+        if "certificate" not in image_type:
+            return "local_photo", BusinessInfo()
+        
+        cleaned_data = self._clean_extracted_data(extracted_data)
+        if complete and any(value is not None for value in cleaned_data.values()):
+            self.cache.set(cache_key, cleaned_data)
+        
+        return "certificate", BusinessInfo.from_dict(cleaned_data)
+    
+    def _cached_extraction(self, cache_key: str) -> Optional[dict]:
+        """Extracción guardada en caché (None si no existe)"""
+        start = time.perf_counter()
+        cached_data = self.cache.get(cache_key)
+        self._record_tier("cache", cached_data is not None, start)
+        if cached_data is not None:
+            print(f"[DEBUG] Extracción recuperada de caché: {cache_key}")
+        return cached_data
+    
+    def _timed_ocr(self, image: Image.Image) -> str:
+        """OCR local registrando su latencia (solo si hay motor disponible)"""
+        if _get_ocr_engine() is None:
+            return ""
+        start = time.perf_counter()
+        text = ocr_image_text(image)
+        self._record_tier("ocr", False, start)
+        return text
+    
+    def _tiered_extract(self, image: Image.Image, image_data: bytes,
+                        ocr_text: Optional[str] = None) -> Tuple[dict, bool]:
+        """
+        Extrae los campos del certificado escalando de nivel solo para los que falten
+        
+        Returns:
+            Tuple[dict, bool]: (datos limpios, True si ningún nivel quedó truncado)
+        """
+        if ocr_text is None:
+            ocr_text = self._timed_ocr(image)
+        
+        data = {}
+        if _get_ocr_engine() is not None:
+            data = self._clean_extracted_data(parse_certificate_fields(ocr_text))
+            if self._has_essential_fields(data):
+                with self._stats_lock:
+                    self.tier_stats["ocr"]["resolved"] += 1
+                print("[DEBUG] Certificado resuelto con OCR local, sin llamar al LLM")
+                return data, True
+        
+        complete = True
+        missing = self._missing_fields(data)
+        if len(ocr_text.strip()) >= MIN_TEXT_CHARS:
+            # El texto OCR es legible: basta una llamada de texto por los campos faltantes
+            data, complete = self._complete_from_text(ocr_text, data, missing, "llm_text")
+            if self._has_essential_fields(data):
+                return data, complete
+            missing = self._missing_fields(data)
+        
+        # Vision solo para los campos que siguen faltando
+        start = time.perf_counter()
+        prompt = EXTRACTION_PROMPT
+        if len(missing) < len(EXTRACTION_SCHEMA["properties"]):
+            prompt += f"\nSolo se necesitan estos campos: {', '.join(missing)}"
+        vision_data, vision_complete = self._vision_request(
+            prompt, image_data, "business_info", BusinessInfo.json_schema(only=missing)
+        )
+        data = self._merge_missing(data, self._clean_extracted_data(vision_data))
+        self._record_tier("vision", self._has_essential_fields(data), start)
+        return data, complete and vision_complete
+    
+    def _complete_from_text(self, text: str, data: dict, missing: List[str],
+                            tier: str) -> Tuple[dict, bool]:
+        """Pide al LLM, a partir del texto, solo los campos que faltan"""
+        start = time.perf_counter()
+        messages = [
+            {"role": "system", "content": TEXT_EXTRACTION_PROMPT.format(fields=", ".join(missing))},
+            {"role": "user", "content": text[:DOCUMENT_CHAR_BUDGET]}
+        ]
+        extracted_data, complete = self._structured_request(
+            messages, "business_info", BusinessInfo.json_schema(only=missing), max_tokens=400
+        )
+        data = self._merge_missing(data, self._clean_extracted_data(extracted_data))
+        self._record_tier(tier, self._has_essential_fields(data), start)
+        return data, complete
+    
+    def _missing_fields(self, data: dict) -> List[str]:
+        """Campos de BusinessInfo aún sin valor"""
+        return [field for field in EXTRACTION_SCHEMA["properties"] if data.get(field) is None]
+    
+    def _has_essential_fields(self, data: dict) -> bool:
+        return all(data.get(field) is not None for field in ESSENTIAL_FIELDS)
+    
+    def _merge_missing(self, data: dict, new_data: dict) -> dict:
+        """Completa `data` con los valores nuevos sin pisar los ya encontrados"""
+        merged = dict(new_data)
+        merged.update({field: value for field, value in data.items() if value is not None})
+        return merged
+    
+    def _record_tier(self, tier: str, resolved: bool, start: float) -> None:
+        with self._stats_lock:
+            stats = self.tier_stats[tier]
+            stats["calls"] += 1
+            stats["resolved"] += int(resolved)
+            stats["total_ms"] += (time.perf_counter() - start) * 1000
+    
+    def _encode_for_vision(self, image: Image.Image) -> bytes:
+        """Redimensiona y codifica la imagen como JPEG para Vision"""
+        buffer = io.BytesIO()
+        
+        # Redimensionar imagen para reducir tokens pero mantener calidad de lectura
+        image_resized = image.copy()
+        if image_resized.width > 1200:
+            ratio = 1200 / image_resized.width
+            new_height = int(image_resized.height * ratio)
+            image_resized = image_resized.resize((1200, new_height), Image.Resampling.LANCZOS)
+        if image_resized.mode != "RGB":
+            image_resized = image_resized.convert("RGB")
+        
+        # Guardar como JPEG con mayor calidad para mejor OCR
+        image_resized.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+    
+    def _vision_request(self, prompt: str, image_data: bytes, schema_name: str,
+                        schema: dict) -> Tuple[dict, bool]:
+        """Envía la imagen y el prompt a Vision y devuelve los campos extraídos"""
+        img_str = base64.b64encode(image_data).decode()
+        
+        messages = [
+            {
+                "role": "user",
+                "content": [
                     {
-                        "role": "system", 
-                        "content": """Analiza este certificado de funcionamiento y extrae:
-1. Metraje/área del local (en m2) - busca números seguidos de m2, metros cuadrados, etc.
-2. Número máximo de ocupantes/trabajadores 
-3. Tipo de negocio/actividad comercial
-4. Dirección del local
-5. Nombre del propietario/empresa
-6. RUC
-7. Número del certificado
-8. Fecha de expedición
-9. Zonificación
-
-Responde SOLO en formato JSON válido: 
-{
-    "metraje": numero_o_null,
-    "ocupantes_maximo": numero_o_null,
-    "tipo_negocio": "texto_o_null",
-    "direccion": "texto_o_null",
-    "nombre_cliente": "texto_o_null",
-    "ruc": "texto_o_null",
-    "numero_certificado": "texto_o_null",
-    "fecha_expedicion": "texto_o_null",
-    "zonificacion": "texto_o_null"
-}"""
+                        "type": "text",
+                        "text": prompt
                     },
-                    {"role": "user", "content": document_text[:3000]}
+                    {
+                        "type": "image_url",
+                        "image_url": {
+                            "url": f"data:image/jpeg;base64,{img_str}",
+                            "detail": "high"
+                        }
+                    }
                 ]
+            }
+        ]
+        return self._structured_request(messages, schema_name, schema, max_tokens=800)
+    
+    def _structured_request(self, messages: list, schema_name: str, schema: dict,
+                            max_tokens: int, model: str = "gpt-4o-mini") -> Tuple[dict, bool]:
+        """
+        Pide una salida con esquema JSON en streaming y la parsea a medida que llega
+        
+        Si la respuesta se corta (max_tokens o error a mitad del stream) se
+        devuelven los campos ya completos en lugar de descartar la llamada.
+        
+        Returns:
+            Tuple[dict, bool]: (campos extraídos, True si el objeto llegó completo)
+        """
+        parser = IncrementalJSONParser()
+        finish_reason = None
+        
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                temperature=0,
+                response_format=json_schema_response_format(schema_name, schema),
+                stream=True
             )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                if choice.delta and choice.delta.content:
+                    parser.feed(choice.delta.content)
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        except Exception as e:
+            # Sin campos recuperados no hay nada que rescatar
+            if not parser.fields:
+                raise
+            print(f"[DEBUG] Stream interrumpido ({str(e)}), se recuperan {len(parser.fields)} campo(s)")
+        
+        data = parser.result()
+        if not parser.complete:
+            print(f"[DEBUG] Salida estructurada incompleta (finish_reason={finish_reason}): "
+                  f"{len(data)} campo(s) recuperados")
+        return data, parser.complete
+    
+    def analyze_document(self, document_text: str, raise_errors: bool = False) -> BusinessInfo:
+        """
+        Analiza el texto del documento (capa de texto del PDF/Word)
+        
+        Los parsers regex resuelven primero; GPT-4o-mini con salida estructurada
+        solo se consulta por los campos que falten.
+        """
+        try:
+            start = time.perf_counter()
+            data = self._clean_extracted_data(parse_certificate_fields(document_text))
+            resolved = self._has_essential_fields(data)
+            self._record_tier("text_layer", resolved, start)
+            if resolved:
+                print("[DEBUG] Documento resuelto con su capa de texto, sin llamar al LLM")
+                return BusinessInfo.from_dict(data)
             
-            result_text = response.choices[0].message.content.strip()
-            
-            # Limpiar respuesta para extraer JSON
-            if "```json" in result_text:
-                result_text = result_text.split("```json")[1].split("```")[0].strip()
-            elif "```" in result_text:
-                result_text = result_text.split("```")[1].strip()
-            
-            extracted_data = json.loads(result_text)
-            cleaned_data = self._clean_extracted_data(extracted_data)
-            
-            return BusinessInfo.from_dict(cleaned_data)
+            data, _ = self._complete_from_text(
+                document_text, data, self._missing_fields(data), "llm_text"
+            )
+            return BusinessInfo.from_dict(data)
             
         except Exception as e:
+            if raise_errors:
+                raise
             print(f"Error analizando documento: {str(e)}")
             return BusinessInfo()
     
@@ -205,30 +507,34 @@ Responde SOLO en formato JSON válido:
         
         return cleaned_data
     
+    def _image_hash(self, image_data: bytes) -> str:
+        """Hash de contenido de la imagen"""
+        return hashlib.md5(image_data).hexdigest()
+    
+    def _cache_key(self, image_data: bytes) -> str:
+        """Clave de caché: versión del prompt + hash de la imagen redimensionada"""
+        return f"{self.PROMPT_VERSION}:{self._image_hash(image_data)}"
+    
+    def get_cache_stats(self) -> Dict[str, Any]:
+        """Obtiene aciertos/fallos de la caché de extracciones"""
+        return self.cache.stats()
+    
+    def get_tier_stats(self) -> Dict[str, Any]:
+        """Tasa de resolución y latencia promedio de cada nivel de extracción"""
+        with self._stats_lock:
+            snapshot = {tier: dict(stats) for tier, stats in self.tier_stats.items()}
+        
+        for stats in snapshot.values():
+            calls = stats["calls"]
+            stats["hit_rate"] = stats["resolved"] / calls if calls else 0.0
+            stats["avg_ms"] = stats["total_ms"] / calls if calls else 0.0
+        return snapshot
+    
     def generate_certificate_id(self, image_data: bytes, ruc: Optional[str] = None) -> str:
         """Genera un ID único para el certificado"""
-        image_hash = hashlib.md5(image_data).hexdigest()[:12]
+        image_hash = self._image_hash(image_data)[:12]
         
         if ruc:
             return f"CERT_{ruc}_{image_hash}"
         else:
             return f"CERT_{image_hash}_{uuid.uuid4().hex[:8]}"
-
-def extract_text_from_document(uploaded_file) -> str:
-    """Extrae texto de documentos PDF/Word"""
-    text = ""
-    try:
-        if uploaded_file.type == "application/pdf":
-            pdf_reader = PyPDF2.PdfReader(uploaded_file)
-            for page in pdf_reader.pages:
-                text += page.extract_text() + "\n"
-        elif uploaded_file.type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-            doc = docx.Document(uploaded_file)
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-        elif uploaded_file.type == "text/plain":
-            text = str(uploaded_file.read(), "utf-8")
-    except Exception as e:
-        print(f"Error extrayendo texto: {str(e)}")
-    
-    return text
\ No newline at end of file
@@ -0,0 +1,434 @@
+"""
+Checkpointer SQLite persistente y acotado para el grafo de LangGraph.
+
+Reemplaza a `MemorySaver`: los checkpoints sobreviven a reinicios del proceso,
+cada hilo (`session_id`) conserva solo sus últimos N checkpoints y las sesiones
+inactivas se eliminan en segundo plano.
+"""
+
+import os
+import time
+import random
+import sqlite3
+import asyncio
+import tempfile
+import threading
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    WRITES_IDX_MAP,
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+    get_checkpoint_id,
+    get_checkpoint_metadata,
+    writes_sort_key,
+)
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+
+DEFAULT_CHECKPOINT_PATH = os.path.join(tempfile.gettempdir(), "seguros_cache", "checkpoints.sqlite")
+
+# Tipos de models.py que viajan en GraphState y deben poder leerse al reabrir la base
+STATE_TYPES = [
+    ("models", "ConversationStep"),
+    ("models", "BusinessInfo"),
+    ("models", "Valuation"),
+    ("models", "InsurancePolicy"),
+    ("models", "ImageRef"),
+    ("models", "SerializableImage"),
+]
+
+
+class SQLiteCheckpointer(BaseCheckpointSaver[str]):
+    """
+    Checkpointer SQLite (modo WAL) con retención por hilo y desalojo de sesiones inactivas
+
+    Cada checkpoint se guarda completo (incluidos los valores de los canales), por
+    lo que eliminar checkpoints antiguos nunca rompe la reconstrucción del último.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, max_checkpoints_per_thread: int = 10,
+                 idle_ttl_seconds: int = 24 * 3600, serde=None):
+        super().__init__(serde=serde or JsonPlusSerializer(allowed_msgpack_modules=STATE_TYPES))
+        self.db_path = db_path or os.environ.get("CHECKPOINT_DB_PATH", DEFAULT_CHECKPOINT_PATH)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.idle_ttl_seconds = idle_ttl_seconds
+
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._setup()
+
+        self._eviction_thread: Optional[threading.Thread] = None
+        self._stop_eviction = threading.Event()
+
+    def _setup(self) -> None:
+        """Crea las tablas si no existen"""
+        with self._lock:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS checkpoints (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    parent_checkpoint_id TEXT,
+                    type TEXT,
+                    checkpoint BLOB,
+                    metadata_type TEXT,
+                    metadata BLOB,
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id)
+                );
+                CREATE TABLE IF NOT EXISTS writes (
+                    thread_id TEXT NOT NULL,
+                    checkpoint_ns TEXT NOT NULL DEFAULT '',
+                    checkpoint_id TEXT NOT NULL,
+                    task_id TEXT NOT NULL,
+                    idx INTEGER NOT NULL,
+                    channel TEXT NOT NULL,
+                    type TEXT,
+                    value BLOB,
+                    task_path TEXT NOT NULL DEFAULT '',
+                    PRIMARY KEY (thread_id, checkpoint_ns, checkpoint_id, task_id, idx)
+                );
+                CREATE TABLE IF NOT EXISTS threads (
+                    thread_id TEXT PRIMARY KEY,
+                    last_access REAL NOT NULL
+                );
+                """
+            )
+            self._conn.commit()
+
+    # ------------------------------------------------------------------
+    # Interfaz BaseCheckpointSaver
+    # ------------------------------------------------------------------
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        """Obtiene un checkpoint (el indicado en config o el último del hilo)"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = get_checkpoint_id(config)
+
+        with self._lock:
+            if checkpoint_id:
+                row = self._conn.execute(
+                    """SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                       FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?""",
+                    (thread_id, checkpoint_ns, checkpoint_id)
+                ).fetchone()
+            else:
+                row = self._conn.execute(
+                    """SELECT checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata
+                       FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                       ORDER BY checkpoint_id DESC LIMIT 1""",
+                    (thread_id, checkpoint_ns)
+                ).fetchone()
+
+            if row is None:
+                return None
+
+            self._touch(thread_id)
+            self._conn.commit()
+            return self._row_to_tuple(thread_id, checkpoint_ns, row)
+
+    def list(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+             before: Optional[RunnableConfig] = None, limit: Optional[int] = None) -> Iterator[CheckpointTuple]:
+        """Lista checkpoints del más reciente al más antiguo"""
+        query = """SELECT thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint,
+                          metadata_type, metadata FROM checkpoints"""
+        clauses, params = [], []
+
+        if config:
+            clauses.append("thread_id = ?")
+            params.append(config["configurable"]["thread_id"])
+            if config["configurable"].get("checkpoint_ns") is not None:
+                clauses.append("checkpoint_ns = ?")
+                params.append(config["configurable"]["checkpoint_ns"])
+            if get_checkpoint_id(config):
+                clauses.append("checkpoint_id = ?")
+                params.append(get_checkpoint_id(config))
+        if before and get_checkpoint_id(before):
+            clauses.append("checkpoint_id < ?")
+            params.append(get_checkpoint_id(before))
+
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY checkpoint_id DESC"
+
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+
+        for thread_id, checkpoint_ns, *row in rows:
+            if limit is not None and limit <= 0:
+                break
+
+            with self._lock:
+                checkpoint_tuple = self._row_to_tuple(thread_id, checkpoint_ns, row)
+
+            if filter and not all(
+                checkpoint_tuple.metadata.get(key) == value for key, value in filter.items()
+            ):
+                continue
+
+            if limit is not None:
+                limit -= 1
+            yield checkpoint_tuple
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+            new_versions: ChannelVersions) -> RunnableConfig:
+        """Guarda un checkpoint completo y aplica la retención del hilo"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        parent_checkpoint_id = config["configurable"].get("checkpoint_id")
+
+        checkpoint_type, checkpoint_blob = self.serde.dumps_typed(checkpoint)
+        metadata_type, metadata_blob = self.serde.dumps_typed(get_checkpoint_metadata(config, metadata))
+
+        with self._lock:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO checkpoints
+                   (thread_id, checkpoint_ns, checkpoint_id, parent_checkpoint_id, type, checkpoint, metadata_type, metadata)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (thread_id, checkpoint_ns, checkpoint["id"], parent_checkpoint_id,
+                 checkpoint_type, checkpoint_blob, metadata_type, metadata_blob)
+            )
+            self._touch(thread_id)
+            self._apply_retention(thread_id, checkpoint_ns)
+            self._conn.commit()
+
+        return {
+            "configurable": {
+                "thread_id": thread_id,
+                "checkpoint_ns": checkpoint_ns,
+                "checkpoint_id": checkpoint["id"],
+            }
+        }
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                   task_path: str = "") -> None:
+        """Guarda escrituras pendientes asociadas a un checkpoint"""
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        checkpoint_id = config["configurable"]["checkpoint_id"]
+
+        # Las escrituras especiales (idx negativo) se reemplazan; las normales no se duplican
+        rows = {"INSERT OR REPLACE": [], "INSERT OR IGNORE": []}
+        for idx, (channel, value) in enumerate(writes):
+            write_idx = WRITES_IDX_MAP.get(channel, idx)
+            value_type, value_blob = self.serde.dumps_typed(value)
+            verb = "INSERT OR REPLACE" if write_idx < 0 else "INSERT OR IGNORE"
+            rows[verb].append((thread_id, checkpoint_ns, checkpoint_id, task_id, write_idx,
+                               channel, value_type, value_blob, task_path))
+
+        with self._lock:
+            for verb, verb_rows in rows.items():
+                if verb_rows:
+                    self._conn.executemany(
+                        f"""{verb} INTO writes
+                            (thread_id, checkpoint_ns, checkpoint_id, task_id, idx, channel, type, value, task_path)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                        verb_rows
+                    )
+            self._conn.commit()
+
+    def delete_thread(self, thread_id: str) -> None:
+        """Elimina todos los checkpoints y escrituras de un hilo"""
+        with self._lock:
+            self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+            self._conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+    def get_next_version(self, current: Optional[str], channel: None) -> str:
+        """Versiones de canal como cadenas monótonas (mismo formato que MemorySaver)"""
+        if current is None:
+            current_v = 0
+        elif isinstance(current, int):
+            current_v = current
+        else:
+            current_v = int(current.split(".")[0])
+        return f"{current_v + 1:032}.{random.random():016}"
+
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(self, config: Optional[RunnableConfig], *, filter: Optional[Dict[str, Any]] = None,
+                    before: Optional[RunnableConfig] = None, limit: Optional[int] = None):
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[Tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self.delete_thread, thread_id)
+
+    # ------------------------------------------------------------------
+    # Retención, compactación y desalojo
+    # ------------------------------------------------------------------
+
+    def _touch(self, thread_id: str) -> None:
+        """Registra el último acceso al hilo"""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO threads (thread_id, last_access) VALUES (?, ?)",
+            (thread_id, time.time())
+        )
+
+    def _apply_retention(self, thread_id: str, checkpoint_ns: str) -> int:
+        """Conserva solo los últimos N checkpoints del hilo; devuelve cuántos eliminó"""
+        if not self.max_checkpoints_per_thread:
+            return 0
+
+        old_ids = [
+            row[0] for row in self._conn.execute(
+                """SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?
+                   ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?""",
+                (thread_id, checkpoint_ns, self.max_checkpoints_per_thread)
+            ).fetchall()
+        ]
+        if not old_ids:
+            return 0
+
+        params = [(thread_id, checkpoint_ns, checkpoint_id) for checkpoint_id in old_ids]
+        self._conn.executemany(
+            "DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params
+        )
+        self._conn.executemany(
+            "DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?", params
+        )
+        return len(old_ids)
+
+    def compact(self) -> Dict[str, int]:
+        """Aplica la retención a todos los hilos, elimina escrituras huérfanas y reduce el WAL"""
+        with self._lock:
+            removed = 0
+            for thread_id, checkpoint_ns in self._conn.execute(
+                "SELECT DISTINCT thread_id, checkpoint_ns FROM checkpoints"
+            ).fetchall():
+                removed += self._apply_retention(thread_id, checkpoint_ns)
+
+            orphan_writes = self._conn.execute(
+                """DELETE FROM writes WHERE NOT EXISTS (
+                       SELECT 1 FROM checkpoints c WHERE c.thread_id = writes.thread_id
+                       AND c.checkpoint_ns = writes.checkpoint_ns AND c.checkpoint_id = writes.checkpoint_id
+                   )"""
+            ).rowcount
+            self._conn.commit()
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        return {"checkpoints_removed": removed, "writes_removed": orphan_writes}
+
+    def evict_idle_threads(self, idle_ttl_seconds: Optional[int] = None) -> int:
+        """Elimina los hilos sin actividad durante más de idle_ttl_seconds; devuelve cuántos"""
+        ttl = idle_ttl_seconds if idle_ttl_seconds is not None else self.idle_ttl_seconds
+        cutoff = time.time() - ttl
+
+        with self._lock:
+            idle = [
+                row[0] for row in self._conn.execute(
+                    "SELECT thread_id FROM threads WHERE last_access < ?", (cutoff,)
+                ).fetchall()
+            ]
+            for thread_id in idle:
+                self._conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (thread_id,))
+                self._conn.execute("DELETE FROM writes WHERE thread_id = ?", (thread_id,))
+                self._conn.execute("DELETE FROM threads WHERE thread_id = ?", (thread_id,))
+            self._conn.commit()
+
+        if idle:
+            print(f"[DEBUG] Checkpointer: {len(idle)} sesiones inactivas eliminadas")
+        return len(idle)
+
+    def start_eviction(self, interval_seconds: int = 600) -> None:
+        """Lanza un hilo en segundo plano que desaloja sesiones inactivas y compacta periódicamente"""
+        if self._eviction_thread and self._eviction_thread.is_alive():
+            return
+
+        self._stop_eviction.clear()
+
+        def _run():
+            while not self._stop_eviction.wait(interval_seconds):
+                try:
+                    self.evict_idle_threads()
+                    self.compact()
+                except Exception as e:
+                    print(f"[DEBUG] Error en desalojo de checkpoints: {str(e)}")
+
+        self._eviction_thread = threading.Thread(target=_run, name="checkpoint-eviction", daemon=True)
+        self._eviction_thread.start()
+
+    def stop_eviction(self) -> None:
+        """Detiene el hilo de desalojo"""
+        self._stop_eviction.set()
+        if self._eviction_thread:
+            self._eviction_thread.join(timeout=5)
+            self._eviction_thread = None
+
+    def stats(self) -> Dict[str, int]:
+        """Cantidad de hilos, checkpoints y escrituras almacenados"""
+        with self._lock:
+            return {
+                "threads": self._conn.execute("SELECT COUNT(*) FROM threads").fetchone()[0],
+                "checkpoints": self._conn.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0],
+                "writes": self._conn.execute("SELECT COUNT(*) FROM writes").fetchone()[0],
+            }
+
+    def close(self) -> None:
+        self.stop_eviction()
+        with self._lock:
+            self._conn.close()
+
+    # ------------------------------------------------------------------
+
+    def _row_to_tuple(self, thread_id: str, checkpoint_ns: str, row) -> CheckpointTuple:
+        """Convierte una fila de checkpoints en CheckpointTuple (requiere el lock)"""
+        checkpoint_id, parent_checkpoint_id, checkpoint_type, checkpoint_blob, metadata_type, metadata_blob = row
+
+        write_rows = self._conn.execute(
+            """SELECT task_id, idx, channel, type, value, task_path FROM writes
+               WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?""",
+            (thread_id, checkpoint_ns, checkpoint_id)
+        ).fetchall()
+        write_rows.sort(key=lambda w: writes_sort_key(w[5], w[0], w[1]))
+
+        return CheckpointTuple(
+            config={
+                "configurable": {
+                    "thread_id": thread_id,
+                    "checkpoint_ns": checkpoint_ns,
+                    "checkpoint_id": checkpoint_id,
+                }
+            },
+            checkpoint=self.serde.loads_typed((checkpoint_type, checkpoint_blob)),
+            metadata=self.serde.loads_typed((metadata_type, metadata_blob)),
+            parent_config=(
+                {
+                    "configurable": {
+                        "thread_id": thread_id,
+                        "checkpoint_ns": checkpoint_ns,
+                        "checkpoint_id": parent_checkpoint_id,
+                    }
+                }
+                if parent_checkpoint_id
+                else None
+            ),
+            pending_writes=[
+                (task_id, channel, self.serde.loads_typed((value_type, value)))
+                for task_id, _, channel, value_type, value, _ in write_rows
+            ],
+        )
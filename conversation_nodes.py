@@ -1,16 +1,18 @@
-import openai
 import re
 from typing import List, Dict, Any
 from models import GraphState, ConversationStep, BusinessInfo, Valuation
 from certificate_analyzer import CertificateAnalyzer
 from valuation_engine import ValuationEngine
 from policy_generator import PolicyGenerator
+from keyword_matcher import BUSINESS_TYPE_MATCHER
+from openai_clients import get_openai_client
+from image_store import MissingImageError, MISSING_IMAGE_MESSAGE
 
 class ConversationNodes:
     """Nodos del grafo de conversación para el agente de seguros"""
     
     def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key)
         self.certificate_analyzer = CertificateAnalyzer(api_key)
         self.valuation_engine = ValuationEngine()
         self.policy_generator = PolicyGenerator()
@@ -124,8 +126,17 @@ Por ejemplo: "Tengo una panadería de 50m²" o sube una foto/documento."""
             business_info = self.certificate_analyzer.analyze_document(state["certificate_text"])
         elif state["certificate_images"]:
             # Analizar imagen del certificado
-            # Convertir SerializableImage a PIL Image
-            cert_image = state["certificate_images"][0].to_pil_image()
+            # Abrir la imagen referenciada (decodificación perezosa)
+            try:
+                cert_image = state["certificate_images"][0].to_pil_image()
+            except MissingImageError:
+                # Sesión reanudada cuya imagen ya se desalojó del almacén
+                state["certificate_images"] = []
+                state["messages"].append({
+                    "role": "assistant",
+                    "content": f"📄 {MISSING_IMAGE_MESSAGE}"
+                })
+                return state
             business_info = self.certificate_analyzer.analyze_image(cert_image)
         else:
             return state
@@ -271,7 +282,8 @@ Por ejemplo: "Tengo una panadería de 50m²" o sube una foto/documento."""
         audio_file, summary_text = self.policy_generator.generate_audio_summary(
             state["business_info"],
             state["valuation"],
-            state["policy"]
+            state["policy"],
+            background=True
         )
         
         if audio_file:
@@ -370,7 +382,8 @@ Por ejemplo: "Tengo una panadería de 50m²" o sube una foto/documento."""
         return state
 
     
-    def _extract_info_from_text(self, text: str) -> Dict[str, Any]:
+    @staticmethod
+    def _extract_info_from_text(text: str) -> Dict[str, Any]:
         """Extrae información del negocio del texto del usuario"""
         extracted = {}
         text_lower = text.lower()
@@ -392,22 +405,9 @@ Por ejemplo: "Tengo una panadería de 50m²" o sube una foto/documento."""
                     continue
         
         # Extraer tipo de negocio
-        business_types = {
-            "restaurante": ["restaurante", "restaurant", "comida", "cocina", "cevichería"],
-            "tienda": ["tienda", "store", "comercio", "venta", "bodega", "minimarket"],
-            "oficina": ["oficina", "office", "administrativa", "servicios"],
-            "farmacia": ["farmacia", "botica", "medicinas", "droguería"],
-            "bar": ["bar", "cantina", "licores", "discoteca", "pub"],
-            "panadería": ["panadería", "bakery", "pan", "pastelería", "repostería"],
-            "taller": ["taller", "mecánica", "reparación", "automotriz"],
-            "consultorio": ["consultorio", "clínica", "médico", "dental", "veterinaria"],
-            "salon": ["salón", "peluquería", "spa", "belleza", "estética"]
-        }
-        
-        for business_type, keywords in business_types.items():
-            if any(keyword in text_lower for keyword in keywords):
-                extracted['tipo_negocio'] = business_type
-                break
+        business_type = BUSINESS_TYPE_MATCHER.match(text)
+        if business_type:
+            extracted['tipo_negocio'] = business_type
         
         return extracted
     
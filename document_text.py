@@ -0,0 +1,153 @@
+"""
+Extracción de texto de certificados en PDF, Word o texto plano.
+
+El texto se genera por bloques (página, párrafo o fila de tabla) y la lectura se
+detiene al alcanzar el presupuesto de caracteres: `analyze_document` solo usa el
+inicio del documento, así que no tiene sentido recorrer un PDF de 200 páginas.
+Para PDFs patológicos la extracción puede correr en un subproceso con tiempo
+límite.
+"""
+
+import io
+import os
+import sys
+import codecs
+import subprocess
+from typing import Iterator, Optional
+
+
+PDF_MIME = "application/pdf"
+DOCX_MIME = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+TEXT_MIME = "text/plain"
+
+# Caracteres que usa analyze_document
+DOCUMENT_CHAR_BUDGET = 3000
+
+
+def _iter_pdf(source) -> Iterator[str]:
+    import PyPDF2
+
+    reader = PyPDF2.PdfReader(source)
+    # Las páginas se parsean bajo demanda al recorrerlas
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+def _iter_docx(source) -> Iterator[str]:
+    import docx
+    from docx.table import Table
+    from docx.text.paragraph import Paragraph
+
+    document = docx.Document(source)
+    # Párrafos y tablas en el orden en que aparecen en el documento
+    for child in document.element.body.iterchildren():
+        tag = child.tag.rsplit("}", 1)[-1]
+        if tag == "p":
+            yield Paragraph(child, document).text
+        elif tag == "tbl":
+            for row in Table(child, document).rows:
+                cells = []
+                for cell in row.cells:
+                    text = cell.text.strip()
+                    # Las celdas combinadas se repiten en cada columna que abarcan
+                    if text and (not cells or cells[-1] != text):
+                        cells.append(text)
+                if cells:
+                    yield " | ".join(cells)
+
+
+def _iter_plain_text(source, chunk_size: int = 8192) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    while True:
+        chunk = source.read(chunk_size)
+        if not chunk:
+            break
+        yield decoder.decode(chunk)
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+def iter_document_text(source, mime_type: str) -> Iterator[str]:
+    """
+    Genera el texto del documento bloque a bloque
+
+    Args:
+        source: Archivo o buffer binario
+        mime_type: Tipo MIME del documento
+    """
+    if mime_type == PDF_MIME:
+        return _iter_pdf(source)
+    if mime_type == DOCX_MIME:
+        return _iter_docx(source)
+    if mime_type == TEXT_MIME:
+        return _iter_plain_text(source)
+    return iter(())
+
+
+def _collect_text(source, mime_type: str, max_chars: Optional[int]) -> str:
+    """Junta los bloques hasta llenar el presupuesto de caracteres"""
+    # El texto plano llega en trozos arbitrarios, no en líneas
+    separator = "" if mime_type == TEXT_MIME else "\n"
+    parts = []
+    total = 0
+    for block in iter_document_text(source, mime_type):
+        parts.append(block + separator)
+        total += len(block) + len(separator)
+        if max_chars is not None and total >= max_chars:
+            break
+
+    text = "".join(parts)
+    return text[:max_chars] if max_chars is not None else text
+
+
+def _collect_text_in_subprocess(data: bytes, mime_type: str, max_chars: Optional[int],
+                                timeout: float) -> str:
+    """Extrae en un proceso aparte (este mismo módulo) y lo mata si excede `timeout` segundos"""
+    command = [sys.executable, os.path.abspath(__file__), mime_type, str(max_chars or 0)]
+    try:
+        completed = subprocess.run(command, input=data, capture_output=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        print(f"[DEBUG] Extracción de texto excedió {timeout}s, se descarta")
+        return ""
+
+    if completed.returncode != 0:
+        error_lines = completed.stderr.decode("utf-8", "replace").strip().splitlines()
+        raise RuntimeError(error_lines[-1] if error_lines else f"código de salida {completed.returncode}")
+    return completed.stdout.decode("utf-8")
+
+
+def extract_text_from_document(uploaded_file, max_chars: Optional[int] = DOCUMENT_CHAR_BUDGET,
+                               timeout: Optional[float] = None, mime_type: Optional[str] = None) -> str:
+    """
+    Extrae texto de documentos PDF/Word/texto hasta `max_chars` caracteres
+
+    Args:
+        uploaded_file: Archivo subido (con atributo `type`) o archivo binario
+        max_chars: Presupuesto de caracteres (None para leer todo el documento)
+        timeout: Segundos máximos para un PDF; si se indica (o se define
+            DOCUMENT_EXTRACTION_TIMEOUT) la extracción corre en un subproceso
+        mime_type: Tipo MIME si el archivo no trae atributo `type`
+
+    Returns:
+        str: Texto extraído (vacío si falla o excede el tiempo límite)
+    """
+    mime_type = mime_type or getattr(uploaded_file, "type", None) or PDF_MIME
+    if timeout is None and os.environ.get("DOCUMENT_EXTRACTION_TIMEOUT"):
+        timeout = float(os.environ["DOCUMENT_EXTRACTION_TIMEOUT"])
+
+    try:
+        if timeout and mime_type == PDF_MIME:
+            data = uploaded_file.getvalue() if hasattr(uploaded_file, "getvalue") else uploaded_file.read()
+            return _collect_text_in_subprocess(data, mime_type, max_chars, timeout)
+        return _collect_text(uploaded_file, mime_type, max_chars)
+    except Exception as e:
+        print(f"Error extrayendo texto: {str(e)}")
+        return ""
+
+
+if __name__ == "__main__":
+    # Modo subproceso: documento por stdin, texto por stdout
+    budget = int(sys.argv[2]) or None
+    text = _collect_text(io.BytesIO(sys.stdin.buffer.read()), sys.argv[1], budget)
+    sys.stdout.buffer.write(text.encode("utf-8"))
@@ -0,0 +1,124 @@
+"""
+Caché persistente de extracciones de certificados.
+
+Guarda el resultado de `CertificateAnalyzer.analyze_image` indexado por el hash
+del contenido de la imagen (y la versión del prompt), para que volver a subir el
+mismo certificado no dispare otra llamada a Vision.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import tempfile
+import threading
+from typing import Optional, Dict, Any
+
+
+DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), "seguros_cache", "certificados.sqlite")
+
+
+class ExtractionCache:
+    """Caché SQLite con expiración (TTL) y desalojo LRU"""
+
+    def __init__(self, db_path: Optional[str] = None, ttl_seconds: int = 30 * 24 * 3600,
+                 max_entries: int = 5000):
+        self.db_path = db_path or os.environ.get("CERT_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+
+        if self.db_path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(self.db_path)), exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS extracciones (
+                   clave TEXT PRIMARY KEY,
+                   datos TEXT NOT NULL,
+                   creado REAL NOT NULL,
+                   ultimo_acceso REAL NOT NULL
+               )"""
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_ultimo_acceso ON extracciones (ultimo_acceso)"
+        )
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Devuelve los datos cacheados o None si no existen o expiraron"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT datos, creado FROM extracciones WHERE clave = ?", (key,)
+            ).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            datos, creado = row
+            if self.ttl_seconds and now - creado > self.ttl_seconds:
+                self._conn.execute("DELETE FROM extracciones WHERE clave = ?", (key,))
+                self._conn.commit()
+                self.misses += 1
+                return None
+
+            self._conn.execute(
+                "UPDATE extracciones SET ultimo_acceso = ? WHERE clave = ?", (now, key)
+            )
+            self._conn.commit()
+            self.hits += 1
+
+        return json.loads(datos)
+
+    def set(self, key: str, data: Dict[str, Any]) -> None:
+        """Guarda datos en la caché y desaloja las entradas menos usadas si se excede el límite"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO extracciones (clave, datos, creado, ultimo_acceso) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(data, ensure_ascii=False), now, now)
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Elimina entradas expiradas y las menos usadas recientemente"""
+        if self.ttl_seconds:
+            self._conn.execute(
+                "DELETE FROM extracciones WHERE creado < ?", (time.time() - self.ttl_seconds,)
+            )
+
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM extracciones").fetchone()
+        if count > self.max_entries:
+            self._conn.execute(
+                """DELETE FROM extracciones WHERE clave IN (
+                       SELECT clave FROM extracciones ORDER BY ultimo_acceso ASC LIMIT ?
+                   )""",
+                (count - self.max_entries,)
+            )
+
+    def clear(self) -> None:
+        """Vacía la caché y reinicia los contadores"""
+        with self._lock:
+            self._conn.execute("DELETE FROM extracciones")
+            self._conn.commit()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Obtiene contadores de aciertos/fallos"""
+        with self._lock:
+            (entries,) = self._conn.execute("SELECT COUNT(*) FROM extracciones").fetchone()
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": entries
+        }
@@ -0,0 +1,136 @@
+"""
+Manejo del historial de conversación con presupuesto de tokens.
+
+En lugar de enviar siempre los últimos N mensajes, se empaquetan los más
+recientes que quepan en el presupuesto; los que quedan fuera se resumen de forma
+incremental en `state["history_summary"]`, de modo que los datos tempranos no se
+pierden y un texto largo pegado no dispara el contexto.
+"""
+
+import os
+from functools import lru_cache
+from typing import Callable, List, Optional
+
+
+_encoding = None
+_encoding_loaded = False
+
+
+def _get_encoding():
+    """Codificador de tiktoken si está instalado (None si no)"""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    return _encoding
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Cuenta tokens con tiktoken o, sin él, con una estimación (~3.5 caracteres por token)"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return max(1, int(len(text) / 3.5 + 0.5))
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta el texto para que no exceda `max_tokens`"""
+    tokens = count_tokens(text)
+    if tokens <= max_tokens:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is not None:
+        return encoding.decode(encoding.encode(text)[:max_tokens]) + " [...]"
+    return text[:int(len(text) * max_tokens / tokens)] + " [...]"
+
+
+def _keep_tail(text: str, max_tokens: int) -> str:
+    """Descarta las líneas más antiguas hasta que el texto quepa en `max_tokens`"""
+    lines = text.split("\n")
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+
+def _extractive_summary(previous_summary: str, evicted: List[dict]) -> str:
+    """Resumen local: una línea corta por mensaje desalojado"""
+    lines = [previous_summary] if previous_summary else []
+    for message in evicted:
+        speaker = "Usuario" if message.get("role") == "user" else "Agente"
+        content = " ".join(str(message.get("content") or "").split())
+        if content:
+            lines.append(f"{speaker}: {content[:160]}")
+    return "\n".join(lines)
+
+
+class HistoryManager:
+    """Empaqueta el historial bajo un presupuesto de tokens con resumen acumulado"""
+
+    def __init__(self, budget_tokens: Optional[int] = None, max_message_tokens: int = 1200,
+                 summary_max_tokens: Optional[int] = None,
+                 summarizer: Optional[Callable[[str, List[dict]], str]] = None):
+        self.budget_tokens = budget_tokens or int(os.environ.get("HISTORY_TOKEN_BUDGET", "3000"))
+        self.max_message_tokens = min(max_message_tokens, self.budget_tokens)
+        # Parte del presupuesto reservada para el resumen (por defecto una cuarta parte)
+        self.summary_max_tokens = summary_max_tokens or self.budget_tokens // 4
+        # summarizer(resumen_previo, mensajes_desalojados) -> nuevo resumen
+        self.summarizer = summarizer
+
+    def pack(self, state: dict) -> List[dict]:
+        """
+        Devuelve los mensajes a enviar: resumen previo (si hay) + los más recientes
+
+        Actualiza `history_summary` e `history_summarized_count` en el estado; un
+        mensaje resumido nunca se vuelve a enviar completo.
+        """
+        messages = state.get("messages", [])
+        summarized_count = state.get("history_summarized_count", 0) or 0
+
+        # Si hay (o habrá) resumen, se le reserva su parte del presupuesto
+        budget = self.budget_tokens
+        overflow = sum(
+            count_tokens(str(message.get("content") or "")) for message in messages[summarized_count:]
+        ) > budget
+        if state.get("history_summary") or overflow:
+            budget -= self.summary_max_tokens
+        
+        # Del más reciente al más antiguo mientras quepa en el presupuesto
+        packed = []
+        start = len(messages)
+        for index in range(len(messages) - 1, summarized_count - 1, -1):
+            message = messages[index]
+            content = truncate_to_tokens(str(message.get("content") or ""), self.max_message_tokens)
+            cost = count_tokens(content) + 4  # Sobrecarga por mensaje
+            if packed and cost > budget:
+                break
+            packed.append({"role": message["role"], "content": content})
+            budget -= cost
+            start = index
+
+        # Resumir incrementalmente lo que quedó fuera
+        if start > summarized_count:
+            evicted = messages[summarized_count:start]
+            previous = state.get("history_summary") or ""
+            if self.summarizer:
+                summary = self.summarizer(previous, evicted)
+            else:
+                summary = _extractive_summary(previous, evicted)
+            state["history_summary"] = _keep_tail(summary, self.summary_max_tokens)
+            state["history_summarized_count"] = start
+            print(f"[DEBUG] Historial: {len(evicted)} mensaje(s) resumidos, {len(packed)} enviados")
+
+        packed.reverse()
+        if state.get("history_summary"):
+            packed.insert(0, {
+                "role": "system",
+                "content": f"RESUMEN DE LA CONVERSACIÓN PREVIA:\n{state['history_summary']}"
+            })
+        return packed
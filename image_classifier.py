@@ -0,0 +1,82 @@
+"""
+Preclasificador local (solo CPU) de imágenes subidas: certificado vs foto del local.
+
+Usa heurísticas baratas sobre una versión reducida en escala de grises: los
+certificados son papel claro, poco saturado, con texto oscuro (histograma
+bimodal y muchos bordes finos); las fotos del local tienen color y tonos medios.
+Si la confianza no supera el umbral, devuelve "unsure" para que decida el LLM.
+"""
+
+import os
+from typing import Dict, Tuple
+from PIL import Image, ImageFilter, ImageStat
+
+
+CERTIFICATE = "certificate"
+LOCAL_PHOTO = "local_photo"
+UNSURE = "unsure"
+
+
+def _clip(value: float) -> float:
+    return max(0.0, min(1.0, value))
+
+
+class LocalImageClassifier:
+    """Clasificador heurístico por densidad de texto, color e histograma"""
+
+    def __init__(self, threshold: float = None, size: int = 256):
+        self.threshold = threshold if threshold is not None else float(
+            os.environ.get("IMAGE_CLASSIFIER_THRESHOLD", "0.5")
+        )
+        self.size = size
+
+    def features(self, image: Image.Image) -> Dict[str, float]:
+        """Calcula las características sobre una miniatura de la imagen"""
+        small = image.copy()
+        small.draft("RGB", (self.size, self.size))  # Reduce en la decodificación para JPEG
+        small = small.convert("RGB")
+        small.thumbnail((self.size, self.size), Image.Resampling.BILINEAR)
+
+        gray = small.convert("L")
+        histogram = gray.histogram()
+        total = float(sum(histogram)) or 1.0
+
+        light_ratio = sum(histogram[160:]) / total
+        dark_ratio = sum(histogram[:90]) / total
+        mid_ratio = 1.0 - light_ratio - dark_ratio
+
+        saturation = ImageStat.Stat(small.convert("HSV").getchannel("S")).mean[0] / 255.0
+
+        edges = gray.filter(ImageFilter.FIND_EDGES).histogram()
+        edge_density = sum(edges[60:]) / total
+
+        return {
+            "light_ratio": light_ratio,
+            "mid_ratio": mid_ratio,
+            "saturation": saturation,
+            "edge_density": edge_density
+        }
+
+    def score(self, features: Dict[str, float]) -> float:
+        """Probabilidad aproximada (0-1) de que la imagen sea un certificado"""
+        paper = _clip((features["light_ratio"] - 0.25) / 0.5)
+        low_color = _clip((0.35 - features["saturation"]) / 0.3)
+        bimodal = _clip((0.6 - features["mid_ratio"]) / 0.45)
+        text = _clip((features["edge_density"] - 0.01) / 0.06)
+
+        return 0.35 * paper + 0.25 * low_color + 0.2 * bimodal + 0.2 * text
+
+    def classify(self, image: Image.Image) -> Tuple[str, float]:
+        """
+        Clasifica la imagen
+
+        Returns:
+            Tuple[str, float]: ("certificate" | "local_photo" | "unsure", confianza 0-1)
+        """
+        score = self.score(self.features(image))
+        confidence = abs(score - 0.5) * 2
+        label = CERTIFICATE if score >= 0.5 else LOCAL_PHOTO
+
+        if confidence < self.threshold:
+            return UNSURE, confidence
+        return label, confidence
@@ -0,0 +1,173 @@
+"""
+Almacén de imágenes direccionado por contenido.
+
+Los bytes de cada imagen se guardan una sola vez en disco, nombrados por su hash
+SHA-256, y el estado del grafo solo transporta el hash (ver `models.ImageRef`).
+Los blobs (y sus miniaturas) sin usar por más de `ttl_seconds` se eliminan, y si
+el directorio supera `max_bytes` se desalojan los usados hace más tiempo. Leer un
+blob renueva su fecha de último uso, y el TTL por defecto (7 días) es mayor que
+la retención de sesiones inactivas del checkpointer (24 h). Aun así, el tope de
+tamaño puede desalojar una imagen que una sesión guardada todavía referencia:
+en ese caso la lectura lanza `MissingImageError` y hay que volver a subirla.
+"""
+
+import io
+import os
+import time
+import hashlib
+import tempfile
+import threading
+from typing import Optional, Tuple
+from PIL import Image
+
+
+DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), "seguros_cache", "imagenes")
+
+MISSING_IMAGE_MESSAGE = "La imagen ya no está disponible en el servidor; por favor vuelve a subirla."
+
+
+class MissingImageError(FileNotFoundError):
+    """El blob referenciado ya no está en disco (desalojado o almacén borrado)"""
+
+
+class ImageBlobStore:
+    """Guarda bytes de imágenes en disco indexados por hash de contenido, con TTL y tope de tamaño"""
+
+    def __init__(self, root: Optional[str] = None, ttl_seconds: Optional[int] = None,
+                 max_bytes: Optional[int] = None, sweep_interval: float = 60.0):
+        self.root = root or os.environ.get("IMAGE_STORE_PATH", DEFAULT_STORE_PATH)
+        self.ttl_seconds = (ttl_seconds if ttl_seconds is not None
+                            else int(os.environ.get("IMAGE_STORE_TTL_SECONDS", 7 * 24 * 3600)))
+        self.max_bytes = (max_bytes if max_bytes is not None
+                          else int(os.environ.get("IMAGE_STORE_MAX_MB", "1024")) * 1024 * 1024)
+        self.sweep_interval = sweep_interval
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self._evict()
+
+    def put(self, data: bytes) -> str:
+        """Guarda los bytes (si no existen ya) y devuelve su hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+
+        if not os.path.exists(path):
+            with self._lock:
+                if not os.path.exists(path):
+                    # Escritura atómica: archivo temporal + rename
+                    fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+                    with os.fdopen(fd, "wb") as tmp_file:
+                        tmp_file.write(data)
+                    os.replace(tmp_path, path)
+                    if time.monotonic() - self._last_sweep >= self.sweep_interval:
+                        self._evict()
+        else:
+            self._touch(path)
+
+        return digest
+
+    def path(self, digest: str) -> str:
+        """Ruta en disco del blob"""
+        return os.path.join(self.root, f"{digest}.bin")
+
+    def exists(self, digest: str) -> bool:
+        return os.path.exists(self.path(digest))
+
+    def get(self, digest: str) -> bytes:
+        """Lee los bytes del blob"""
+        path = self.path(digest)
+        try:
+            with open(path, "rb") as blob_file:
+                data = blob_file.read()
+        except FileNotFoundError:
+            raise MissingImageError(MISSING_IMAGE_MESSAGE) from None
+        self._touch(path)
+        return data
+
+    def open_image(self, digest: str) -> Image.Image:
+        """
+        Abre la imagen sin decodificarla todavía
+
+        Los bytes comprimidos se leen a memoria (no queda ningún archivo
+        abierto); PIL solo lee la cabecera hasta que se accede a los píxeles.
+        """
+        return Image.open(io.BytesIO(self.get(digest)))
+
+    def thumbnail(self, digest: str, size: Tuple[int, int] = (256, 256)) -> Image.Image:
+        """Devuelve una miniatura, generándola y guardándola en disco la primera vez"""
+        thumb_path = os.path.join(self.root, f"{digest}_thumb_{size[0]}x{size[1]}.jpg")
+
+        try:
+            with open(thumb_path, "rb") as thumb_file:
+                data = thumb_file.read()
+            self._touch(thumb_path)
+            return Image.open(io.BytesIO(data))
+        except FileNotFoundError:
+            pass
+
+        # MissingImageError si el blob original también se desalojó
+        image = self.open_image(digest)
+        image.draft("RGB", size)  # Reduce en la decodificación para JPEG
+        image = image.convert("RGB")
+        image.thumbnail(size, Image.Resampling.LANCZOS)
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "wb") as tmp_file:
+            image.save(tmp_file, format="JPEG", quality=80)
+        os.replace(tmp_path, thumb_path)
+        return image
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        # La fecha de modificación hace de "último acceso" para el desalojo
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def _evict(self) -> None:
+        """Elimina blobs expirados y, si se excede `max_bytes`, los usados hace más tiempo"""
+        self._last_sweep = time.monotonic()
+        now = time.time()
+        entries = []
+        try:
+            with os.scandir(self.root) as scan:
+                for entry in scan:
+                    try:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    except OSError:
+                        continue
+        except OSError:
+            return
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            expired = self.ttl_seconds and now - mtime > self.ttl_seconds
+            if not expired and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+
+        if removed:
+            print(f"[DEBUG] Almacén de imágenes: {removed} archivo(s) desalojado(s), {total / 1024 / 1024:.1f} MB en uso")
+
+
+_default_store: Optional[ImageBlobStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_image_store() -> ImageBlobStore:
+    """Obtiene el almacén compartido por el proceso"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = ImageBlobStore()
+    return _default_store
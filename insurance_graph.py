@@ -1,38 +1,103 @@
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from langgraph.graph import StateGraph, END
-from langgraph.checkpoint.memory import MemorySaver
+from langgraph.checkpoint.base import BaseCheckpointSaver
 import uuid
+import threading
 from datetime import datetime
 from PIL import Image
 
-from models import GraphState, ConversationStep, BusinessInfo, SerializableImage
+from models import GraphState, ConversationStep, BusinessInfo, ImageRef, new_context_memory
 from conversation_nodes import ConversationNodes
 from certificate_analyzer import CertificateAnalyzer
 from valuation_engine import ValuationEngine
 from policy_generator import PolicyGenerator
+from checkpointer import SQLiteCheckpointer
+
+
+# Registro del proceso: los nodos y el grafo compilado se construyen una sola vez
+# y se comparten entre sesiones; cada sesión se aísla por su thread_id en el checkpointer
+_registry_lock = threading.Lock()
+_nodes_registry: Dict[str, ConversationNodes] = {}
+_graph_registry: Dict[Tuple[str, int], Tuple[BaseCheckpointSaver, Any]] = {}
+_default_checkpointer: Optional[SQLiteCheckpointer] = None
+
+
+def get_conversation_nodes(api_key: str) -> ConversationNodes:
+    """ConversationNodes compartido por API key (cliente, analizador, motor de valuación y generador)"""
+    with _registry_lock:
+        nodes = _nodes_registry.get(api_key)
+        if nodes is None:
+            nodes = ConversationNodes(api_key)
+            _nodes_registry[api_key] = nodes
+        return nodes
+
+
+def get_default_checkpointer() -> SQLiteCheckpointer:
+    """Checkpointer SQLite del proceso, con un único hilo de desalojo"""
+    global _default_checkpointer
+    with _registry_lock:
+        if _default_checkpointer is None:
+            _default_checkpointer = SQLiteCheckpointer()
+            _default_checkpointer.start_eviction()
+        return _default_checkpointer
+
+
+def get_compiled_graph(api_key: str, checkpointer: Optional[BaseCheckpointSaver] = None):
+    """
+    Grafo compilado compartido para la API key y el checkpointer dados
+
+    Args:
+        api_key: API key de OpenAI
+        checkpointer: Checkpointer a usar (por defecto el SQLite del proceso)
+
+    Returns:
+        Grafo compilado; seguro de invocar en paralelo con thread_id distintos
+    """
+    nodes = get_conversation_nodes(api_key)
+    checkpointer = checkpointer or get_default_checkpointer()
+    key = (api_key, id(checkpointer))
+    with _registry_lock:
+        entry = _graph_registry.get(key)
+        if entry is None:
+            # Se guarda el checkpointer junto al grafo para que su id no se reutilice
+            entry = (checkpointer, InsuranceAgentGraph._build_graph(nodes, checkpointer))
+            _graph_registry[key] = entry
+        return entry[1]
+
+
+def clear_graph_registry() -> None:
+    """Descarta los nodos y grafos compartidos (p. ej. tras rotar la API key)"""
+    with _registry_lock:
+        _nodes_registry.clear()
+        _graph_registry.clear()
+
+
 class InsuranceAgentGraph:
     """Grafo principal del agente de seguros usando LangGraph"""
     
-    def __init__(self, api_key: str):
+    def __init__(self, api_key: str, checkpointer: Optional[BaseCheckpointSaver] = None):
         self.api_key = api_key
-        self.nodes = ConversationNodes(api_key)
-        self.memory = MemorySaver()
-        self.graph = self._build_graph()
+        # Nodos y grafo compilado vienen del registro del proceso: crear una instancia es casi gratis
+        self.nodes = get_conversation_nodes(api_key)
+        # Checkpointer persistente por defecto; se puede inyectar cualquier BaseCheckpointSaver
+        self.memory = checkpointer or get_default_checkpointer()
+        self.graph = get_compiled_graph(api_key, self.memory)
     
-    def _build_graph(self) -> StateGraph:
-        """Construye el grafo de estados de la conversación"""
+    @classmethod
+    def _build_graph(cls, nodes: ConversationNodes, checkpointer: BaseCheckpointSaver) -> StateGraph:
+        """Construye y compila el grafo de estados de la conversación"""
         
         # Crear el grafo
         workflow = StateGraph(GraphState)
         
         # Agregar nodos
-        workflow.add_node("welcome", self.nodes.welcome_node)
-        workflow.add_node("analyze_input", self.nodes.analyze_input_node)
-        workflow.add_node("certificate_analysis", self.nodes.certificate_analysis_node)
-        workflow.add_node("valuation", self.nodes.valuation_node)
-        workflow.add_node("policy_generation", self.nodes.policy_generation_node)
-        workflow.add_node("audio_generation", self.nodes.audio_generation_node)
-        workflow.add_node("sales_assistance", self.nodes.sales_assistance_node)
+        workflow.add_node("welcome", nodes.welcome_node)
+        workflow.add_node("analyze_input", nodes.analyze_input_node)
+        workflow.add_node("certificate_analysis", nodes.certificate_analysis_node)
+        workflow.add_node("valuation", nodes.valuation_node)
+        workflow.add_node("policy_generation", nodes.policy_generation_node)
+        workflow.add_node("audio_generation", nodes.audio_generation_node)
+        workflow.add_node("sales_assistance", nodes.sales_assistance_node)
         
         # Definir punto de entrada
         workflow.set_entry_point("welcome")
@@ -40,7 +105,7 @@ class InsuranceAgentGraph:
         # Definir transiciones condicionales
         workflow.add_conditional_edges(
             "welcome",
-            self._route_from_welcome,
+            cls._route_from_welcome,
             {
                 "analyze_input": "analyze_input",
                 "wait": END
@@ -49,7 +114,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "analyze_input",
-            self._route_from_analyze_input,
+            cls._route_from_analyze_input,
             {
                 "certificate_analysis": "certificate_analysis",
                 "valuation": "valuation",
@@ -60,7 +125,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "certificate_analysis",
-            self._route_from_certificate_analysis,
+            cls._route_from_certificate_analysis,
             {
                 "analyze_input": "analyze_input",
                 "valuation": "valuation",
@@ -70,7 +135,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "valuation",
-            self._route_from_valuation,
+            cls._route_from_valuation,
             {
                 "policy_generation": "policy_generation",
                 "sales_assistance": "sales_assistance",
@@ -80,7 +145,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "policy_generation",
-            self._route_from_policy_generation,
+            cls._route_from_policy_generation,
             {
                 "audio_generation": "audio_generation",
                 "sales_assistance": "sales_assistance",
@@ -90,7 +155,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "audio_generation",
-            self._route_from_audio_generation,
+            cls._route_from_audio_generation,
             {
                 "sales_assistance": "sales_assistance",
                 "complete": END
@@ -99,7 +164,7 @@ class InsuranceAgentGraph:
         
         workflow.add_conditional_edges(
             "sales_assistance",
-            self._route_from_sales_assistance,
+            cls._route_from_sales_assistance,
             {
                 "policy_generation": "policy_generation",
                 "audio_generation": "audio_generation",
@@ -109,15 +174,17 @@ class InsuranceAgentGraph:
             }
         )
         
-        return workflow.compile(checkpointer=self.memory)
+        return workflow.compile(checkpointer=checkpointer)
     
-    def _route_from_welcome(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_welcome(state: GraphState) -> str:
         """Enrutamiento desde el nodo de bienvenida"""
         if state.get("user_input"):
             return "analyze_input"
         return "wait"
     
-    def _route_from_analyze_input(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_analyze_input(state: GraphState) -> str:
         """Enrutamiento desde análisis de entrada - CORREGIDO PARA EVITAR CONFLICTOS"""
         next_action = state.get("next_action", "wait")
         
@@ -151,7 +218,8 @@ class InsuranceAgentGraph:
         else:
             print(f"[DEBUG] No en GATHERING_INFO, manteniendo estado -> wait")
             return "wait"
-    def _route_from_certificate_analysis(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_certificate_analysis(state: GraphState) -> str:
         """Enrutamiento desde análisis de certificado"""
         if state.get("next_action") == "calculate_valuation":
             return "valuation"
@@ -160,7 +228,8 @@ class InsuranceAgentGraph:
         else:
             return "wait"
     
-    def _route_from_valuation(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_valuation(state: GraphState) -> str:
         """Enrutamiento desde valuación - CORREGIDO PARA EVITAR MÚLTIPLES EJECUCIONES"""
         user_input_raw = state.get("user_input", "")
         
@@ -214,7 +283,8 @@ class InsuranceAgentGraph:
             print(f"[DEBUG] No necesita confirmación -> sales_assistance")
             return "sales_assistance"
     
-    def _route_from_policy_generation(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_policy_generation(state: GraphState) -> str:
         """Enrutamiento desde generación de póliza - SIMPLIFICADO"""
         
         # Si se generó la póliza exitosamente
@@ -225,14 +295,16 @@ class InsuranceAgentGraph:
             # Si no se pudo generar, terminar
             print(f"[DEBUG] Error generando póliza -> complete")
             return "complete"
-    def _route_from_audio_generation(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_audio_generation(state: GraphState) -> str:
         """Enrutamiento desde generación de audio - SIMPLIFICADO"""
         
         # Siempre ir a sales_assistance después de generar audio
         print(f"[DEBUG] Audio procesado -> sales_assistance")
         return "sales_assistance"
     
-    def _route_from_sales_assistance(self, state: GraphState) -> str:
+    @staticmethod
+    def _route_from_sales_assistance(state: GraphState) -> str:
         """Enrutamiento desde asistencia de ventas - SIMPLIFICADO PARA EVITAR BUCLES"""
         
         user_input = state.get("user_input", "")
@@ -274,6 +346,8 @@ class InsuranceAgentGraph:
             messages=[],
             current_step=ConversationStep.WELCOME,
             user_input="",
+            history_summary=None,
+            history_summarized_count=0,
             business_info=BusinessInfo(),
             valuation=None,
             certificate_text=None,
@@ -288,7 +362,9 @@ class InsuranceAgentGraph:
             needs_certificate=True,
             needs_photos=False,
             needs_confirmation=False,
-            ready_for_policy=False
+            ready_for_policy=False,
+            awaiting_policy_confirmation=False,
+            context_memory=new_context_memory()
         )
     
     def process_user_input(self, state: GraphState, user_input) -> GraphState:
@@ -383,8 +459,8 @@ class InsuranceAgentGraph:
             GraphState: Estado actualizado
         """
         try:
-            # Crear SerializableImage para guardar en el estado
-            serializable_image = SerializableImage.from_pil_image(image, "certificado_funcionamiento.jpg")
+            # Crear ImageRef para guardar en el estado (solo el hash viaja en el estado)
+            serializable_image = ImageRef.from_pil_image(image, "certificado_funcionamiento.jpg")
             state["certificate_images"] = [serializable_image]
             state["next_action"] = "certificate_analysis"
             
@@ -412,10 +488,10 @@ class InsuranceAgentGraph:
             GraphState: Estado actualizado
         """
         try:
-            # Convertir PIL Images a SerializableImages
+            # Guardar PIL Images en el almacén y conservar sus referencias
             serializable_photos = []
             for i, photo in enumerate(photos):
-                serializable_photo = SerializableImage.from_pil_image(photo, f"local_foto_{i+1}.jpg")
+                serializable_photo = ImageRef.from_pil_image(photo, f"local_foto_{i+1}.jpg")
                 serializable_photos.append(serializable_photo)
             
             state["local_photos"] = serializable_photos
@@ -471,32 +547,76 @@ class InsuranceAgentGraph:
         }
     
 
-import openai
 import json
 from typing import Dict, Any, Optional, List
 from datetime import datetime
-from models import GraphState, BusinessInfo, Valuation, InsurancePolicy
+from models import GraphState, BusinessInfo, Valuation, InsurancePolicy, new_context_memory
 from certificate_analyzer import CertificateAnalyzer
 from valuation_engine import ValuationEngine
 from policy_generator import PolicyGenerator
+from usage_metrics import UsageTracker
+from history_manager import HistoryManager
+from openai_clients import get_openai_client
+
+# Prefijo estático del prompt del sistema (ver _build_enhanced_system_message)
+STATIC_SYSTEM_PROMPT = """Eres un agente de seguros comerciales experto y conversacional de Seguros Pacífico con memoria de contexto.
+
+El estado actual del cliente (datos del negocio, avance del trámite y memoria de contexto) se entrega al final de la conversación en un mensaje "ESTADO ACTUAL".
+
+PERSONALIDAD Y ESTILO:
+- Adapta tu estilo de comunicación basado en la memoria de interacciones previas
+- Recuerda las preferencias y preocupaciones del usuario
+- Mantén coherencia con el contexto del negocio mencionado anteriormente
+- Sé proactivo basándote en patrones de la conversación
+
+OBJETIVO: Ayudar al cliente a obtener un seguro comercial personalizado siguiendo este flujo natural:
+1. Recopilar información del negocio (certificado, metraje, tipo, fotos)
+2. Calcular valuación cuando tengas suficiente información
+3. Generar póliza cuando el cliente esté satisfecho con la cotización
+4. Ofrecer resumen en audio si lo desea
+
+HERRAMIENTAS DISPONIBLES:
+- analyze_certificate: Para analizar certificados de funcionamiento
+- calculate_valuation: Para calcular el valor del negocio
+- generate_policy: Para crear la póliza oficial
+- generate_audio_summary: Para crear resumen en audio
+- update_context_memory: Para actualizar la memoria con información importante
+
+INSTRUCCIONES INTELIGENTES:
+1. USA LA MEMORIA: Recuerda preferencias, estilo conversacional y contexto previo
+2. SÉ CONVERSACIONAL: No pidas confirmaciones innecesarias, entiende el contexto
+3. ADAPTA TU COMUNICACIÓN: Formal/casual según el usuario
+4. USA HERRAMIENTAS INTELIGENTEMENTE: Cuando sea lógico, no cuando se lo pidan explícitamente
+5. MANTÉN COHERENCIA: Con el contexto del negocio y conversaciones previas
+6. SÉ PROACTIVO: Anticipa necesidades basándote en la memoria de contexto
+
+REGLAS DE DECISIÓN PARA HERRAMIENTAS:
+- Analizar certificado: Cuando haya imagen de certificado disponible y no se haya analizado
+- Calcular valuación: Cuando tengas tipo de negocio + metraje + (al menos 1 foto OR certificado completo)
+- Generar póliza: Cuando el usuario muestre satisfacción/acuerdo con la cotización
+- Generar audio: Cuando tengas póliza y el usuario muestre interés en resumen
+- Actualizar memoria: Cuando detectes preferencias, estilo, o contexto importante
+
+INFORMACIÓN CRÍTICA NECESARIA:
+- Tipo de negocio
+- Metraje en m²
+- Dirección (del certificado o manual)
+- Fotos del local (para valuación precisa)
+
+Responde de manera natural, inteligente y contextual, usando la memoria para personalizar la experiencia."""
 
 class LLMControlledInsuranceAgent:
     """Agente de seguros controlado completamente por LLM con memoria de contexto"""
     
     def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
+        self.client = get_openai_client(api_key)
         self.certificate_analyzer = CertificateAnalyzer(api_key)
         self.valuation_engine = ValuationEngine()
         self.policy_generator = PolicyGenerator()
+        self.usage_tracker = UsageTracker()
+        self.history_manager = HistoryManager()
         
-        # Memoria de contexto para mantener coherencia
-        self.context_memory = {
-            "user_preferences": {},
-            "conversation_style": "formal",
-            "mentioned_concerns": [],
-            "business_context": {},
-            "interaction_history": []
-        }
+        # La memoria de contexto de cada sesión vive en state["context_memory"]
         
         # Herramientas disponibles para el LLM
         self.tools = [
@@ -621,23 +741,20 @@ class LLMControlledInsuranceAgent:
             "content": user_input
         })
         
-        # Construir mensaje del sistema con contexto completo y memoria
-        system_message = self._build_enhanced_system_message(context)
+        # Prefijo estático (cacheable por el proveedor) + conversación + sufijo dinámico
+        messages = [{"role": "system", "content": self._build_enhanced_system_message()}]
         
-        # Preparar mensajes para el LLM con memoria de contexto
-        messages = [{"role": "system", "content": system_message}]
+        # Agregar mensajes recientes que caben en el presupuesto (los anteriores van resumidos)
+        messages.extend(self.history_manager.pack(state))
         
-        # Agregar resumen de interacciones previas importantes
-        if self.context_memory["interaction_history"]:
-            context_summary = self._build_context_summary()
-            messages.append({
-                "role": "system", 
-                "content": f"MEMORIA DE CONTEXTO: {context_summary}"
-            })
+        # Estado actual y resumen de interacciones previas al final, para no
+        # invalidar el prefijo en cada turno
+        dynamic_context = self._build_dynamic_context_message(context)
+        if self._context_memory(state)["interaction_history"]:
+            dynamic_context += f"\n- MEMORIA DE CONTEXTO: {self._build_context_summary(state)}"
+        messages.append({"role": "system", "content": dynamic_context})
         
-        # Agregar mensajes recientes de la conversación
-        recent_messages = state["messages"][-8:]  # Últimos 8 mensajes para no saturar
-        messages.extend(recent_messages)
+        self.usage_tracker.new_turn()
         
         try:
             # Llamar al LLM con tools
@@ -649,6 +766,7 @@ class LLMControlledInsuranceAgent:
                 temperature=0.2,  # Más determinista para coherencia
                 max_tokens=1500
             )
+            self.usage_tracker.record(response, "gpt-4-turbo-preview", "herramientas")
             
             # Procesar respuesta del LLM
             assistant_message = response.choices[0].message
@@ -680,6 +798,7 @@ class LLMControlledInsuranceAgent:
                     temperature=0.2,
                     max_tokens=1000
                 )
+                self.usage_tracker.record(final_response, "gpt-4-turbo-preview", "respuesta")
                 
                 final_content = final_response.choices[0].message.content
             else:
@@ -716,11 +835,12 @@ class LLMControlledInsuranceAgent:
             }
         }
         
-        self.context_memory["interaction_history"].append(interaction)
+        memory = self._context_memory(state)
+        memory["interaction_history"].append(interaction)
         
         # Mantener solo las últimas 20 interacciones para no saturar
-        if len(self.context_memory["interaction_history"]) > 20:
-            self.context_memory["interaction_history"] = self.context_memory["interaction_history"][-20:]
+        if len(memory["interaction_history"]) > 20:
+            memory["interaction_history"] = memory["interaction_history"][-20:]
     
     def _build_enhanced_context(self, state: GraphState) -> Dict[str, Any]:
         """Construye el contexto mejorado incluyendo memoria"""
@@ -736,88 +856,63 @@ class LLMControlledInsuranceAgent:
         }
         
         # Agregar información de la memoria
-        base_context["memory"] = self.context_memory.copy()
+        base_context["memory"] = self._context_memory(state).copy()
         
         return base_context
     
-    def _build_enhanced_system_message(self, context: Dict[str, Any]) -> str:
-        """Construye mensaje del sistema mejorado con memoria de contexto"""
+    def _build_enhanced_system_message(self) -> str:
+        """
+        Prefijo estático del prompt (idéntico byte a byte en cada turno)
         
-        business_info_str = json.dumps(context['business_info'], indent=2)
-        memory_str = json.dumps(context['memory'], indent=2)
+        No debe interpolar nada que cambie entre turnos: así el proveedor puede
+        reutilizar el prefijo cacheado (herramientas + este mensaje).
+        """
+        return STATIC_SYSTEM_PROMPT
+    
+    def _build_dynamic_context_message(self, context: Dict[str, Any]) -> str:
+        """Sufijo dinámico y compacto: datos del negocio, avance y memoria (sin marcas de tiempo)"""
+        business_info = {k: v for k, v in context['business_info'].items() if v is not None}
+        memory = context['memory']
+        compact_memory = {
+            "preferencias": memory.get("user_preferences") or {},
+            "estilo": memory.get("conversation_style"),
+            "contexto_negocio": memory.get("business_context") or {},
+            "preocupaciones": [c["concern"] for c in memory.get("mentioned_concerns", [])[-3:]]
+        }
         
-        return f"""Eres un agente de seguros comerciales experto y conversacional de Seguros Pacífico con memoria de contexto.
-
-CONTEXTO ACTUAL:
-- Información del negocio: {business_info_str}
-- ¿Tiene certificado?: {context['has_certificate']}
-- Fotos del local: {context['photos_count']}
-- ¿Tiene valuación?: {context['has_valuation']}
-- ¿Tiene póliza?: {context['has_policy']}
-- ¿Tiene audio?: {context['has_audio']}
-
-MEMORIA DE CONTEXTO:
-{memory_str}
-
-PERSONALIDAD Y ESTILO:
-- Adapta tu estilo de comunicación basado en la memoria de interacciones previas
-- Recuerda las preferencias y preocupaciones del usuario
-- Mantén coherencia con el contexto del negocio mencionado anteriormente
-- Sé proactivo basándote en patrones de la conversación
-
-OBJETIVO: Ayudar al cliente a obtener un seguro comercial personalizado siguiendo este flujo natural:
-1. Recopilar información del negocio (certificado, metraje, tipo, fotos)
-2. Calcular valuación cuando tengas suficiente información
-3. Generar póliza cuando el cliente esté satisfecho con la cotización
-4. Ofrecer resumen en audio si lo desea
-
-HERRAMIENTAS DISPONIBLES:
-- analyze_certificate: Para analizar certificados de funcionamiento
-- calculate_valuation: Para calcular el valor del negocio
-- generate_policy: Para crear la póliza oficial
-- generate_audio_summary: Para crear resumen en audio
-- update_context_memory: Para actualizar la memoria con información importante
-
-INSTRUCCIONES INTELIGENTES:
-1. USA LA MEMORIA: Recuerda preferencias, estilo conversacional y contexto previo
-2. SÉ CONVERSACIONAL: No pidas confirmaciones innecesarias, entiende el contexto
-3. ADAPTA TU COMUNICACIÓN: Formal/casual según el usuario
-4. USA HERRAMIENTAS INTELIGENTEMENTE: Cuando sea lógico, no cuando se lo pidan explícitamente
-5. MANTÉN COHERENCIA: Con el contexto del negocio y conversaciones previas
-6. SÉ PROACTIVO: Anticipa necesidades basándote en la memoria de contexto
-
-REGLAS DE DECISIÓN PARA HERRAMIENTAS:
-- Analizar certificado: Cuando haya imagen de certificado disponible y no se haya analizado
-- Calcular valuación: Cuando tengas tipo de negocio + metraje + (al menos 1 foto OR certificado completo)
-- Generar póliza: Cuando el usuario muestre satisfacción/acuerdo con la cotización
-- Generar audio: Cuando tengas póliza y el usuario muestre interés en resumen
-- Actualizar memoria: Cuando detectes preferencias, estilo, o contexto importante
-
-INFORMACIÓN CRÍTICA NECESARIA:
-- Tipo de negocio
-- Metraje en m²
-- Dirección (del certificado o manual)
-- Fotos del local (para valuación precisa)
-
-Responde de manera natural, inteligente y contextual, usando la memoria para personalizar la experiencia."""
+        return (
+            "ESTADO ACTUAL:\n"
+            f"- Negocio: {json.dumps(business_info, ensure_ascii=False, sort_keys=True)}\n"
+            f"- Certificado: {context['has_certificate']} | Fotos: {context['photos_count']} | "
+            f"Valuación: {context['has_valuation']} | Póliza: {context['has_policy']} | "
+            f"Audio: {context['has_audio']}\n"
+            f"- Memoria: {json.dumps(compact_memory, ensure_ascii=False, sort_keys=True)}"
+        )
 
-    def _build_context_summary(self) -> str:
+    def _context_memory(self, state: GraphState) -> Dict[str, Any]:
+        """Memoria de contexto de la sesión (se crea en el estado si falta)"""
+        if not state.get("context_memory"):
+            state["context_memory"] = new_context_memory()
+        return state["context_memory"]
+    
+    def _build_context_summary(self, state: GraphState) -> str:
         """Construye un resumen del contexto para la memoria"""
-        recent_interactions = self.context_memory["interaction_history"][-5:]  # Últimas 5
+        memory = self._context_memory(state)
+        recent_interactions = memory["interaction_history"][-5:]  # Últimas 5
         
         summary_parts = []
         
-        if self.context_memory["user_preferences"]:
-            summary_parts.append(f"Preferencias del usuario: {self.context_memory['user_preferences']}")
+        if memory["user_preferences"]:
+            summary_parts.append(f"Preferencias del usuario: {memory['user_preferences']}")
         
-        if self.context_memory["conversation_style"]:
-            summary_parts.append(f"Estilo conversacional: {self.context_memory['conversation_style']}")
+        if memory["conversation_style"]:
+            summary_parts.append(f"Estilo conversacional: {memory['conversation_style']}")
         
-        if self.context_memory["mentioned_concerns"]:
-            summary_parts.append(f"Preocupaciones mencionadas: {self.context_memory['mentioned_concerns']}")
+        if memory["mentioned_concerns"]:
+            summary_parts.append(f"Preocupaciones mencionadas: {memory['mentioned_concerns']}")
         
-        if self.context_memory["business_context"]:
-            summary_parts.append(f"Contexto del negocio: {self.context_memory['business_context']}")
+        if memory["business_context"]:
+            summary_parts.append(f"Contexto del negocio: {memory['business_context']}")
         
         if recent_interactions:
             summary_parts.append(f"Últimas {len(recent_interactions)} interacciones registradas")
@@ -826,25 +921,26 @@ Responde de manera natural, inteligente y contextual, usando la memoria para per
     
     def _update_memory_from_interaction(self, user_input: str, assistant_response: str, state: GraphState):
         """Actualiza la memoria basándose en la interacción"""
+        memory = self._context_memory(state)
         
         # Detectar estilo conversacional
         if any(word in user_input.lower() for word in ["por favor", "gracias", "disculpe"]):
-            self.context_memory["conversation_style"] = "formal"
+            memory["conversation_style"] = "formal"
         elif any(word in user_input.lower() for word in ["hey", "hola", "qué tal"]):
-            self.context_memory["conversation_style"] = "casual"
+            memory["conversation_style"] = "casual"
         
         # Detectar preocupaciones específicas
         concern_indicators = ["preocupa", "duda", "no estoy seguro", "problema", "riesgo"]
         for indicator in concern_indicators:
             if indicator in user_input.lower():
-                self.context_memory["mentioned_concerns"].append({
+                memory["mentioned_concerns"].append({
                     "concern": user_input,
                     "timestamp": datetime.now().isoformat()
                 })
         
         # Mantener solo las últimas 10 preocupaciones
-        if len(self.context_memory["mentioned_concerns"]) > 10:
-            self.context_memory["mentioned_concerns"] = self.context_memory["mentioned_concerns"][-10:]
+        if len(memory["mentioned_concerns"]) > 10:
+            memory["mentioned_concerns"] = memory["mentioned_concerns"][-10:]
     
     def _execute_tool_calls(self, state: GraphState, tool_calls) -> GraphState:
         """Ejecuta las herramientas llamadas por el LLM"""
@@ -890,7 +986,8 @@ Responde de manera natural, inteligente y contextual, usando la memoria para per
                             audio_file, summary_text = self.policy_generator.generate_audio_summary(
                                 state["business_info"],
                                 state["valuation"],
-                                state["policy"]
+                                state["policy"],
+                                background=True
                             )
                             if audio_file:
                                 state["audio_file"] = audio_file
@@ -898,17 +995,18 @@ Responde de manera natural, inteligente y contextual, usando la memoria para per
                 
                 elif function_name == "update_context_memory":
                     # Actualizar memoria de contexto
+                    memory = self._context_memory(state)
                     if arguments.get("user_preferences"):
-                        self.context_memory["user_preferences"].update(arguments["user_preferences"])
+                        memory["user_preferences"].update(arguments["user_preferences"])
                     
                     if arguments.get("conversation_style"):
-                        self.context_memory["conversation_style"] = arguments["conversation_style"]
+                        memory["conversation_style"] = arguments["conversation_style"]
                     
                     if arguments.get("business_context"):
-                        self.context_memory["business_context"].update(arguments["business_context"])
+                        memory["business_context"].update(arguments["business_context"])
                     
                     if arguments.get("concerns"):
-                        self.context_memory["mentioned_concerns"].extend(arguments["concerns"])
+                        memory["mentioned_concerns"].extend(arguments["concerns"])
                             
             except Exception as e:
                 print(f"Error ejecutando herramienta {function_name}: {str(e)}")
@@ -951,20 +1049,20 @@ Responde de manera natural, inteligente y contextual, usando la memoria para per
     
     def process_certificate_image(self, state: GraphState, image) -> GraphState:
         """Procesa imagen de certificado"""
-        from models import SerializableImage
+        from models import ImageRef
         
-        serializable_image = SerializableImage.from_pil_image(image, "certificado.jpg")
+        serializable_image = ImageRef.from_pil_image(image, "certificado.jpg")
         state["certificate_images"] = [serializable_image]
         
         return state
     
     def process_local_photos(self, state: GraphState, photos: List) -> GraphState:
         """Procesa fotos del local"""
-        from models import SerializableImage
+        from models import ImageRef
         
         serializable_photos = []
         for i, photo in enumerate(photos):
-            serializable_photo = SerializableImage.from_pil_image(photo, f"local_foto_{i+1}.jpg")
+            serializable_photo = ImageRef.from_pil_image(photo, f"local_foto_{i+1}.jpg")
             serializable_photos.append(serializable_photo)
         
         current_photos = state.get("local_photos", [])
@@ -973,12 +1071,13 @@ Responde de manera natural, inteligente y contextual, usando la memoria para per
         
         return state
     
-    def get_memory_summary(self) -> Dict[str, Any]:
+    def get_memory_summary(self, state: GraphState) -> Dict[str, Any]:
         """Obtiene un resumen de la memoria de contexto para debugging"""
+        memory = self._context_memory(state)
         return {
-            "user_preferences": self.context_memory["user_preferences"],
-            "conversation_style": self.context_memory["conversation_style"],
-            "mentioned_concerns_count": len(self.context_memory["mentioned_concerns"]),
-            "business_context": self.context_memory["business_context"],
-            "interaction_history_count": len(self.context_memory["interaction_history"])
+            "user_preferences": memory["user_preferences"],
+            "conversation_style": memory["conversation_style"],
+            "mentioned_concerns_count": len(memory["mentioned_concerns"]),
+            "business_context": memory["business_context"],
+            "interaction_history_count": len(memory["interaction_history"])
         }
\ No newline at end of file
@@ -0,0 +1,100 @@
+"""
+Enrutador determinístico de intenciones frente al LLM.
+
+Resuelve localmente los turnos cuya respuesta ya conoce el código (confirmar o
+posponer la póliza, actualizar el metraje, pedir el audio) y lleva la cuenta de
+qué fracción de turnos evitó llamar al modelo.
+"""
+
+import re
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+from conversation_nodes import ConversationNodes
+from keyword_matcher import normalize_text
+
+
+CONFIRM_POLICY = "confirm_policy"
+CANCEL_POLICY = "cancel_policy"
+UPDATE_METRAJE = "update_metraje"
+AUDIO_REQUEST = "audio_request"
+
+# Respuestas completas a "¿genero tu póliza?": el texto entero debe ser una de
+# ellas (con "póliza" opcional al final); cualquier otra cosa va al LLM
+_CONFIRM_ANSWER = re.compile(
+    r"^(?:si|yes|ok|okay|dale|claro|de acuerdo|confirmo|procede|adelante|genera|generala|generar"
+    r"|si por favor|si dale|si claro|si confirmo|si generar|si genera|si procede|confirmo generar"
+    r"|si confirmo generar)(?: (?:la |mi )?poliza)?$"
+)
+_CANCEL_ANSWER = re.compile(
+    r"^(?:no|no gracias|no por ahora|ahora no|todavia no|despues|luego|mas tarde|cancelar|cancela"
+    r"|generar despues|no generar despues|no despues|no luego)(?: (?:la |mi )?poliza)?$"
+)
+_ANSWER_SEPARATORS = re.compile(r"[\s.,;:!¡]+")
+_AUDIO_PATTERN = re.compile(r"\b(audio|escuchar|resumen hablado|mp3)\b")
+# Menciones de área; con más de una ("2 locales de 50m2 y 80m2") decide el LLM
+_AREA_PATTERN = re.compile(r"\d+(?:\.\d+)?\s*(?:m[²2]|metros?\s*cuadrados?|m\s*cuadrados?)")
+
+# Los turnos con más palabras se consideran conversación libre y van al LLM
+_MAX_STRUCTURED_WORDS = 8
+
+
+class IntentRouter:
+    """Clasifica turnos estructurados sin llamar al modelo"""
+
+    def __init__(self):
+        self.turns = 0
+        self.fast_path_turns = 0
+        self.by_intent = Counter()
+        self._lock = threading.Lock()
+
+    def route(self, state: dict, user_input: str,
+              awaiting_confirmation: bool = False) -> Tuple[Optional[str], Dict[str, Any]]:
+        """
+        Detecta la intención del turno
+
+        Returns:
+            Tuple[str, dict]: (intención o None si debe ir al LLM, datos extraídos)
+        """
+        text = normalize_text(user_input or "").strip()
+        words = text.split()
+        if not words or len(words) > _MAX_STRUCTURED_WORDS or "?" in text:
+            return None, {}
+
+        # Solo cuenta como sí/no si el agente preguntó y la respuesta es completa
+        if awaiting_confirmation and not state.get("policy"):
+            answer = _ANSWER_SEPARATORS.sub(" ", text).strip()
+            if _CONFIRM_ANSWER.match(answer):
+                return CONFIRM_POLICY, {}
+            if _CANCEL_ANSWER.match(answer):
+                return CANCEL_POLICY, {}
+
+        if state.get("policy") and _AUDIO_PATTERN.search(text):
+            return AUDIO_REQUEST, {}
+
+        if len(_AREA_PATTERN.findall(user_input.lower())) > 1:
+            return None, {}
+        extracted = ConversationNodes._extract_info_from_text(user_input)
+        if extracted.get("metraje"):
+            return UPDATE_METRAJE, extracted
+
+        return None, {}
+
+    def record(self, intent: Optional[str]) -> None:
+        """Registra si el turno se resolvió localmente (intent) o con el LLM (None)"""
+        with self._lock:
+            self.turns += 1
+            if intent:
+                self.fast_path_turns += 1
+                self.by_intent[intent] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Fracción de turnos que evitaron el modelo"""
+        with self._lock:
+            return {
+                "turns": self.turns,
+                "fast_path_turns": self.fast_path_turns,
+                "skip_rate": self.fast_path_turns / self.turns if self.turns else 0.0,
+                "by_intent": dict(self.by_intent)
+            }
@@ -0,0 +1,106 @@
+"""
+Clasificador de palabras clave precompilado para tipo de negocio y ubicación.
+
+Compartido por `ValuationEngine` y `ConversationNodes`: las palabras clave se
+compilan una sola vez en una expresión regular con alternancia y los textos se
+normalizan (minúsculas, sin tildes) antes de buscar.
+"""
+
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+
+# Orden = prioridad: gana la primera categoría con alguna coincidencia
+BUSINESS_KEYWORDS: Dict[str, List[str]] = {
+    "restaurante": ["restaurante", "restaurant", "comida", "cocina", "cevichería"],
+    "tienda": ["tienda", "store", "comercio", "venta", "bodega", "minimarket"],
+    "oficina": ["oficina", "office", "administrativa", "servicios"],
+    "farmacia": ["farmacia", "botica", "medicinas", "droguería"],
+    "bar": ["bar", "cantina", "licores", "discoteca", "pub"],
+    "panadería": ["panadería", "bakery", "pan", "pastelería", "repostería"],
+    "taller": ["taller", "mecánica", "reparación", "automotriz"],
+    "consultorio": ["consultorio", "clínica", "médico", "dental", "veterinaria"],
+    "salon": ["salón", "peluquería", "spa", "belleza", "estética"]
+}
+
+LOCATION_KEYWORDS: Dict[str, List[str]] = {
+    "lima": ["lima", "miraflores", "san isidro", "surco", "la molina"],
+    "arequipa": ["arequipa"],
+    "trujillo": ["trujillo"],
+    "cusco": ["cusco"]
+}
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas y sin tildes/diacríticos (los caracteres no ASCII restantes se descartan)"""
+    lowered = text.lower()
+    if lowered.isascii():
+        return lowered
+    return unicodedata.normalize("NFKD", lowered).encode("ascii", "ignore").decode("ascii")
+
+
+class KeywordMatcher:
+    """Busca la categoría de mayor prioridad cuyas palabras clave aparecen en un texto"""
+
+    def __init__(self, keywords: Dict[str, List[str]]):
+        self.categories = list(keywords.keys())
+
+        # Cada palabra clave se asocia al índice de su categoría; se ordenan por prioridad
+        self._category_of: Dict[str, int] = {}
+        alternatives = []
+        for priority, category in enumerate(self.categories):
+            for keyword in keywords[category]:
+                normalized = normalize_text(keyword)
+                if normalized not in self._category_of:
+                    self._category_of[normalized] = priority
+                    alternatives.append(re.escape(normalized))
+
+        # Alternancia simple (rápida) salvo que una palabra de mayor prioridad esté
+        # contenida dentro de otra; en ese caso, búsqueda anticipada en cada
+        # posición para no perder coincidencias solapadas. (Los solapamientos
+        # parciales solo ocurren con palabras pegadas sin separador y se ignoran.)
+        if self._has_overlap_hazard():
+            self._pattern = re.compile("(?=(" + "|".join(alternatives) + "))")
+        else:
+            self._pattern = re.compile("(" + "|".join(alternatives) + ")")
+    
+    def _has_overlap_hazard(self) -> bool:
+        """True si alguna palabra clave queda oculta dentro de otra de menor prioridad"""
+        for matched, matched_priority in self._category_of.items():
+            for other, other_priority in self._category_of.items():
+                if other_priority < matched_priority and other in matched[1:]:
+                    return True
+        return False
+
+    def match(self, text: Optional[str]) -> Optional[str]:
+        """Devuelve la categoría de mayor prioridad presente en el texto, o None"""
+        if not text:
+            return None
+
+        best = None
+        for found in self._pattern.finditer(normalize_text(text)):
+            priority = self._category_of[found.group(1)]
+            if best is None or priority < best:
+                best = priority
+                if best == 0:
+                    break
+
+        return self.categories[best] if best is not None else None
+
+
+BUSINESS_TYPE_MATCHER = KeywordMatcher(BUSINESS_KEYWORDS)
+LOCATION_MATCHER = KeywordMatcher(LOCATION_KEYWORDS)
+
+
+@lru_cache(maxsize=4096)
+def business_type_key(tipo_negocio: Optional[str]) -> str:
+    """Clave de tipo de negocio para un texto libre ('default' si no hay coincidencia)"""
+    return BUSINESS_TYPE_MATCHER.match(tipo_negocio) or "default"
+
+
+@lru_cache(maxsize=4096)
+def location_key(direccion: Optional[str]) -> str:
+    """Clave de zona para una dirección ('default' si no hay coincidencia)"""
+    return LOCATION_MATCHER.match(direccion) or "default"
@@ -5,33 +5,62 @@ Agente de seguros que cotiza automáticamente con el certificado
 
 import openai
 import json
-from typing import Dict, Any, Optional, List
+import asyncio
+from typing import Dict, Any, Optional, List, Iterator, Generator
 from datetime import datetime
-from models import BusinessInfo, Valuation, InsurancePolicy
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+from models import BusinessInfo, Valuation, InsurancePolicy, new_context_memory
 from certificate_analyzer import CertificateAnalyzer
 from valuation_engine import ValuationEngine
-from policy_generator import PolicyGenerator
+from policy_generator import PolicyGenerator, audio_status
+from usage_metrics import UsageTracker
+from history_manager import HistoryManager
+from tool_executor import ToolExecutor, ToolSpec
+from openai_clients import get_openai_client, get_async_openai_client
+from image_store import MissingImageError
+from intent_router import IntentRouter, CONFIRM_POLICY, CANCEL_POLICY, UPDATE_METRAJE, AUDIO_REQUEST
+
+# Prefijo estático del prompt del sistema; el estado va en un mensaje final aparte
+SYSTEM_PROMPT = """Eres un agente de seguros comerciales de Seguros Pacífico con flujo automatizado.
+
+El estado actual (datos del negocio y avance de la cotización) se entrega al final de la conversación en un mensaje "ESTADO ACTUAL".
+
+FLUJO AUTOMATIZADO:
+1. **Cuando se suba CERTIFICADO** → Usar process_certificate_and_quote INMEDIATAMENTE
+2. **Cuando tengas COTIZACIÓN completa** → Preguntar "¿Te gustaría que genere tu póliza oficial?" + usar show_policy_confirmation
+3. **Cuando usuario confirme "Sí"** → Usar generate_policy_and_audio para crear documentos
+
+REGLAS CRÍTICAS:
+- Al detectar certificado subido → llamar process_certificate_and_quote automáticamente
+- NO pedir información adicional si ya tienes tipo_negocio + metraje del certificado  
+- Después de generar cotización → SIEMPRE preguntar sobre póliza Y usar show_policy_confirmation
+- SIEMPRE usar show_policy_confirmation cuando preguntes sobre generar póliza
+- SÉ PROACTIVO: procesa y cotiza automáticamente
+
+MENSAJES REQUERIDOS:
+- Tras analizar certificado: "He analizado tu certificado y generado tu cotización personalizada..."
+- Tras cotizar: "¿Te gustaría que genere tu póliza oficial?" + USAR show_policy_confirmation
+- Tras generar póliza: "¡Perfecto! Tu póliza y resumen en audio están listos para descargar."
+
+IMPORTANTE: Cuando preguntes sobre generar la póliza, SIEMPRE usar la herramienta show_policy_confirmation para activar los botones en la interfaz."""
 
 class LLMControlledInsuranceAgent:
     """Agente de seguros que cotiza automáticamente al subir certificado"""
     
-    def __init__(self, api_key: str):
-        self.client = openai.OpenAI(api_key=api_key)
-        self.certificate_analyzer = CertificateAnalyzer(api_key)
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.client = get_openai_client(api_key, base_url)
+        self.async_client = get_async_openai_client(api_key, base_url)
+        self.certificate_analyzer = CertificateAnalyzer(api_key, base_url=base_url)
         self.valuation_engine = ValuationEngine()
         self.policy_generator = PolicyGenerator()
+        self.usage_tracker = UsageTracker()
+        self.history_manager = HistoryManager()
+        self.intent_router = IntentRouter()
+        self.tool_executor = self._build_tool_executor()
         
-        # Estado interno para controlar el flujo
-        self.awaiting_policy_confirmation = False
-        
-        # Memoria de contexto simplificada
-        self.context_memory = {
-            "user_preferences": {},
-            "conversation_style": "formal",
-            "mentioned_concerns": [],
-            "business_context": {},
-            "interaction_history": []
-        }
+        # Los datos de cada sesión (confirmación pendiente, memoria de contexto)
+        # viven en el estado: una sola instancia atiende a todas las sesiones
         
         # Herramientas actualizadas
         self.tools = [
@@ -107,34 +136,11 @@ class LLMControlledInsuranceAgent:
     def process_conversation(self, state: dict, user_input: str) -> dict:
         """Procesa la conversación con flujo automático mejorado"""
         
-        # Verificar si el usuario confirmó generar póliza
-        if self.awaiting_policy_confirmation:
-            if user_input.lower().strip() in ['sí', 'si', 'yes', 'y', 'confirmo', 'ok', 'generar']:
-                # Usuario confirmó - generar póliza y audio automáticamente
-                state = self._generate_policy_and_audio_directly(state)
-                self.awaiting_policy_confirmation = False
-                return state
-            elif user_input.lower().strip() in ['no', 'n', 'cancelar', 'después']:
-                state["messages"].append({
-                    "role": "assistant",
-                    "content": "Entendido. Tu cotización queda guardada. Puedes pedirme generar la póliza cuando estés listo."
-                })
-                self.awaiting_policy_confirmation = False
-                return state
-        
-        # Agregar mensaje del usuario
-        state["messages"].append({
-            "role": "user",
-            "content": user_input
-        })
-        
-        # Construir contexto para LLM
-        context = self._build_context(state)
-        system_message = self._build_system_message(context)
+        # Turnos estructurados (confirmación, metraje, audio) sin pasar por el LLM
+        if self._handle_fast_path(state, user_input):
+            return state
         
-        # Preparar mensajes
-        messages = [{"role": "system", "content": system_message}]
-        messages.extend(state["messages"][-6:])  # Últimos 6 mensajes
+        messages = self._prepare_messages(state, user_input)
         
         try:
             response = self.client.chat.completions.create(
@@ -145,6 +151,7 @@ class LLMControlledInsuranceAgent:
                 temperature=0.1,
                 max_tokens=1200
             )
+            self.usage_tracker.record(response, "gpt-4-turbo-preview", "herramientas")
             
             assistant_message = response.choices[0].message
             
@@ -153,19 +160,7 @@ class LLMControlledInsuranceAgent:
                 state = self._execute_tool_calls(state, assistant_message.tool_calls)
                 
                 # Segunda llamada para respuesta final
-                messages.append({
-                    "role": "assistant",
-                    "content": assistant_message.content or "",
-                    "tool_calls": assistant_message.tool_calls
-                })
-                
-                for tool_call in assistant_message.tool_calls:
-                    tool_result = self._get_tool_result(state, tool_call)
-                    messages.append({
-                        "role": "tool",
-                        "tool_call_id": tool_call.id,
-                        "content": tool_result
-                    })
+                self._append_tool_messages(messages, state, assistant_message)
                 
                 final_response = self.client.chat.completions.create(
                     model="gpt-4-turbo-preview",
@@ -173,6 +168,7 @@ class LLMControlledInsuranceAgent:
                     temperature=0.1,
                     max_tokens=800
                 )
+                self.usage_tracker.record(final_response, "gpt-4-turbo-preview", "respuesta")
                 
                 final_content = final_response.choices[0].message.content
             else:
@@ -186,65 +182,433 @@ class LLMControlledInsuranceAgent:
             
         except Exception as e:
             print(f"Error en conversación LLM: {str(e)}")
+            self._append_error_message(state, e)
+        
+        return state
+    
+    async def aprocess_conversation(self, state: dict, user_input: str) -> dict:
+        """
+        Variante asíncrona de process_conversation basada en AsyncOpenAI
+        
+        Las llamadas al LLM no bloquean el event loop y las herramientas (Vision,
+        gTTS) se ejecutan en un hilo aparte, de modo que un solo proceso puede
+        atender muchas sesiones concurrentes.
+        """
+        
+        if await asyncio.to_thread(self._handle_fast_path, state, user_input):
+            return state
+        
+        messages = self._prepare_messages(state, user_input)
+        
+        try:
+            response = await self.async_client.chat.completions.create(
+                model="gpt-4-turbo-preview",
+                messages=messages,
+                tools=self.tools,
+                tool_choice="auto",
+                temperature=0.1,
+                max_tokens=1200
+            )
+            self.usage_tracker.record(response, "gpt-4-turbo-preview", "herramientas")
+            
+            assistant_message = response.choices[0].message
+            
+            if assistant_message.tool_calls:
+                state = await asyncio.to_thread(
+                    self._execute_tool_calls, state, assistant_message.tool_calls
+                )
+                
+                self._append_tool_messages(messages, state, assistant_message)
+                
+                final_response = await self.async_client.chat.completions.create(
+                    model="gpt-4-turbo-preview",
+                    messages=messages,
+                    temperature=0.1,
+                    max_tokens=800
+                )
+                self.usage_tracker.record(final_response, "gpt-4-turbo-preview", "respuesta")
+                
+                final_content = final_response.choices[0].message.content
+            else:
+                final_content = assistant_message.content
+            
             state["messages"].append({
-                "role": "assistant",
-                "content": "Disculpa, hubo un error procesando tu solicitud. ¿Podrías intentar de nuevo?"
+                "role": "assistant", 
+                "content": final_content
             })
+            
+        except Exception as e:
+            print(f"Error en conversación LLM (async): {str(e)}")
+            self._append_error_message(state, e)
         
         return state
     
-    def _execute_tool_calls(self, state: dict, tool_calls) -> dict:
-        """Ejecuta las herramientas llamadas por el LLM"""
+    def process_conversation_stream(self, state: dict, user_input: str) -> Iterator[str]:
+        """
+        Variante de process_conversation que va entregando la respuesta por partes
+        
+        Produce los fragmentos de texto a medida que llegan del LLM (stream=True),
+        para que la interfaz los muestre de inmediato. El estado se actualiza en
+        el mismo diccionario recibido; al terminar, la respuesta completa queda
+        agregada a state["messages"].
+        """
         
-        for tool_call in tool_calls:
-            function_name = tool_call.function.name
-            arguments = json.loads(tool_call.function.arguments)
+        previous_count = len(state["messages"])
+        if self._handle_fast_path(state, user_input):
+            for message in state["messages"][previous_count:]:
+                if message["role"] == "assistant":
+                    yield message["content"]
+            return
+        
+        messages = self._prepare_messages(state, user_input)
+        
+        try:
+            assistant_message = yield from self._stream_completion(
+                messages, max_tokens=1200, tools=self.tools
+            )
             
-            try:
-                if function_name == "process_certificate_and_quote":
-                    if arguments.get("trigger_processing") and state.get("certificate_images"):
-                        # Analizar certificado
-                        cert_image = state["certificate_images"][0].to_pil_image()
-                        business_info = self.certificate_analyzer.analyze_image(cert_image)
-                        
-                        # Actualizar información existente
-                        existing_info = state["business_info"]
-                        for field, value in business_info.to_dict().items():
-                            if value and not getattr(existing_info, field, None):
-                                setattr(existing_info, field, value)
-                        
-                        # Calcular cotización automáticamente si tenemos datos mínimos
-                        if existing_info.tipo_negocio and existing_info.metraje:
-                            valuation = self.valuation_engine.estimate_property_value(
-                                existing_info, 0  # Sin fotos del local por ahora
-                            )
-                            state["valuation"] = valuation
-                            state["ready_for_policy"] = True
-                            print(f"[DEBUG] Cotización automática generada: S/ {valuation.total:,.2f}")
-                
-                elif function_name == "update_business_info":
-                    existing_info = state["business_info"]
-                    for field, value in arguments.items():
-                        if value is not None and value != "":
-                            if field == "metraje":
-                                existing_info.metraje = float(value)
-                            else:
-                                setattr(existing_info, field, str(value))
+            if assistant_message.tool_calls:
+                self._execute_tool_calls(state, assistant_message.tool_calls)
+                self._append_tool_messages(messages, state, assistant_message)
                 
-                elif function_name == "show_policy_confirmation":
-                    if arguments.get("show_buttons"):
-                        self.awaiting_policy_confirmation = True
-                        state["show_policy_buttons"] = True
+                # El texto previo a las herramientas ya se mostró; se separa del final
+                prefix = assistant_message.content or ""
+                if prefix:
+                    yield "\n\n"
                 
-                elif function_name == "generate_policy_and_audio":
-                    if arguments.get("generate_policy"):
-                        state = self._generate_policy_and_audio_directly(state)
-                        
-            except Exception as e:
-                print(f"Error ejecutando herramienta {function_name}: {str(e)}")
+                final_message = yield from self._stream_completion(messages, max_tokens=800)
+                final_content = (prefix + "\n\n" if prefix else "") + (final_message.content or "")
+            else:
+                final_content = assistant_message.content
+            
+            state["messages"].append({
+                "role": "assistant", 
+                "content": final_content
+            })
+            
+        except Exception as e:
+            print(f"Error en conversación LLM (stream): {str(e)}")
+            self._append_error_message(state, e)
+            yield state["messages"][-1]["content"]
+    
+    def _stream_completion(self, messages: List[dict], max_tokens: int,
+                           tools: Optional[List[dict]] = None) -> Generator[str, None, ChatCompletionMessage]:
+        """
+        Llama al LLM en modo stream, produce los fragmentos de texto y devuelve el
+        mensaje completo
+        
+        Los argumentos de las herramientas llegan fragmentados en varios deltas;
+        se acumulan por índice hasta reconstruir cada llamada.
+        """
+        request = {
+            "model": "gpt-4-turbo-preview",
+            "messages": messages,
+            "temperature": 0.1,
+            "max_tokens": max_tokens,
+            "stream": True
+        }
+        if tools:
+            request["tools"] = tools
+            request["tool_choice"] = "auto"
+        # El último fragmento trae el uso de tokens (sin choices)
+        request["stream_options"] = {"include_usage": True}
+        
+        content_parts = []
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        
+        for chunk in self.client.chat.completions.create(**request):
+            if chunk.usage:
+                self.usage_tracker.record(chunk.usage, request["model"], "stream")
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            
+            if delta.content:
+                content_parts.append(delta.content)
+                yield delta.content
+            
+            for tool_delta in delta.tool_calls or []:
+                call = tool_calls.setdefault(tool_delta.index, {"id": "", "name": "", "arguments": ""})
+                if tool_delta.id:
+                    call["id"] = tool_delta.id
+                if tool_delta.function:
+                    if tool_delta.function.name:
+                        call["name"] += tool_delta.function.name
+                    if tool_delta.function.arguments:
+                        call["arguments"] += tool_delta.function.arguments
+        
+        return ChatCompletionMessage(
+            role="assistant",
+            content="".join(content_parts) or None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(
+                    id=call["id"],
+                    type="function",
+                    function=Function(name=call["name"], arguments=call["arguments"] or "{}")
+                )
+                for _, call in sorted(tool_calls.items())
+            ] or None
+        )
+    
+    def _handle_fast_path(self, state: dict, user_input: str) -> bool:
+        """
+        Resuelve sin LLM los turnos estructurados (confirmaciones, metraje, audio)
+        
+        Returns:
+            bool: True si el turno quedó atendido con una respuesta de plantilla
+        """
+        intent, data = self.intent_router.route(state, user_input, state.get("awaiting_policy_confirmation", False))
+        self.intent_router.record(intent)
+        if not intent:
+            return False
         
+        print(f"[DEBUG] Ruta rápida sin LLM: {intent}")
+        state["messages"].append({
+            "role": "user",
+            "content": user_input
+        })
+        
+        if intent == CONFIRM_POLICY:
+            self._confirm_policy(state)
+        elif intent == CANCEL_POLICY:
+            self._cancel_policy(state)
+        elif intent == UPDATE_METRAJE:
+            self._update_metraje(state, data)
+        elif intent == AUDIO_REQUEST:
+            self._reply_audio_status(state)
+        
+        return True
+    
+    def _confirm_policy(self, state: dict) -> dict:
+        """Genera póliza y audio tras la confirmación del usuario"""
+        state = self._generate_policy_and_audio_directly(state)
+        state["awaiting_policy_confirmation"] = False
+        
+        if state.get("policy_generated"):
+            content = "¡Perfecto! Tu póliza y resumen en audio están listos para descargar."
+        else:
+            content = "No pude generar la póliza todavía: necesito una cotización completa (tipo de negocio y metraje)."
+        state["messages"].append({
+            "role": "assistant",
+            "content": content
+        })
+        return state
+    
+    def _update_metraje(self, state: dict, extracted: Dict[str, Any]) -> dict:
+        """Actualiza metraje (y tipo de negocio si vino) y recotiza con una respuesta de plantilla"""
+        existing_info = state["business_info"]
+        existing_info.metraje = extracted["metraje"]
+        # El tipo del certificado no se pisa con la clave genérica del clasificador
+        if extracted.get("tipo_negocio") and not existing_info.tipo_negocio:
+            existing_info.tipo_negocio = extracted["tipo_negocio"]
+        
+        if existing_info.tipo_negocio:
+            # Mismo cálculo que process_certificate_and_quote
+            valuation = self.valuation_engine.estimate_property_value(existing_info, 0)
+            state["valuation"] = valuation
+            state["ready_for_policy"] = True
+            content = self.policy_generator.generate_quote_summary(existing_info, valuation)
+            if not state.get("policy"):
+                state["awaiting_policy_confirmation"] = True
+                state["show_policy_buttons"] = True
+        else:
+            content = (f"Anotado: {existing_info.metraje:g} m². ¿Qué tipo de negocio tienes? "
+                       "(por ejemplo: bodega, restaurante, farmacia)")
+        
+        state["messages"].append({
+            "role": "assistant",
+            "content": content
+        })
+        return state
+    
+    def _reply_audio_status(self, state: dict) -> dict:
+        """Responde a un pedido de audio según su estado, encolándolo si falta"""
+        status = audio_status(state.get("audio_file"))
+        
+        if status in ("missing", "failed"):
+            audio_file, summary_text = self.policy_generator.generate_audio_summary(
+                state["business_info"],
+                state["valuation"],
+                state["policy"],
+                background=True
+            )
+            if audio_file:
+                state["audio_file"] = audio_file
+                state["audio_summary"] = summary_text
+            status = audio_status(audio_file)
+        
+        if status == "ready":
+            content = "🔊 Tu resumen en audio está listo: puedes escucharlo o descargarlo aquí abajo."
+        elif status == "pending":
+            content = "🔊 Estoy generando tu resumen en audio, estará listo en unos segundos."
+        else:
+            content = "No pude generar el audio en este momento. ¿Intentamos de nuevo más tarde?"
+        
+        state["messages"].append({
+            "role": "assistant",
+            "content": content
+        })
         return state
     
+    def _cancel_policy(self, state: dict) -> dict:
+        """Registra que el usuario pospuso la generación de la póliza"""
+        state["messages"].append({
+            "role": "assistant",
+            "content": "Entendido. Tu cotización queda guardada. Puedes pedirme generar la póliza cuando estés listo."
+        })
+        state["awaiting_policy_confirmation"] = False
+        return state
+    
+    def _prepare_messages(self, state: dict, user_input: str) -> List[dict]:
+        """Agrega el mensaje del usuario al estado y arma los mensajes para el LLM"""
+        state["messages"].append({
+            "role": "user",
+            "content": user_input
+        })
+        
+        # Construir contexto para LLM
+        context = self._build_context(state)
+        
+        # Prefijo estático + historial bajo presupuesto + estado actual al final
+        messages = [{"role": "system", "content": self._build_system_message()}]
+        messages.extend(self.history_manager.pack(state))  # Mensajes que caben en el presupuesto
+        messages.append({"role": "system", "content": self._build_dynamic_context_message(context)})
+        
+        self.usage_tracker.new_turn()
+        
+        return messages
+    
+    def _append_tool_messages(self, messages: List[dict], state: dict, assistant_message) -> None:
+        """Agrega la llamada a herramientas y sus resultados para la segunda llamada"""
+        messages.append({
+            "role": "assistant",
+            "content": assistant_message.content or "",
+            "tool_calls": assistant_message.tool_calls
+        })
+        
+        for tool_call in assistant_message.tool_calls:
+            tool_result = self._get_tool_result(state, tool_call)
+            messages.append({
+                "role": "tool",
+                "tool_call_id": tool_call.id,
+                "content": tool_result
+            })
+    
+    def _append_error_message(self, state: dict, error: Optional[Exception] = None) -> None:
+        """Agrega el mensaje de error al estado (específico si la API está saturada)"""
+        if isinstance(error, openai.RateLimitError):
+            content = ("En este momento estamos atendiendo muchas solicitudes. "
+                       "Por favor intenta de nuevo en unos segundos.")
+        else:
+            content = "Disculpa, hubo un error procesando tu solicitud. ¿Podrías intentar de nuevo?"
+        state["messages"].append({
+            "role": "assistant",
+            "content": content
+        })
+    
+    def _execute_tool_calls(self, state: dict, tool_calls) -> dict:
+        """Ejecuta las herramientas llamadas por el LLM (en paralelo cuando no comparten estado)"""
+        self.tool_executor.execute(state, tool_calls)
+        return state
+    
+    def _build_tool_executor(self) -> ToolExecutor:
+        """Declara qué claves del estado lee y escribe cada herramienta"""
+        return ToolExecutor({
+            "process_certificate_and_quote": ToolSpec(
+                run=self._tool_process_certificate_and_quote,
+                reads=frozenset({"certificate_images"}),
+                writes=frozenset({"business_info", "valuation", "ready_for_policy", "certificate_images"}),
+                timeout=90.0
+            ),
+            "update_business_info": ToolSpec(
+                run=self._tool_update_business_info,
+                writes=frozenset({"business_info"}),
+                timeout=5.0
+            ),
+            "show_policy_confirmation": ToolSpec(
+                run=self._tool_show_policy_confirmation,
+                writes=frozenset({"awaiting_policy_confirmation", "show_policy_buttons"}),
+                timeout=5.0
+            ),
+            "generate_policy_and_audio": ToolSpec(
+                run=self._tool_generate_policy_and_audio,
+                reads=frozenset({"business_info", "valuation"}),
+                writes=frozenset({"policy", "audio_file", "audio_summary", "policy_generated",
+                                  "show_download_buttons"}),
+                timeout=30.0
+            )
+        })
+    
+    def _tool_process_certificate_and_quote(self, state: dict, arguments: dict):
+        """Analiza el certificado (Vision, en el hilo de la herramienta) y cotiza al aplicar"""
+        if not (arguments.get("trigger_processing") and state.get("certificate_images")):
+            return None
+        
+        # Analizar certificado
+        try:
+            cert_image = state["certificate_images"][0].to_pil_image()
+        except MissingImageError:
+            # Sesión reanudada cuya imagen ya se desalojó del almacén
+            print(f"[DEBUG] Certificado {state['certificate_images'][0].filename} no disponible")
+            
+            def forget_certificate(state: dict) -> None:
+                state["certificate_images"] = []
+            
+            return forget_certificate
+        business_info = self.certificate_analyzer.analyze_image(cert_image)
+        
+        def apply(state: dict) -> None:
+            self._merge_certificate_info(state, business_info)
+        
+        return apply
+    
+    def _merge_certificate_info(self, state: dict, business_info: BusinessInfo) -> None:
+        """Completa los datos del negocio con los del certificado y cotiza si ya alcanzan"""
+        # Actualizar información existente
+        existing_info = state["business_info"]
+        for field, value in business_info.to_dict().items():
+            if value and not getattr(existing_info, field, None):
+                setattr(existing_info, field, value)
+        
+        # Calcular cotización automáticamente si tenemos datos mínimos
+        if existing_info.tipo_negocio and existing_info.metraje:
+            valuation = self.valuation_engine.estimate_property_value(
+                existing_info, 0  # Sin fotos del local por ahora
+            )
+            state["valuation"] = valuation
+            state["ready_for_policy"] = True
+            print(f"[DEBUG] Cotización automática generada: S/ {valuation.total:,.2f}")
+    
+    def _tool_update_business_info(self, state: dict, arguments: dict):
+        """Actualiza los campos indicados del negocio"""
+        def apply(state: dict) -> None:
+            existing_info = state["business_info"]
+            for field, value in arguments.items():
+                if value is not None and value != "":
+                    if field == "metraje":
+                        existing_info.metraje = float(value)
+                    else:
+                        setattr(existing_info, field, str(value))
+        
+        return apply
+    
+    def _tool_show_policy_confirmation(self, state: dict, arguments: dict):
+        """Activa los botones de confirmación de póliza"""
+        if not arguments.get("show_buttons"):
+            return None
+        
+        def apply(state: dict) -> None:
+            state["awaiting_policy_confirmation"] = True
+            state["show_policy_buttons"] = True
+        
+        return apply
+    
+    def _tool_generate_policy_and_audio(self, state: dict, arguments: dict):
+        """Genera la póliza; el audio ya se sintetiza en segundo plano"""
+        if not arguments.get("generate_policy"):
+            return None
+        return self._generate_policy_and_audio_directly
+    
     def _generate_policy_and_audio_directly(self, state: dict) -> dict:
         """Genera póliza y audio directamente"""
         try:
@@ -256,11 +620,12 @@ class LLMControlledInsuranceAgent:
                 )
                 state["policy"] = policy
                 
-                # Generar audio
+                # Encolar audio (se sintetiza en segundo plano)
                 audio_file, summary_text = self.policy_generator.generate_audio_summary(
                     state["business_info"],
                     state["valuation"],
-                    policy
+                    policy,
+                    background=True
                 )
                 
                 if audio_file:
@@ -286,6 +651,9 @@ class LLMControlledInsuranceAgent:
             business_info = state.get("business_info", BusinessInfo())
             valuation = state.get("valuation")
             
+            if not state.get("certificate_images"):
+                return ("El certificado ya no está disponible en el servidor. "
+                        "Pide al usuario que lo vuelva a subir.")
             if valuation:
                 return f"""Certificado procesado y cotización generada exitosamente.
                 
@@ -317,38 +685,21 @@ Lista para generar póliza oficial."""
         
         return "Herramienta ejecutada."
     
-    def _build_system_message(self, context: Dict[str, Any]) -> str:
-        """Construye mensaje del sistema actualizado"""
-        
-        business_info_str = json.dumps(context['business_info'], indent=2)
+    def _build_system_message(self) -> str:
+        """Prefijo estático del prompt (idéntico en cada turno para aprovechar la caché del proveedor)"""
+        return SYSTEM_PROMPT
+    
+    def _build_dynamic_context_message(self, context: Dict[str, Any]) -> str:
+        """Sufijo dinámico y compacto con el estado actual"""
+        business_info = {k: v for k, v in context['business_info'].items() if v is not None}
         
-        return f"""Eres un agente de seguros comerciales de Seguros Pacífico con flujo automatizado.
-
-CONTEXTO ACTUAL:
-- Información del negocio: {business_info_str}
-- ¿Tiene certificado?: {context['has_certificate']}
-- ¿Tiene cotización?: {context['has_valuation']}
-- ¿Tiene póliza?: {context['has_policy']}
-- ¿Esperando confirmación?: {self.awaiting_policy_confirmation}
-
-FLUJO AUTOMATIZADO:
-1. **Cuando se suba CERTIFICADO** → Usar process_certificate_and_quote INMEDIATAMENTE
-2. **Cuando tengas COTIZACIÓN completa** → Preguntar "¿Te gustaría que genere tu póliza oficial?" + usar show_policy_confirmation
-3. **Cuando usuario confirme "Sí"** → Usar generate_policy_and_audio para crear documentos
-
-REGLAS CRÍTICAS:
-- Al detectar certificado subido → llamar process_certificate_and_quote automáticamente
-- NO pedir información adicional si ya tienes tipo_negocio + metraje del certificado  
-- Después de generar cotización → SIEMPRE preguntar sobre póliza Y usar show_policy_confirmation
-- SIEMPRE usar show_policy_confirmation cuando preguntes sobre generar póliza
-- SÉ PROACTIVO: procesa y cotiza automáticamente
-
-MENSAJES REQUERIDOS:
-- Tras analizar certificado: "He analizado tu certificado y generado tu cotización personalizada..."
-- Tras cotizar: "¿Te gustaría que genere tu póliza oficial?" + USAR show_policy_confirmation
-- Tras generar póliza: "¡Perfecto! Tu póliza y resumen en audio están listos para descargar."
-
-IMPORTANTE: Cuando preguntes sobre generar la póliza, SIEMPRE usar la herramienta show_policy_confirmation para activar los botones en la interfaz."""
+        return (
+            "ESTADO ACTUAL:\n"
+            f"- Negocio: {json.dumps(business_info, ensure_ascii=False, sort_keys=True)}\n"
+            f"- Certificado: {context['has_certificate']} | Cotización: {context['has_valuation']} | "
+            f"Póliza: {context['has_policy']} | "
+            f"Esperando confirmación: {context['awaiting_policy_confirmation']}"
+        )
     
     def _build_context(self, state: dict) -> Dict[str, Any]:
         """Construye el contexto actual del estado"""
@@ -357,25 +708,32 @@ IMPORTANTE: Cuando preguntes sobre generar la póliza, SIEMPRE usar la herramien
             "has_certificate": bool(state.get("certificate_images")),
             "has_valuation": bool(state.get("valuation")),
             "has_policy": bool(state.get("policy")),
-            "ready_for_policy": state.get("ready_for_policy", False)
+            "ready_for_policy": state.get("ready_for_policy", False),
+            "awaiting_policy_confirmation": state.get("awaiting_policy_confirmation", False)
         }
     
     def process_certificate_image(self, state: dict, image) -> dict:
-        """Procesa imagen de certificado"""
-        from models import SerializableImage
+        """Procesa imagen de certificado (PIL Image o ImageRef ya guardada)"""
+        from models import ImageRef
         
-        serializable_image = SerializableImage.from_pil_image(image, "certificado.jpg")
+        if isinstance(image, ImageRef):
+            serializable_image = image
+        else:
+            serializable_image = ImageRef.from_pil_image(image, "certificado.jpg")
         state["certificate_images"] = [serializable_image]
         
         return state
     
     def process_local_photos(self, state: dict, photos: List) -> dict:
-        """Procesa fotos del local"""
-        from models import SerializableImage
+        """Procesa fotos del local (PIL Image o ImageRef ya guardadas)"""
+        from models import ImageRef
         
         serializable_photos = []
         for i, photo in enumerate(photos):
-            serializable_photo = SerializableImage.from_pil_image(photo, f"local_foto_{i+1}.jpg")
+            if isinstance(photo, ImageRef):
+                serializable_photo = photo
+            else:
+                serializable_photo = ImageRef.from_pil_image(photo, f"local_foto_{i+1}.jpg")
             serializable_photos.append(serializable_photo)
         
         current_photos = state.get("local_photos", [])
@@ -384,12 +742,31 @@ IMPORTANTE: Cuando preguntes sobre generar la póliza, SIEMPRE usar la herramien
         
         return state
     
-    def get_memory_summary(self) -> Dict[str, Any]:
-        """Obtiene un resumen de la memoria de contexto"""
+    def apply_upload_results(self, state: dict, results: List) -> dict:
+        """Incorpora al estado los resultados de `UploadPipeline.process`"""
+        # Los archivos con error no se clasifican: build_upload_summary los informa aparte
+        processed = [r for r in results if r.image_ref and not r.error]
+        certificates = [r for r in processed if r.image_type == "certificate"]
+        photos = [r.image_ref for r in processed if r.image_type != "certificate"]
+        
+        if certificates:
+            # Se conserva un solo certificado, como en la subida individual
+            state = self.process_certificate_image(state, certificates[0].image_ref)
+            # El pipeline ya extrajo los datos: no depende de que el modelo vuelva a pedirlos
+            if certificates[0].business_info is not None:
+                self._merge_certificate_info(state, certificates[0].business_info)
+        if photos:
+            state = self.process_local_photos(state, photos)
+        
+        return state
+    
+    def get_memory_summary(self, state: dict) -> Dict[str, Any]:
+        """Obtiene un resumen de la memoria de contexto de la sesión"""
+        context_memory = state.get("context_memory") or new_context_memory()
         return {
-            "user_preferences": self.context_memory["user_preferences"],
-            "conversation_style": self.context_memory["conversation_style"],
-            "mentioned_concerns_count": len(self.context_memory["mentioned_concerns"]),
-            "business_context": self.context_memory["business_context"],
-            "interaction_history_count": len(self.context_memory["interaction_history"])
+            "user_preferences": context_memory["user_preferences"],
+            "conversation_style": context_memory["conversation_style"],
+            "mentioned_concerns_count": len(context_memory["mentioned_concerns"]),
+            "business_context": context_memory["business_context"],
+            "interaction_history_count": len(context_memory["interaction_history"])
         }   
\ No newline at end of file
@@ -1,11 +1,13 @@
-from typing import TypedDict, List, Optional, Any
+from typing import TypedDict, List, Optional, Any, Dict, get_args
 from datetime import datetime
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from enum import Enum
 import base64
 import io
 from PIL import Image
 
+from image_store import get_image_store
+
 class ConversationStep(Enum):
     WELCOME = "welcome"
     GATHERING_INFO = "gathering_info"
@@ -41,6 +43,10 @@ class SerializableImage:
         img_data = base64.b64decode(self.data)
         return Image.open(io.BytesIO(img_data))
     
+    def to_image_ref(self) -> 'ImageRef':
+        """Migra al formato por referencia (para estados antiguos)"""
+        return ImageRef.from_bytes(base64.b64decode(self.data), self.filename, self.format)
+    
     def to_dict(self) -> dict:
         """Convierte a diccionario para serialización"""
         return {
@@ -54,6 +60,57 @@ class SerializableImage:
         """Crea desde diccionario"""
         return cls(data["data"], data["filename"], data.get("format", "JPEG"))
 
+@dataclass
+class ImageRef:
+    """Referencia a una imagen guardada en el almacén por contenido (solo el hash viaja en el estado)"""
+    digest: str  # SHA-256 de los bytes en el almacén
+    filename: str
+    format: str = "JPEG"
+    size_bytes: int = 0
+    
+    @classmethod
+    def from_bytes(cls, data: bytes, filename: str, format: str = "JPEG") -> 'ImageRef':
+        """Crea ImageRef desde bytes ya codificados, sin recodificar"""
+        digest = get_image_store().put(data)
+        return cls(digest, filename, format, len(data))
+    
+    @classmethod
+    def from_pil_image(cls, pil_image: Image.Image, filename: str) -> 'ImageRef':
+        """Crea ImageRef desde PIL Image (codifica una vez a JPEG)"""
+        buffer = io.BytesIO()
+        # Convertir a RGB si es necesario
+        if pil_image.mode in ('RGBA', 'P', 'LA', 'L'):
+            pil_image = pil_image.convert('RGB')
+        
+        pil_image.save(buffer, format='JPEG', quality=90)
+        return cls.from_bytes(buffer.getvalue(), filename, "JPEG")
+    
+    def to_bytes(self) -> bytes:
+        """Bytes codificados de la imagen"""
+        return get_image_store().get(self.digest)
+    
+    def to_pil_image(self) -> Image.Image:
+        """Abre la imagen de forma perezosa (se decodifica al acceder a los píxeles)"""
+        return get_image_store().open_image(self.digest)
+    
+    def thumbnail(self, size: tuple = (256, 256)) -> Image.Image:
+        """Miniatura cacheada en disco"""
+        return get_image_store().thumbnail(self.digest, size)
+    
+    def to_dict(self) -> dict:
+        """Convierte a diccionario para serialización"""
+        return {
+            "digest": self.digest,
+            "filename": self.filename,
+            "format": self.format,
+            "size_bytes": self.size_bytes
+        }
+    
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ImageRef':
+        """Crea desde diccionario"""
+        return cls(data["digest"], data["filename"], data.get("format", "JPEG"), data.get("size_bytes", 0))
+
 @dataclass
 class BusinessInfo:
     """Información del negocio extraída"""
@@ -74,6 +131,26 @@ class BusinessInfo:
     @classmethod
     def from_dict(cls, data: dict) -> 'BusinessInfo':
         return cls(**{k: v for k, v in data.items() if k in cls.__annotations__})
+    
+    @classmethod
+    def json_schema(cls, extra_properties: Optional[Dict[str, dict]] = None,
+                    only: Optional[List[str]] = None) -> dict:
+        """Esquema JSON estricto (todos los campos requeridos y anulables) para salidas estructuradas"""
+        json_types = {float: "number", int: "integer", str: "string", bool: "boolean"}
+        properties = dict(extra_properties or {})
+        for field in fields(cls):
+            if only is not None and field.name not in only:
+                continue
+            # Optional[X] -> X
+            base_type = next((arg for arg in get_args(field.type) if arg is not type(None)), field.type)
+            properties[field.name] = {"type": [json_types.get(base_type, "string"), "null"]}
+        
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties.keys()),
+            "additionalProperties": False
+        }
 
 @dataclass
 class Valuation:
@@ -83,6 +160,7 @@ class Valuation:
     infraestructura: float = 0
     total: float = 0
     descripcion: str = ""
+    tabla_version: Optional[str] = None  # Versión de la tabla de tarifas usada
     
     def to_dict(self) -> dict:
         return self.__dict__
@@ -98,12 +176,24 @@ class InsurancePolicy:
     def to_dict(self) -> dict:
         return self.__dict__
 
+def new_context_memory() -> Dict[str, Any]:
+    """Memoria de contexto vacía de una sesión"""
+    return {
+        "user_preferences": {},
+        "conversation_style": "formal",
+        "mentioned_concerns": [],
+        "business_context": {},
+        "interaction_history": []
+    }
+
 class GraphState(TypedDict):
     """Estado del grafo de conversación"""
     # Conversación
     messages: List[dict]
     current_step: ConversationStep
     user_input: str
+    history_summary: Optional[str]  # Resumen de los mensajes fuera del presupuesto
+    history_summarized_count: int  # Mensajes ya incorporados al resumen
     
     # Información del negocio
     business_info: BusinessInfo
@@ -111,8 +201,8 @@ class GraphState(TypedDict):
     
     # Archivos subidos
     certificate_text: Optional[str]
-    certificate_images: List[SerializableImage]
-    local_photos: List[SerializableImage]
+    certificate_images: List[ImageRef]
+    local_photos: List[ImageRef]
     
     # Productos generados
     policy: Optional[InsurancePolicy]
@@ -128,4 +218,8 @@ class GraphState(TypedDict):
     needs_certificate: bool
     needs_photos: bool
     needs_confirmation: bool
-    ready_for_policy: bool
\ No newline at end of file
+    ready_for_policy: bool
+    
+    # Estado de sesión de los agentes (los agentes no guardan datos por usuario)
+    awaiting_policy_confirmation: bool
+    context_memory: Dict[str, Any]
\ No newline at end of file
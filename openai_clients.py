@@ -0,0 +1,446 @@
+"""
+Clientes OpenAI compartidos por todo el proceso con control de tasa.
+
+Todas las llamadas (agentes, analizador de certificados, clasificación de
+imágenes) pasan por el mismo cliente y por el mismo controlador por modelo:
+
+- un pool de conexiones HTTP compartido (un cliente por api_key + base_url; el
+  asíncrono, uno por event loop),
+- token buckets por modelo para solicitudes por minuto (RPM) y tokens por
+  minuto (TPM), con la estimación de tokens de cada solicitud,
+- concurrencia AIMD: el límite de solicitudes simultáneas sube de a poco con
+  cada éxito y se reduce a la mitad con cada 429,
+- reintentos con backoff exponencial con jitter (respetando `retry-after`).
+
+`get_rate_limit_metrics()` expone la demora en cola, reintentos y el límite de
+concurrencia vigente de cada modelo.
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import weakref
+import threading
+from collections import deque
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+
+from history_manager import count_tokens
+
+
+# Límites por modelo (RPM, TPM); se pueden sobrescribir con OPENAI_RATE_LIMITS
+# como JSON, p. ej. '{"gpt-4o-mini": [500, 200000]}'
+DEFAULT_RATE_LIMITS = {
+    "gpt-4-turbo-preview": (500, 30000),
+    "gpt-4o": (500, 30000),
+    "gpt-4o-mini": (500, 200000),
+    "gpt-3.5-turbo": (3500, 200000),
+    "default": (500, 30000),
+}
+
+# Tokens que cuenta la API por imagen según el nivel de detalle (aproximado)
+_IMAGE_TOKENS = {"low": 85, "high": 765, "auto": 765}
+
+_RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+
+def _load_rate_limits() -> Dict[str, Tuple[int, int]]:
+    limits = dict(DEFAULT_RATE_LIMITS)
+    if os.environ.get("OPENAI_RATE_LIMITS"):
+        limits.update({model: tuple(value) for model, value in json.loads(os.environ["OPENAI_RATE_LIMITS"]).items()})
+    return limits
+
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    """Tokens que la solicitud consumirá del TPM: prompt estimado + max_tokens"""
+    tokens = 0
+    for message in request.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, str):
+            tokens += count_tokens(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    tokens += count_tokens(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    tokens += _IMAGE_TOKENS.get(part["image_url"].get("detail", "auto"), 765)
+        tokens += 4  # Sobrecarga por mensaje
+    if request.get("tools"):
+        tokens += count_tokens(json.dumps(request["tools"]))
+    return tokens + (request.get("max_tokens") or 1000)
+
+
+class TokenBucket:
+    """Token bucket con reservas: quien pide más de lo disponible espera su turno"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        """Descuenta `amount` y devuelve los segundos a esperar antes de usarlo"""
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def refund(self, amount: float) -> None:
+        """Devuelve tokens reservados de más (uso real menor que el estimado o intento fallido)"""
+        if amount > 0:
+            with self._lock:
+                self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AIMDLimiter:
+    """Límite de concurrencia con incremento aditivo y reducción multiplicativa"""
+
+    def __init__(self, initial: float = 8, minimum: float = 1, maximum: float = 32):
+        self.limit = float(initial)
+        self.minimum = float(minimum)
+        self.maximum = float(maximum)
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight >= int(self.limit):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self, throttled: bool = False) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                # +1 por cada "ventana" completa de éxitos
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class ModelController:
+    """Límites, concurrencia y métricas de un modelo"""
+
+    def __init__(self, model: str, rpm: int, tpm: int, max_concurrency: int, max_retries: int):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AIMDLimiter(initial=min(8, max_concurrency), maximum=max_concurrency)
+        self.max_retries = max_retries
+        self.queue_delays = deque(maxlen=500)
+        self.counts = {"requests": 0, "retries": 0, "throttled": 0, "errors": 0}
+        self._lock = threading.Lock()
+
+    def admission_delay(self, estimated_tokens: int) -> float:
+        """Reserva una solicitud y sus tokens; devuelve la espera necesaria"""
+        return max(self.requests.reserve(1), self.tokens.reserve(estimated_tokens))
+
+    def record(self, key: str, queue_delay: Optional[float] = None) -> None:
+        with self._lock:
+            self.counts[key] += 1
+            if queue_delay is not None:
+                self.queue_delays.append(queue_delay)
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Espera antes del reintento: `retry-after` si viene, si no backoff con jitter"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return random.uniform(0, min(20.0, 0.5 * 2 ** attempt))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            delays = sorted(self.queue_delays)
+            counts = dict(self.counts)
+        counts.update({
+            "concurrency_limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "avg_queue_ms": sum(delays) / len(delays) * 1000 if delays else 0.0,
+            "p95_queue_ms": delays[int(len(delays) * 0.95)] * 1000 if delays else 0.0,
+        })
+        return counts
+
+
+_controllers: Dict[str, ModelController] = {}
+_controllers_lock = threading.Lock()
+
+
+def get_model_controller(model: str) -> ModelController:
+    """Controlador compartido del modelo (se crea al primer uso)"""
+    with _controllers_lock:
+        controller = _controllers.get(model)
+        if controller is None:
+            limits = _load_rate_limits()
+            rpm, tpm = limits.get(model, limits["default"])
+            controller = ModelController(
+                model, rpm, tpm,
+                max_concurrency=int(os.environ.get("OPENAI_MAX_CONCURRENCY", "32")),
+                max_retries=int(os.environ.get("OPENAI_MAX_RETRIES", "4"))
+            )
+            _controllers[model] = controller
+        return controller
+
+
+def get_rate_limit_metrics() -> Dict[str, Dict[str, Any]]:
+    """Solicitudes, reintentos, 429, demora en cola y concurrencia por modelo"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {controller.model: controller.stats() for controller in controllers}
+
+
+def _refund_unused(controller: ModelController, response: Any, estimated_tokens: int) -> None:
+    usage = getattr(response, "usage", None)
+    if usage is not None and getattr(usage, "total_tokens", None):
+        controller.tokens.refund(estimated_tokens - usage.total_tokens)
+
+
+class _ReleasingStream:
+    """Envuelve un stream y libera el cupo de concurrencia al terminar de leerlo"""
+
+    def __init__(self, stream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        try:
+            yield from self._stream
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        if self._release:
+            release, self._release = self._release, None
+            release()
+            self._stream.close()
+
+    def __del__(self):
+        # Stream descartado sin leerse por completo
+        self.close()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class _RateLimitedCompletions:
+    def __init__(self, client, max_retries: Optional[int] = None):
+        self._client = client
+        self._max_retries = max_retries
+
+    def create(self, **request):
+        controller = get_model_controller(request.get("model", "default"))
+        estimated_tokens = estimate_request_tokens(request)
+        max_retries = controller.max_retries if self._max_retries is None else self._max_retries
+        attempt = 0
+
+        while True:
+            queued_at = time.monotonic()
+            delay = controller.admission_delay(estimated_tokens)
+            if delay:
+                time.sleep(delay)
+            controller.concurrency.acquire()
+            controller.record("requests", time.monotonic() - queued_at)
+
+            try:
+                response = self._client.chat.completions.create(**request)
+            except _RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                controller.concurrency.release(throttled=throttled)
+                # El intento fallido no consumió el TPM reservado
+                controller.tokens.refund(estimated_tokens)
+                controller.record("throttled" if throttled else "errors")
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                controller.record("retries")
+                time.sleep(controller.backoff(attempt, e))
+                continue
+            except Exception:
+                controller.concurrency.release()
+                controller.tokens.refund(estimated_tokens)
+                controller.record("errors")
+                raise
+
+            if request.get("stream"):
+                # El cupo se mantiene mientras se consume el stream
+                return _ReleasingStream(response, controller.concurrency.release)
+            controller.concurrency.release()
+            _refund_unused(controller, response, estimated_tokens)
+            return response
+
+
+class _AsyncRateLimitedCompletions:
+    def __init__(self, client, max_retries: Optional[int] = None):
+        self._client = client
+        self._max_retries = max_retries
+
+    async def create(self, **request):
+        controller = get_model_controller(request.get("model", "default"))
+        estimated_tokens = estimate_request_tokens(request)
+        max_retries = controller.max_retries if self._max_retries is None else self._max_retries
+        attempt = 0
+
+        while True:
+            queued_at = time.monotonic()
+            delay = controller.admission_delay(estimated_tokens)
+            if delay:
+                await asyncio.sleep(delay)
+            # Sin bloquear el event loop mientras no haya cupo
+            while not controller.concurrency.try_acquire():
+                await asyncio.sleep(0.02)
+            controller.record("requests", time.monotonic() - queued_at)
+
+            try:
+                response = await self._client.chat.completions.create(**request)
+            except _RETRYABLE_ERRORS as e:
+                throttled = isinstance(e, openai.RateLimitError)
+                controller.concurrency.release(throttled=throttled)
+                # El intento fallido no consumió el TPM reservado
+                controller.tokens.refund(estimated_tokens)
+                controller.record("throttled" if throttled else "errors")
+                if attempt >= max_retries:
+                    raise
+                attempt += 1
+                controller.record("retries")
+                await asyncio.sleep(controller.backoff(attempt, e))
+                continue
+            except BaseException:
+                controller.concurrency.release()
+                controller.tokens.refund(estimated_tokens)
+                controller.record("errors")
+                raise
+
+            controller.concurrency.release()
+            _refund_unused(controller, response, estimated_tokens)
+            return response
+
+
+class _Namespace:
+    def __init__(self, **attributes):
+        self.__dict__.update(attributes)
+
+
+class _LoopLocalAsyncOpenAI:
+    """
+    Un AsyncOpenAI por event loop
+
+    El cliente httpx asíncrono queda atado al loop que lo usa primero; usarlo
+    desde otro loop (otro asyncio.run, otro hilo) falla. Cada loop obtiene el
+    suyo y se descarta cuando el loop se cierra.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str]):
+        self._api_key = api_key
+        self._base_url = base_url
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._lock = threading.Lock()
+
+    def current(self) -> openai.AsyncOpenAI:
+        """Cliente del loop en ejecución (RuntimeError fuera de un loop)"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            client = self._clients.get(loop)
+            if client is None:
+                for closed_loop in [other for other in self._clients if other.is_closed()]:
+                    del self._clients[closed_loop]
+                client = openai.AsyncOpenAI(
+                    api_key=self._api_key, base_url=self._base_url, max_retries=0,
+                    http_client=openai.DefaultAsyncHttpxClient(limits=_pool_limits())
+                )
+                self._clients[loop] = client
+            return client
+
+    def __getattr__(self, name):
+        return getattr(self.current(), name)
+
+
+class RateLimitedClient:
+    """
+    Cliente OpenAI cuyas `chat.completions.create` pasan por el controlador del modelo
+
+    `max_retries` reemplaza los reintentos del controlador para este cliente;
+    con 0 los reintenta quien llama (p. ej. `bulk_ingest`), sin apilar dos capas.
+    """
+
+    def __init__(self, client, max_retries: Optional[int] = None):
+        self.raw = client
+        completions_class = (
+            _AsyncRateLimitedCompletions if isinstance(client, (openai.AsyncOpenAI, _LoopLocalAsyncOpenAI))
+            else _RateLimitedCompletions
+        )
+        self.chat = _Namespace(completions=completions_class(client, max_retries))
+
+    def __getattr__(self, name):
+        # Otros endpoints se usan sin control de tasa
+        return getattr(self.raw, name)
+
+
+_clients: Dict[Tuple[str, Optional[str], bool, Optional[int]], RateLimitedClient] = {}
+_clients_lock = threading.Lock()
+
+
+def _pool_limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=int(os.environ.get("OPENAI_MAX_CONNECTIONS", "64")),
+        max_keepalive_connections=20
+    )
+
+
+def get_openai_client(api_key: str, base_url: Optional[str] = None,
+                      max_retries: Optional[int] = None) -> RateLimitedClient:
+    """Cliente síncrono compartido por api_key y base_url (y `max_retries`, ver RateLimitedClient)"""
+    key = (api_key, base_url, False, max_retries)
+    with _clients_lock:
+        if key not in _clients:
+            # Mismo pool de conexiones para cualquier max_retries
+            shared = _clients.get((api_key, base_url, False, None))
+            if shared is not None:
+                client = shared.raw
+            else:
+                # Los reintentos los hace el controlador (con backoff y métricas propias)
+                client = openai.OpenAI(
+                    api_key=api_key, base_url=base_url, max_retries=0,
+                    http_client=openai.DefaultHttpxClient(limits=_pool_limits())
+                )
+                if max_retries is not None:
+                    _clients[(api_key, base_url, False, None)] = RateLimitedClient(client)
+            _clients[key] = RateLimitedClient(client, max_retries)
+        return _clients[key]
+
+
+def get_async_openai_client(api_key: str, base_url: Optional[str] = None) -> RateLimitedClient:
+    """
+    Cliente asíncrono compartido por api_key y base_url
+
+    Se puede guardar y usar desde cualquier event loop: el AsyncOpenAI
+    subyacente se resuelve por loop en cada llamada (ver _LoopLocalAsyncOpenAI).
+    """
+    key = (api_key, base_url, True, None)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = RateLimitedClient(_LoopLocalAsyncOpenAI(api_key, base_url))
+        return _clients[key]
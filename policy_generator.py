@@ -1,18 +1,57 @@
-import tempfile
-from gtts import gTTS
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Optional, Tuple
+from typing import Dict, Optional, Tuple
 from models import BusinessInfo, Valuation, InsurancePolicy
-import os 
+from tts_backends import TTSBackend, get_tts_backend
+from audio_cache import AudioCache
+
+
+# Un solo hilo de síntesis por proceso: la póliza se entrega al instante y el
+# audio aparece en disco cuando está listo
+_audio_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts")
+_pending_audio: Dict[str, Future] = {}
+_pending_lock = threading.Lock()
+
+
+def audio_status(audio_path: Optional[str]) -> str:
+    """Estado de un audio: 'ready', 'pending', 'failed' o 'missing'"""
+    if not audio_path:
+        return "missing"
+    if os.path.exists(audio_path):
+        return "ready"
+
+    with _pending_lock:
+        future = _pending_audio.get(audio_path)
+    if future is None:
+        return "missing"
+    if not future.done():
+        return "pending"
+    return "failed" if future.exception() else "ready"
+
+
+def wait_for_audio(audio_path: str, timeout: Optional[float] = None) -> bool:
+    """Espera a que termine la síntesis de un audio; True si quedó disponible"""
+    with _pending_lock:
+        future = _pending_audio.get(audio_path)
+    if future is not None:
+        try:
+            future.result(timeout=timeout)
+        except Exception:
+            return False
+    return os.path.exists(audio_path)
+
+
 class PolicyGenerator:
     """Generador de pólizas de seguro y contenido de audio"""
     
-    def __init__(self):
+    def __init__(self, tts_backend: Optional[TTSBackend] = None, audio_cache: Optional[AudioCache] = None):
         self.company_name = "Seguros Pacífico"
         self.policy_version = "2024.1"
-        import tempfile
-        import os
-        self.temp_dir = tempfile.mkdtemp(prefix="seguros_audio_")
+        self.tts_backend = tts_backend or get_tts_backend()
+        self.audio_cache = audio_cache or AudioCache()
+
     def generate_policy(self, business_info: BusinessInfo, valuation: Valuation) -> InsurancePolicy:
         """
         Genera la póliza de seguro completa
@@ -153,14 +192,22 @@ www.segurospacifico.com.pe | Lima, Perú
 *Fecha y hora: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}*
 """
     
-    def generate_audio_summary(self, business_info: BusinessInfo, valuation: Valuation, policy: InsurancePolicy) -> Tuple[Optional[str], Optional[str]]:
+    def generate_audio_summary(self, business_info: BusinessInfo, valuation: Valuation, policy: InsurancePolicy,
+                               background: bool = False) -> Tuple[Optional[str], Optional[str]]:
         """
-        Genera resumen en audio usando gTTS - CORREGIDO PARA PERSISTENCIA
+        Genera resumen en audio con el motor TTS configurado
+        
+        El audio se guarda en una caché direccionada por el hash del guion: si el
+        mismo guion ya se sintetizó, se devuelve el archivo existente sin llamar
+        al motor.
         
         Args:
             business_info: Información del negocio
             valuation: Valuación del negocio
             policy: Póliza generada
+            background: Si es True, la síntesis se encola en el hilo de audio y
+                se devuelve de inmediato la ruta donde aparecerá el archivo
+                (ver `audio_status`)
         
         Returns:
             Tuple[str, str]: (ruta_archivo_audio, texto_resumen)
@@ -172,16 +219,26 @@ www.segurospacifico.com.pe | Lima, Perú
             summary_text = self._generate_audio_script(business_info, valuation, policy)
             print(f"[DEBUG] Script generado: {len(summary_text)} caracteres")
             
-            # Crear archivo temporal persistente en nuestro directorio
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            audio_filename = f"resumen_poliza_{timestamp}.wav"
-            audio_path = os.path.join(self.temp_dir, audio_filename)
+            backend = self.tts_backend
+            key = self.audio_cache.key(backend.name, summary_text)
+            cached_path = self.audio_cache.get(key, backend.extension)
+            if cached_path:
+                print(f"[DEBUG] Audio recuperado de caché: {cached_path}")
+                return cached_path, summary_text
+            
+            audio_path = self.audio_cache.path(key, backend.extension)
             
-            print(f"[DEBUG] Generando archivo de audio en: {audio_path}")
+            with _pending_lock:
+                future = _pending_audio.get(audio_path)
+                if future is None or (future.done() and future.exception()):
+                    print(f"[DEBUG] Encolando síntesis ({backend.name}) en: {audio_path}")
+                    future = _audio_executor.submit(self._synthesize_to_cache, key, summary_text)
+                    _pending_audio[audio_path] = future
             
-            # Generar audio con gTTS
-            tts = gTTS(text=summary_text, lang='es', slow=False)
-            tts.save(audio_path)
+            if background:
+                return audio_path, summary_text
+            
+            future.result()
             
             # Verificar que el archivo se creó correctamente
             if os.path.exists(audio_path):
@@ -198,6 +255,24 @@ www.segurospacifico.com.pe | Lima, Perú
             traceback.print_exc()
             return None, None
     
+    def _synthesize_to_cache(self, key: str, summary_text: str) -> str:
+        """Sintetiza el guion y lo guarda en la caché (se ejecuta en el hilo de audio)"""
+        backend = self.tts_backend
+        try:
+            audio_bytes = backend.synthesize(summary_text)
+            audio_path = self.audio_cache.put(key, backend.extension, audio_bytes)
+            print(f"[DEBUG] Audio sintetizado ({backend.name}): {audio_path} ({len(audio_bytes)} bytes)")
+            return audio_path
+        except Exception as e:
+            print(f"[DEBUG] Error sintetizando audio: {str(e)}")
+            raise
+        finally:
+            # Las entradas fallidas se conservan para reportar 'failed'
+            audio_path = self.audio_cache.path(key, backend.extension)
+            if os.path.exists(audio_path):
+                with _pending_lock:
+                    _pending_audio.pop(audio_path, None)
+    
     def _generate_audio_script(self, business_info: BusinessInfo, valuation: Valuation, policy: InsurancePolicy) -> str:
         """Genera el script para el audio - MEJORADO"""
         
@@ -244,16 +319,13 @@ Tu póliza está vigente desde hoy y por los próximos doce meses.
         """.strip()
     
     def cleanup_audio_files(self):
-        """Limpia archivos de audio temporales antiguos"""
+        """Limpia los audios guardados en caché"""
         try:
-            import shutil
-            import os
-            if hasattr(self, 'temp_dir') and os.path.exists(self.temp_dir):
-                files = os.listdir(self.temp_dir)
-                print(f"[DEBUG] Limpiando {len(files)} archivos de audio temporales")
-                shutil.rmtree(self.temp_dir)
+            removed = self.audio_cache.clear()
+            print(f"[DEBUG] Limpiando {removed} archivos de audio en caché")
         except Exception as e:
-            print(f"[DEBUG] Error limpiando archivos temporales: {str(e)}")
+            print(f"[DEBUG] Error limpiando archivos de audio: {str(e)}")
+    
     def generate_quote_summary(self, business_info: BusinessInfo, valuation: Valuation) -> str:
         """
         Genera un resumen de cotización antes de la póliza final
@@ -0,0 +1,229 @@
+"""
+Tablas de tarifas versionadas para `ValuationEngine`.
+
+Los factores por m², los multiplicadores por zona, la tasa de cambio y las tasas
+de riesgo se leen de un archivo (JSON, CSV o Parquet) y se compilan en arreglos
+densos indexados por códigos enteros de tipo de negocio y de zona. Un hilo en
+segundo plano vigila el archivo y, cuando cambia, compila la tabla nueva y la
+publica reemplazando una sola referencia: la lectura no usa locks y cada
+valuación trabaja con una única versión de principio a fin.
+
+Formato CSV/Parquet (una fila por valor):
+    seccion,clave,campo,valor
+    meta,version,,2025-09-01.1
+    meta,tasa_cambio,,3.8
+    negocio,restaurante,inventario,200
+    negocio,restaurante,tasa_riesgo,0.0056
+    ubicacion,lima,multiplicador,1.2
+
+Para publicar una tabla nueva sin que un worker lea un archivo a medio escribir,
+conviene escribirla aparte y moverla encima (os.replace / mv).
+"""
+
+import os
+import csv
+import json
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+
+DEFAULT_RATE_TABLES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rate_tables.json")
+FACTOR_FIELDS = ("inventario", "mobiliario", "infraestructura")
+
+
+class RateTable:
+    """Tabla de tarifas compilada e inmutable"""
+
+    def __init__(self, version: str, tasa_cambio: float, negocios: Dict[str, Dict[str, float]],
+                 ubicaciones: Dict[str, float], source: Optional[str] = None):
+        if "default" not in negocios or "default" not in ubicaciones:
+            raise ValueError("La tabla de tarifas debe incluir la clave 'default' en negocios y ubicaciones")
+        if "tasa_riesgo" not in negocios["default"]:
+            raise ValueError("Falta la tasa_riesgo del negocio 'default'")
+        if float(tasa_cambio) <= 0:
+            raise ValueError(f"tasa_cambio inválida: {tasa_cambio}")
+
+        self.version = str(version)
+        self.tasa_cambio = float(tasa_cambio)
+        self.source = source
+
+        # Códigos enteros = posición en la tabla
+        self.business_keys: Tuple[str, ...] = tuple(negocios)
+        self.business_codes = {key: code for code, key in enumerate(self.business_keys)}
+        self.default_business_code = self.business_codes["default"]
+        default_rate = float(negocios["default"]["tasa_riesgo"])
+        for key, values in negocios.items():
+            missing = [field for field in FACTOR_FIELDS if field not in values]
+            if missing:
+                raise ValueError(f"Faltan {', '.join(missing)} para el negocio '{key}'")
+
+        self.inventario = tuple(float(negocios[key]["inventario"]) for key in self.business_keys)
+        self.mobiliario = tuple(float(negocios[key]["mobiliario"]) for key in self.business_keys)
+        self.infraestructura = tuple(float(negocios[key]["infraestructura"]) for key in self.business_keys)
+        self.tasa_riesgo = tuple(float(negocios[key].get("tasa_riesgo", default_rate)) for key in self.business_keys)
+
+        self.location_keys: Tuple[str, ...] = tuple(ubicaciones)
+        self.location_codes = {key: code for code, key in enumerate(self.location_keys)}
+        self.default_location_code = self.location_codes["default"]
+        self.multiplicador = tuple(float(ubicaciones[key]) for key in self.location_keys)
+
+    def business_code(self, key: str) -> int:
+        """Código del tipo de negocio ('default' si la tabla no lo tiene)"""
+        return self.business_codes.get(key, self.default_business_code)
+
+    def location_code(self, key: str) -> int:
+        """Código de la zona ('default' si la tabla no la tiene)"""
+        return self.location_codes.get(key, self.default_location_code)
+
+    def factores(self) -> Dict[str, Dict[str, float]]:
+        """Factores por tipo de negocio en el formato de diccionario anterior"""
+        return {
+            key: {
+                "inventario": self.inventario[code],
+                "mobiliario": self.mobiliario[code],
+                "infraestructura": self.infraestructura[code]
+            }
+            for code, key in enumerate(self.business_keys)
+        }
+
+    def multiplicadores_ubicacion(self) -> Dict[str, float]:
+        """Multiplicadores por zona en el formato de diccionario anterior"""
+        return dict(zip(self.location_keys, self.multiplicador))
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], source: Optional[str] = None) -> "RateTable":
+        for field in ("version", "tasa_cambio", "negocios", "ubicaciones"):
+            if field not in data:
+                raise ValueError(f"Falta '{field}' en la tabla de tarifas")
+        return cls(data["version"], data["tasa_cambio"], data["negocios"], data["ubicaciones"], source)
+
+
+def _rows_to_dict(rows) -> Dict[str, Any]:
+    """Convierte filas (seccion, clave, campo, valor) al formato JSON"""
+    data: Dict[str, Any] = {"negocios": {}, "ubicaciones": {}}
+    for row in rows:
+        section = str(row["seccion"]).strip()
+        key = str(row["clave"]).strip()
+        value = row["valor"]
+        if section == "meta":
+            data[key] = str(value).strip() if key == "version" else float(value)
+        elif section == "negocio":
+            data["negocios"].setdefault(key, {})[str(row["campo"]).strip()] = float(value)
+        elif section == "ubicacion":
+            data["ubicaciones"][key] = float(value)
+        else:
+            raise ValueError(f"Sección desconocida en la tabla de tarifas: {section}")
+    return data
+
+
+def load_rate_table(path: str) -> RateTable:
+    """Lee y compila una tabla de tarifas desde JSON, CSV o Parquet"""
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".json":
+        with open(path, "r", encoding="utf-8") as table_file:
+            data = json.load(table_file)
+    elif extension == ".csv":
+        with open(path, "r", encoding="utf-8", newline="") as table_file:
+            data = _rows_to_dict(csv.DictReader(table_file))
+    elif extension == ".parquet":
+        import pandas as pd
+
+        data = _rows_to_dict(pd.read_parquet(path).to_dict("records"))
+    else:
+        raise ValueError(f"Formato de tabla de tarifas no soportado: {extension}")
+    return RateTable.from_dict(data, source=path)
+
+
+class RateTableStore:
+    """Tabla de tarifas vigente con recarga en caliente al cambiar el archivo"""
+
+    def __init__(self, path: Optional[str] = None, poll_interval: Optional[float] = None):
+        self.path = path or os.environ.get("RATE_TABLES_PATH", DEFAULT_RATE_TABLES_PATH)
+        self.poll_interval = poll_interval or float(os.environ.get("RATE_TABLES_POLL_SECONDS", "5"))
+        self.reload_count = 0
+        self.last_error: Optional[str] = None
+        self._reload_lock = threading.Lock()
+        self._signature: Optional[Tuple[int, int]] = None
+        self._failed_signature: Optional[Tuple[int, int]] = None
+        self._watch_thread: Optional[threading.Thread] = None
+        self._stop_watch = threading.Event()
+        # La carga inicial falla con excepción: sin tabla no hay valuación posible
+        self._signature = self._file_signature()
+        self._table: RateTable = load_rate_table(self.path)
+
+    @property
+    def table(self) -> RateTable:
+        """Tabla vigente; sin lock, la referencia se reemplaza de una sola vez al recargar"""
+        return self._table
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def reload(self, force: bool = False) -> bool:
+        """
+        Recarga la tabla si el archivo cambió
+
+        Returns:
+            bool: True si se publicó una tabla nueva. Si el archivo nuevo es
+                inválido se conserva la tabla vigente.
+        """
+        with self._reload_lock:
+            signature = None
+            try:
+                signature = self._file_signature()
+                # Un archivo inválido se reintenta recién cuando vuelve a cambiar
+                if not force and signature in (self._signature, self._failed_signature):
+                    return False
+                table = load_rate_table(self.path)
+            except Exception as e:
+                self._failed_signature = signature
+                self.last_error = f"{type(e).__name__}: {str(e)}"
+                print(f"[DEBUG] No se pudo recargar la tabla de tarifas {self.path}: {self.last_error}")
+                return False
+
+            previous_version = self._table.version
+            self._table = table
+            self._signature = signature
+            self._failed_signature = None
+            self.reload_count += 1
+            self.last_error = None
+            print(f"[DEBUG] Tabla de tarifas recargada: {previous_version} -> {table.version}")
+            return True
+
+    def start_watching(self) -> None:
+        """Lanza un hilo en segundo plano que revisa el archivo cada `poll_interval` segundos"""
+        if self._watch_thread and self._watch_thread.is_alive():
+            return
+
+        self._stop_watch.clear()
+
+        def _run():
+            while not self._stop_watch.wait(self.poll_interval):
+                self.reload()
+
+        self._watch_thread = threading.Thread(target=_run, name="rate-table-watch", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self) -> None:
+        """Detiene el hilo de revisión"""
+        self._stop_watch.set()
+        if self._watch_thread:
+            self._watch_thread.join(timeout=5)
+            self._watch_thread = None
+
+
+_store: Optional[RateTableStore] = None
+_store_lock = threading.Lock()
+
+
+def get_rate_table_store() -> RateTableStore:
+    """Tabla de tarifas del proceso, vigilada por un único hilo"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                store = RateTableStore()
+                store.start_watching()
+                _store = store
+    return _store
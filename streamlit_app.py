@@ -1,27 +1,39 @@
 import streamlit as st
 import os
-import openai
 import base64
 import io
 from PIL import Image
 from datetime import datetime
-import tempfile
-import traceback
 import uuid
+import hashlib
+from typing import TYPE_CHECKING, Optional, Tuple
+from streamlit.errors import StreamlitAPIException
 
-# Importar módulos personalizados
-from models import GraphState, ConversationStep, BusinessInfo, SerializableImage
-from insurance_graph import InsuranceAgentGraph,LLMControlledInsuranceAgent
-from certificate_analyzer import extract_text_from_document
+# Importar módulos personalizados (solo los livianos: langgraph, openai y el
+# agente se importan al usarlos para que el arranque en frío sea rápido)
+from models import BusinessInfo, ImageRef, new_context_memory
+from document_text import extract_text_from_document
+from image_classifier import LocalImageClassifier, UNSURE
+from upload_pipeline import UploadPipeline, build_upload_summary
+from policy_generator import audio_status
+from tts_backends import audio_mime_type
 
-# NUEVO: Import del agente LLM modificado
-from llm_controlled_agent import LLMControlledInsuranceAgent
+if TYPE_CHECKING:
+    from llm_controlled_agent import LLMControlledInsuranceAgent
+
+@st.cache_resource
+def get_insurance_agent(api_key: str) -> "LLMControlledInsuranceAgent":
+    """Agente compartido por todas las sesiones (los datos de cada una van en graph_state)"""
+    # Import diferido: trae openai y el resto del agente recién al configurar la primera sesión
+    from llm_controlled_agent import LLMControlledInsuranceAgent
+
+    return LLMControlledInsuranceAgent(api_key)
 
 def setup_insurance_agent(api_key: str):
     """Configura el agente de seguros controlado por LLM - CORREGIDO"""
     try:
         if not st.session_state.get("insurance_agent"):
-            st.session_state.insurance_agent = LLMControlledInsuranceAgent(api_key)
+            st.session_state.insurance_agent = get_insurance_agent(api_key)
             st.session_state.graph_state = create_initial_state()
             
             # Mensaje de bienvenida inicial
@@ -50,6 +62,8 @@ def create_initial_state() -> dict:
     """Crea el estado inicial simplificado"""
     return {
         "messages": [],
+        "history_summary": None,
+        "history_summarized_count": 0,
         "business_info": BusinessInfo(),
         "valuation": None,
         "certificate_text": None,
@@ -62,7 +76,10 @@ def create_initial_state() -> dict:
         "timestamp": datetime.now().isoformat(),
         "show_policy_buttons": False,
         "policy_generated": False,
-        "show_download_buttons": False
+        "show_download_buttons": False,
+        "tool_latencies": [],
+        "awaiting_policy_confirmation": False,
+        "context_memory": new_context_memory()
     }
 
 def debug_log(message, data=None):
@@ -71,11 +88,24 @@ def debug_log(message, data=None):
     if data:
         print(f"[DEBUG DATA] {data}")
 
+# Mensajes de la conversación que se dibujan en cada rerun (los anteriores, a pedido)
+CHAT_RENDER_WINDOW = max(2, int(os.environ.get("CHAT_RENDER_WINDOW", "30")))
+
+# Clasificar y extraer en una sola llamada a Vision cuando el clasificador local duda
+MERGE_CLASSIFY_AND_EXTRACT = os.environ.get("MERGE_CLASSIFY_AND_EXTRACT", "1") == "1"
+
+@st.cache_resource
+def get_image_classifier() -> LocalImageClassifier:
+    """Clasificador local compartido por todas las sesiones"""
+    return LocalImageClassifier()
+
 def classify_image_type(image: Image.Image, api_key: str) -> str:
     """Clasifica si una imagen es un certificado o foto del local usando GPT-4 Vision"""
     try:
+        from openai_clients import get_openai_client
+
         debug_log("Iniciando clasificación de imagen")
-        client = openai.OpenAI(api_key=api_key)
+        client = get_openai_client(api_key)
         
         # Convertir imagen a base64
         buffer = io.BytesIO()
@@ -134,15 +164,28 @@ def process_uploaded_image_llm(uploaded_file, graph_state, insurance_agent, api_
         
         # Convertir a PIL Image
         pil_image = Image.open(uploaded_file)
+        certificate_image = pil_image
         
-        # Clasificar tipo de imagen
-        image_type = classify_image_type(pil_image, api_key)
+        # Clasificar primero en local (CPU); solo se consulta al LLM si no hay certeza
+        image_type, confidence = get_image_classifier().classify(pil_image)
+        debug_log(f"Clasificación local: {image_type} (confianza {confidence:.2f})")
+        
+        if image_type == UNSURE:
+            if MERGE_CLASSIFY_AND_EXTRACT:
+                # Una sola llamada a Vision: clasifica y deja la extracción en caché
+                # para la misma imagen guardada que luego analizará el agente
+                certificate_image = ImageRef.from_pil_image(pil_image, "certificado.jpg")
+                image_type, _ = insurance_agent.certificate_analyzer.classify_and_analyze(
+                    certificate_image.to_pil_image()
+                )
+            else:
+                image_type = classify_image_type(pil_image, api_key)
         debug_log(f"Tipo de imagen detectado: {image_type}")
         
         if image_type == "certificate":
             # Procesar certificado automáticamente
             debug_log("Procesando certificado automáticamente...")
-            graph_state = insurance_agent.process_certificate_image(graph_state, pil_image)
+            graph_state = insurance_agent.process_certificate_image(graph_state, certificate_image)
             
             # AUTOMÁTICO: Hacer que el LLM procese y cotice inmediatamente
             graph_state = insurance_agent.process_conversation(
@@ -178,6 +221,61 @@ def initialize_session_state():
     if "graph_state" not in st.session_state:
         st.session_state.graph_state = None
 
+def sidebar_signature(state: Optional[dict]) -> tuple:
+    """Datos que muestran los paneles laterales; si cambian tras un turno del chat, se rerenderiza todo"""
+    if not state:
+        return ()
+    business_info = state.get("business_info") or BusinessInfo()
+    valuation = state.get("valuation")
+    return (
+        tuple(sorted(business_info.to_dict().items())),
+        valuation.total if valuation else None,
+        id(state.get("policy")),
+        state.get("audio_file")
+    )
+
+def rerun_after_turn(signature_before: tuple):
+    """Tras un turno en el chat: rerun del fragmento si los paneles siguen válidos, de la app si no"""
+    if sidebar_signature(st.session_state.graph_state) == signature_before:
+        try:
+            st.rerun(scope="fragment")
+        except StreamlitAPIException:
+            # El fragmento corrió dentro de un rerun completo de la app
+            pass
+    st.rerun()
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _read_artifact(path: str, mtime_ns: int, size: int) -> bytes:
+    """Bytes de un archivo generado; la ruta ya es el hash del contenido y mtime/tamaño invalidan la caché"""
+    with open(path, "rb") as artifact_file:
+        return artifact_file.read()
+
+def artifact_bytes(path: str) -> Optional[bytes]:
+    """Bytes memoizados del audio u otro archivo generado, o None si aún no existe"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return _read_artifact(path, stat.st_mtime_ns, stat.st_size)
+
+@st.cache_data(max_entries=64, show_spinner=False)
+def _encode_policy(content_hash: str, _content: str) -> bytes:
+    return _content.encode("utf-8")
+
+def policy_artifact(policy) -> Tuple[bytes, str]:
+    """Bytes de la póliza y un nombre de archivo estable, memoizados por hash del contenido"""
+    content_hash = hashlib.sha256(policy.content.encode("utf-8")).hexdigest()
+    return _encode_policy(content_hash, policy.content), f"poliza_seguro_{content_hash[:12]}.txt"
+
+@st.fragment
+def render_sidebar_panels():
+    """Progreso e información del negocio; se rerenderizan solos sin tocar el chat"""
+    render_progress_panel()
+    
+    st.divider()
+    
+    render_business_info_panel()
+
 def render_progress_panel():
     """Renderiza el panel de progreso"""
     st.subheader("📊 Progreso del Seguro")
@@ -234,6 +332,7 @@ def render_business_info_panel():
         if valuation:
             st.write(f"**Valor estimado:** S/ {valuation.total:,.2f}")
 
+@st.fragment
 def render_downloads_panel():
     """Renderiza el panel de descargas"""
     if not st.session_state.graph_state:
@@ -246,13 +345,14 @@ def render_downloads_panel():
         
         # Descargar póliza
         if state.get("policy"):
-            policy_content = state["policy"].content
+            policy_data, policy_filename = policy_artifact(state["policy"])
             st.download_button(
                 "📄 Descargar Póliza",
-                data=policy_content,
-                file_name=f"poliza_seguro_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",
+                data=policy_data,
+                file_name=policy_filename,
                 mime="text/plain",
-                use_container_width=True
+                use_container_width=True,
+                on_click="ignore"
             )
             st.success("✅ Póliza lista para descargar")
         
@@ -260,23 +360,29 @@ def render_downloads_panel():
         if state.get("audio_file"):
             audio_file_path = state["audio_file"]
             
+            audio_mime = audio_mime_type(audio_file_path)
+            
             try:
-                if os.path.exists(audio_file_path):
-                    with open(audio_file_path, 'rb') as audio_file:
-                        audio_data = audio_file.read()
-                    
+                audio_data = artifact_bytes(audio_file_path)
+                if audio_data is not None:
                     st.download_button(
                         "🔊 Descargar Audio",
                         data=audio_data,
-                        file_name=f"resumen_poliza_{datetime.now().strftime('%Y%m%d_%H%M')}.wav",
-                        mime="audio/wav",
-                        use_container_width=True
+                        file_name=os.path.basename(audio_file_path),
+                        mime=audio_mime,
+                        use_container_width=True,
+                        on_click="ignore"
                     )
                     
                     # Reproductor de audio
-                    st.audio(audio_data, format='audio/wav')
+                    st.audio(audio_data, format=audio_mime)
                     st.success("✅ Audio listo para descargar")
                     
+                elif audio_status(audio_file_path) == "pending":
+                    st.info("⏳ Generando resumen en audio...")
+                    # El clic rerenderiza solo este panel
+                    st.button("🔄 Actualizar", key="refresh_audio_panel")
+                    
                 else:
                     st.error("❌ Archivo de audio no encontrado")
                     
@@ -292,42 +398,66 @@ def render_download_buttons_in_chat():
         st.markdown("### 📥 Tus documentos están listos:")
         
         # Botón de descarga de póliza (mantener como estaba)
-        policy_content = state["policy"].content
+        policy_data, policy_filename = policy_artifact(state["policy"])
         st.download_button(
             "📄 Descargar Póliza",
-            data=policy_content,
-            file_name=f"poliza_seguro_{datetime.now().strftime('%Y%m%d_%H%M')}.txt",
+            data=policy_data,
+            file_name=policy_filename,
             mime="text/plain",
             use_container_width=True,
-            type="primary"
+            type="primary",
+            on_click="ignore",
+            key="download_policy_chat"
         )
         
         st.markdown("---")
         
         # Reproductor de audio integrado
         audio_file_path = state["audio_file"]
+        audio_mime = audio_mime_type(audio_file_path)
         try:
-            if os.path.exists(audio_file_path):
-                with open(audio_file_path, 'rb') as audio_file:
-                    audio_data = audio_file.read()
-                
+            audio_data = artifact_bytes(audio_file_path)
+            if audio_data is not None:
                 st.markdown("### 🔊 Resumen en audio de tu póliza:")
-                st.audio(audio_data, format='audio/wav')
+                st.audio(audio_data, format=audio_mime)
                 
                 # Opcional: Botón pequeño de descarga del audio también
                 st.download_button(
                     "💾 Descargar Audio",
                     data=audio_data,
-                    file_name=f"resumen_poliza_{datetime.now().strftime('%Y%m%d_%H%M')}.wav",
-                    mime="audio/wav",
-                    help="Descarga el archivo de audio para guardarlo"
+                    file_name=os.path.basename(audio_file_path),
+                    mime=audio_mime,
+                    help="Descarga el archivo de audio para guardarlo",
+                    on_click="ignore",
+                    key="download_audio_chat"
                 )
                 
+            elif audio_status(audio_file_path) == "pending":
+                # La síntesis corre en segundo plano; la póliza ya está disponible
+                st.info("⏳ Tu resumen en audio se está generando, estará listo en unos segundos.")
+                # Está dentro del fragmento del chat: el clic solo rerenderiza la conversación
+                st.button("🔄 Actualizar", key="refresh_audio_chat")
+                
             else:
                 st.error("Audio no disponible")
         except Exception as e:
             st.error(f"Error cargando el audio: {str(e)}")
 
+def render_message_history(messages: list, window: int):
+    """Dibuja los mensajes previos al último; los más antiguos quedan tras un interruptor"""
+    older_count = max(0, len(messages) - window)
+    if older_count and st.toggle(f"Mostrar {older_count} mensaje(s) anteriores", key="show_older_messages"):
+        visible = messages
+    else:
+        visible = messages[older_count:]
+    
+    for message in visible:
+        if message["role"] == "user":
+            st.chat_message("user", avatar="👤").write(message["content"])
+        else:
+            st.chat_message("assistant", avatar="🤖").write(message["content"])
+
+@st.fragment
 def render_enhanced_conversation_llm():
     """Renderiza la conversación con botones de confirmación corregidos"""
     st.subheader("💬 Conversación con tu Agente de Seguros IA")
@@ -336,10 +466,17 @@ def render_enhanced_conversation_llm():
         st.warning("Configura tu API Key para comenzar")
         return
     
-    # Mostrar mensajes de la conversación
-    messages = st.session_state.graph_state.get("messages", [])
+    # Solo se dibujan los últimos CHAT_RENDER_WINDOW mensajes: el rerun no crece con la conversación
+    state = st.session_state.graph_state
+    messages = state.get("messages", [])
+    signature_before = sidebar_signature(state)
     
-    for i, message in enumerate(messages):
+    if messages:
+        render_message_history(messages[:-1], CHAT_RENDER_WINDOW - 1)
+        
+        # Solo el último mensaje puede llevar botones de confirmación o de descarga
+        i = len(messages) - 1
+        message = messages[-1]
         if message["role"] == "user":
             st.chat_message("user", avatar="👤").write(message["content"])
         else:
@@ -347,15 +484,11 @@ def render_enhanced_conversation_llm():
                 st.write(message["content"])
                 
                 # CONDICIONES PARA MOSTRAR BOTONES DE CONFIRMACIÓN
-                is_last_message = (i == len(messages) - 1)
-                is_assistant = (message["role"] == "assistant")
-                has_valuation = bool(st.session_state.graph_state.get("valuation"))
-                no_policy = not bool(st.session_state.graph_state.get("policy"))
+                has_valuation = bool(state.get("valuation"))
+                no_policy = not bool(state.get("policy"))
                 mentions_policy = ("póliza" in message["content"].lower() or "poliza" in message["content"].lower())
                 
-                should_show_confirmation = (is_last_message and is_assistant and has_valuation and no_policy and mentions_policy)
-                
-
+                should_show_confirmation = (has_valuation and no_policy and mentions_policy)
                 
                 # MOSTRAR BOTONES DE CONFIRMACIÓN SI CUMPLE CONDICIONES
                 if should_show_confirmation:
@@ -372,7 +505,7 @@ def render_enhanced_conversation_llm():
                                     st.session_state.graph_state, 
                                     "sí, confirmo generar póliza"
                                 )
-                            st.rerun()
+                            rerun_after_turn(signature_before)
                     
                     with col2:
                         if st.button("❌ NO, DESPUÉS", key=f"confirm_no_{i}", type="secondary", use_container_width=True):
@@ -380,12 +513,10 @@ def render_enhanced_conversation_llm():
                                 st.session_state.graph_state, 
                                 "no, generar después"
                             )
-                            st.rerun()
+                            rerun_after_turn(signature_before)
                 
                 # MOSTRAR BOTONES DE DESCARGA SI LA PÓLIZA ESTÁ LISTA
-                elif (is_last_message and 
-                      st.session_state.graph_state.get("policy") and 
-                      st.session_state.graph_state.get("audio_file")):
+                elif state.get("policy") and state.get("audio_file"):
                     render_download_buttons_in_chat()
     
     # Input para nuevos mensajes
@@ -426,49 +557,65 @@ def render_enhanced_conversation_llm():
             user_message = str(prompt)
             uploaded_files = []
         
-        # Procesar imágenes primero (si las hay)
+        # Procesar imágenes primero (si las hay), todas en paralelo
+        upload_message = ""
         if uploaded_files:
             if not isinstance(uploaded_files, list):
                 uploaded_files = [uploaded_files]
-                
-            for uploaded_file in uploaded_files:
-                debug_log(f"Procesando imagen: {uploaded_file.name}")
-                
-                with st.spinner(f"Analizando {uploaded_file.name}..."):
-                    try:
-                        # Procesar la imagen con el agente LLM modificado
-                        new_state, response_msg = process_uploaded_image_llm(
-                            uploaded_file, 
-                            st.session_state.graph_state,
-                            st.session_state.insurance_agent,
-                            st.session_state.api_key
-                        )
-                        
-                        # Actualizar el estado
-                        st.session_state.graph_state = new_state
-                        debug_log(f"Imagen {uploaded_file.name} procesada exitosamente")
-                        
-                    except Exception as e:
-                        debug_log(f"Error procesando imagen: {str(e)}")
-                        st.error(f"Error procesando imagen: {str(e)}")
-        
-        # Procesar mensaje de texto (si lo hay)
-        if user_message and user_message.strip():
-            with st.spinner("Procesando mensaje..."):
+            
+            debug_log(f"Procesando {len(uploaded_files)} imagen(es) en paralelo")
+            
+            with st.spinner(f"Analizando {len(uploaded_files)} archivo(s)..."):
                 try:
-                    # Usar el agente LLM para procesar la conversación
-                    st.session_state.graph_state = st.session_state.insurance_agent.process_conversation(
-                        st.session_state.graph_state, 
-                        user_message
+                    # Los workers del pipeline no tienen contexto de Streamlit:
+                    # session_state se lee aquí, en el hilo del script
+                    api_key = st.session_state.api_key
+                    pipeline = UploadPipeline(
+                        st.session_state.insurance_agent.certificate_analyzer,
+                        classifier=get_image_classifier(),
+                        fallback_classifier=lambda image: classify_image_type(image, api_key),
+                        merge_classify_and_extract=MERGE_CLASSIFY_AND_EXTRACT
                     )
-                    debug_log("Mensaje de texto procesado exitosamente")
+                    results = pipeline.process(uploaded_files)
+                    
+                    st.session_state.graph_state = st.session_state.insurance_agent.apply_upload_results(
+                        st.session_state.graph_state, results
+                    )
+                    upload_message = build_upload_summary(results)
+                    
+                    for result in results:
+                        if result.error:
+                            st.error(f"Error procesando {result.filename}: {result.error}")
+                    debug_log("Imágenes procesadas exitosamente")
+                    
+                except Exception as e:
+                    debug_log(f"Error procesando imágenes: {str(e)}")
+                    st.error(f"Error procesando imágenes: {str(e)}")
+        
+        # Un solo turno del agente para las subidas y el texto del usuario
+        turn_message = "\n\n".join(
+            part for part in [upload_message, (user_message or "").strip()] if part
+        )
+        if turn_message:
+            st.chat_message("user", avatar="👤").write(turn_message)
+            with st.chat_message("assistant", avatar="🤖"):
+                try:
+                    # La respuesta se muestra a medida que llegan los tokens;
+                    # el agente actualiza graph_state en el mismo diccionario
+                    st.write_stream(
+                        st.session_state.insurance_agent.process_conversation_stream(
+                            st.session_state.graph_state, 
+                            turn_message
+                        )
+                    )
+                    debug_log("Mensaje procesado exitosamente")
                 except Exception as e:
                     debug_log(f"Error en la conversación: {str(e)}")
                     st.error(f"Error en la conversación: {str(e)}")
         
-        # Si se procesó algo, recargar la página
-        if (uploaded_files and len(uploaded_files) > 0) or (user_message and user_message.strip()):
-            st.rerun()
+        # Si se procesó algo, recargar la conversación (y los paneles si cambiaron)
+        if uploaded_files or turn_message:
+            rerun_after_turn(signature_before)
     
     # Información adicional
     st.info("🚀 **Proceso automatizado** - Solo sube tu certificado y recibe tu cotización al instante")
@@ -484,10 +631,6 @@ st.set_page_config(
 
 
 
-
-import streamlit as st
-import streamlit.components.v1 as components
-
 def load_pacifico_styles():
     """Carga los estilos de PacÃ­fico Seguros con carrusel"""
     
@@ -822,16 +965,38 @@ def load_pacifico_styles():
     }
     </style>
     """)
-import streamlit as st, base64, pathlib
+# Imagen del carrusel: se muestra a 250x200 px, así que basta una versión reducida
+HERO_IMAGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "file.png")
+HERO_IMAGE_MAX_WIDTH = 500
+
+@st.cache_data(show_spinner=False)
+def _image_data_uri(path: str, mtime: float, max_width: int) -> str:
+    """Reduce y codifica la imagen una vez por proceso (el mtime invalida la caché)"""
+    with Image.open(path) as image:
+        image.thumbnail((max_width, max_width))
+        buffer = io.BytesIO()
+        if image.mode in ("RGBA", "LA", "P"):
+            image.save(buffer, format="PNG", optimize=True)
+            mime = "image/png"
+        else:
+            image.convert("RGB").save(buffer, format="JPEG", quality=85, optimize=True)
+            mime = "image/jpeg"
+    return f"data:{mime};base64,{base64.b64encode(buffer.getvalue()).decode('utf-8')}"
+
+def image_data_uri(path: str, max_width: int = HERO_IMAGE_MAX_WIDTH) -> str:
+    """Data URI cacheado de una imagen local; cadena vacía si no existe"""
+    try:
+        return _image_data_uri(path, os.path.getmtime(path), max_width)
+    except OSError:
+        return ""
 
 def img_tag_local(path: str, alt=""):
-    b64 = base64.b64encode(pathlib.Path(path).read_bytes()).decode("utf-8")
-    return f'<img src="data:image/png;base64,{b64}" alt="{alt}" style="max-width:100%;height:auto;border-radius:12px">'
-b64 = base64.b64encode(pathlib.Path("file.png").read_bytes()).decode("utf-8")
+    return f'<img src="{image_data_uri(path)}" alt="{alt}" style="max-width:100%;height:auto;border-radius:12px">'
 
 
 def render_carousel():
     """Renderiza el carrusel principal de Pacífico"""
+    hero_src = image_data_uri(HERO_IMAGE_PATH)
     st.html(f"""
     <div class="carousel-container">
         <span class="brand-chip">Pacífico Seguros · IA</span>
@@ -849,7 +1014,7 @@ def render_carousel():
             <div class="slide-image">
                 <!-- Puedes reemplazar el emoji con una imagen real 
                 <div class="slide-emoji">🤖</div>-->
-               <img  src="data:image/png;base64,{b64}alt="IA Assistant">
+               <img src="{hero_src}" alt="IA Assistant">
             </div>
         </div>
         
@@ -894,13 +1059,8 @@ def main():
         
         st.divider()
         
-        # Panel de progreso
-        render_progress_panel()
-        
-        st.divider()
-        
-        # Panel de información del negocio
-        render_business_info_panel()
+        # Paneles de progreso e información del negocio
+        render_sidebar_panels()
         
         st.divider()
         
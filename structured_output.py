@@ -0,0 +1,103 @@
+"""
+Salidas estructuradas: `response_format` con esquema JSON y parser incremental.
+
+El parser recibe los fragmentos del stream y va confirmando los campos del
+objeto JSON a medida que se completan. Si la respuesta se corta (max_tokens,
+error de red), se conservan los campos ya completos en lugar de perder toda la
+extracción.
+"""
+
+import json
+from typing import Any, Dict, Optional
+
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+# Valores que terminan por sí mismos; los números necesitan un delimitador detrás
+_SELF_DELIMITED = ('"', "{", "[", "n", "t", "f")
+
+
+def json_schema_response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Arma el `response_format` de salida estructurada estricta"""
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": name,
+            "strict": True,
+            "schema": schema
+        }
+    }
+
+
+class IncrementalJSONParser:
+    """Parser incremental de un objeto JSON plano recibido por fragmentos"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, Any] = {}
+        self.complete = False
+        self._pos: Optional[int] = None  # Posición tras el último campo confirmado
+
+    def feed(self, chunk: str) -> Dict[str, Any]:
+        """Agrega un fragmento y devuelve los campos que se completaron con él"""
+        self.buffer += chunk
+        return self._scan()
+
+    def _skip_ws(self, pos: int) -> int:
+        while pos < len(self.buffer) and self.buffer[pos] in _WHITESPACE:
+            pos += 1
+        return pos
+
+    def _scan(self) -> Dict[str, Any]:
+        new_fields = {}
+        text = self.buffer
+
+        if self._pos is None:
+            # Ignora texto o bloques ``` previos a la llave de apertura
+            start = text.find("{")
+            if start < 0:
+                return new_fields
+            self._pos = start + 1
+
+        while not self.complete:
+            pos = self._skip_ws(self._pos)
+            if pos < len(text) and text[pos] == ",":
+                pos = self._skip_ws(pos + 1)
+            if pos >= len(text):
+                break
+            if text[pos] == "}":
+                self.complete = True
+                self._pos = pos + 1
+                break
+
+            try:
+                key, pos = _decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break
+            pos = self._skip_ws(pos)
+            if pos >= len(text) or text[pos] != ":":
+                break
+            pos = self._skip_ws(pos + 1)
+            if pos >= len(text):
+                break
+
+            try:
+                value, end = _decoder.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                break
+            if text[pos] not in _SELF_DELIMITED:
+                # Un número solo es definitivo ante un delimitador: "80" o "80." pueden seguir creciendo
+                # (si el stream se corta justo ahí, el número se descarta por ser dudoso)
+                following = self._skip_ws(end)
+                if following >= len(text) or text[following] not in ",}":
+                    break
+
+            self.fields[key] = value
+            new_fields[key] = value
+            self._pos = end
+
+        return new_fields
+
+    def result(self) -> Dict[str, Any]:
+        """Campos recuperados (todos si el objeto cerró, los completos si se cortó)"""
+        return dict(self.fields)
@@ -0,0 +1,165 @@
+"""
+Ejecución concurrente de las herramientas pedidas por el LLM.
+
+Cada herramienta declara qué claves del estado lee y escribe. Las llamadas
+independientes corren en paralelo en un pool de hilos; una llamada espera a las
+anteriores solo si alguna de ellas escribe una clave que ella lee o escribe.
+
+Las herramientas trabajan en dos fases: `run(state, arguments)` hace el trabajo
+lento (Vision, TTS) sin tocar el estado y devuelve una función `apply(state)`
+que el coordinador ejecuta al terminar. Así, si una herramienta excede su
+tiempo límite, su resultado tardío se descarta sin modificar el estado. El
+tiempo límite corre desde que la llamada empieza a ejecutarse, no desde que se
+encola: el pool es compartido y la espera en cola no cuenta. Para que un turno
+no quede bloqueado sin límite (pool ocupado por hilos colgados), `turn_timeout`
+acota el turno completo: al vencer, las llamadas que siguen en cola o sin lanzar
+se cancelan y se informan como "timeout".
+"""
+
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, FrozenSet, List, Optional
+
+
+ApplyFn = Callable[[dict], None]
+
+
+@dataclass
+class ToolSpec:
+    """Declaración de una herramienta para el ejecutor"""
+    run: Callable[[dict, dict], Optional[ApplyFn]]
+    reads: FrozenSet[str] = frozenset()
+    writes: FrozenSet[str] = frozenset()
+    timeout: float = 10.0
+
+
+class ToolExecutor:
+    """Ejecuta llamadas a herramientas respetando dependencias y tiempos límite"""
+
+    def __init__(self, specs: Dict[str, ToolSpec], max_workers: int = 4, max_latency_records: int = 50,
+                 turn_timeout: float = 120.0):
+        self.specs = specs
+        self.turn_timeout = turn_timeout
+        self.max_latency_records = max_latency_records
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tool")
+
+    def _dependencies(self, calls: List[dict]) -> List[set]:
+        """Índices de las llamadas previas de las que depende cada llamada"""
+        deps = []
+        for j, call in enumerate(calls):
+            touched = call["spec"].reads | call["spec"].writes
+            deps.append({
+                i for i in range(j)
+                if calls[i]["spec"].writes & touched or call["spec"].writes & calls[i]["spec"].reads
+            })
+        return deps
+
+    @staticmethod
+    def _run_timed(run, state: dict, arguments: dict, started: Dict[int, float], index: int):
+        """Marca el inicio real de la llamada (ya en un hilo del pool) y la ejecuta"""
+        started[index] = time.perf_counter()
+        return run(state, arguments)
+
+    def execute(self, state: dict, tool_calls) -> List[Dict[str, Any]]:
+        """
+        Ejecuta las llamadas y aplica sus resultados al estado
+
+        Returns:
+            Lista con la latencia y el resultado ("ok", "error", "timeout",
+            "skipped") de cada llamada; también se acumula en state["tool_latencies"]
+        """
+        calls = []
+        for tool_call in tool_calls:
+            name = tool_call.function.name
+            spec = self.specs.get(name)
+            try:
+                arguments = json.loads(tool_call.function.arguments or "{}")
+            except json.JSONDecodeError:
+                arguments = None
+            calls.append({"name": name, "spec": spec or ToolSpec(run=lambda s, a: None),
+                          "known": spec is not None, "arguments": arguments})
+
+        deps = self._dependencies(calls)
+        report = [{"tool": c["name"], "status": "pending", "ms": 0.0} for c in calls]
+        pending = set(range(len(calls)))
+        running = {}  # future -> índice
+        started: Dict[int, float] = {}  # índice -> inicio real en el pool
+        finished = set()
+        turn_deadline = time.perf_counter() + self.turn_timeout
+
+        while pending or running:
+            # Lanzar las llamadas cuyas dependencias ya terminaron
+            for index in sorted(pending):
+                if deps[index] <= finished:
+                    pending.discard(index)
+                    call = calls[index]
+                    if not call["known"] or call["arguments"] is None:
+                        report[index]["status"] = "skipped" if not call["known"] else "error"
+                        finished.add(index)
+                        continue
+                    future = self._pool.submit(self._run_timed, call["spec"].run, state,
+                                               call["arguments"], started, index)
+                    running[future] = index
+
+            if not running:
+                continue
+
+            # Esperar hasta que algo termine, venza el tiempo límite de una
+            # llamada ya iniciada o venza el turno
+            now = time.perf_counter()
+            deadlines = [started[i] + calls[i]["spec"].timeout for i in running.values() if i in started]
+            deadlines.append(turn_deadline)
+            if len(deadlines) <= len(running):
+                # Revisar de nuevo pronto por si una llamada en cola empieza a correr
+                deadlines.append(now + 0.05)
+            done, _ = wait(list(running), timeout=max(0.0, min(deadlines) - now), return_when=FIRST_COMPLETED)
+
+            now = time.perf_counter()
+            for future in list(running):
+                index = running[future]
+                entry = report[index]
+                start = started.get(index)
+                if future in done:
+                    del running[future]
+                    entry["ms"] = (now - start) * 1000 if start is not None else 0.0
+                    try:
+                        apply = future.result()
+                        if apply:
+                            apply(state)
+                        entry["status"] = "ok"
+                    except Exception as e:
+                        print(f"Error ejecutando herramienta {calls[index]['name']}: {str(e)}")
+                        entry["status"] = "error"
+                    finished.add(index)
+                elif start is not None and now - start >= calls[index]["spec"].timeout:
+                    # El hilo sigue corriendo pero su resultado se descarta
+                    del running[future]
+                    entry["ms"] = (now - start) * 1000
+                    entry["status"] = "timeout"
+                    print(f"[DEBUG] Herramienta {calls[index]['name']} excedió {calls[index]['spec'].timeout}s")
+                    finished.add(index)
+                elif now >= turn_deadline:
+                    # Sigue en cola (se cancela) o corriendo: se descarta igual
+                    future.cancel()
+                    del running[future]
+                    entry["ms"] = (now - start) * 1000 if start is not None else 0.0
+                    entry["status"] = "timeout"
+                    print(f"[DEBUG] Herramienta {calls[index]['name']} sin terminar al vencer el turno "
+                          f"({self.turn_timeout}s)")
+                    finished.add(index)
+
+            if now >= turn_deadline:
+                for index in pending:
+                    report[index]["status"] = "timeout"
+                    finished.add(index)
+                pending.clear()
+
+        for entry in report:
+            print(f"[DEBUG] Herramienta {entry['tool']}: {entry['status']} en {entry['ms']:.0f} ms")
+
+        latencies = state.get("tool_latencies") or []
+        latencies.extend(report)
+        state["tool_latencies"] = latencies[-self.max_latency_records:]
+        return report
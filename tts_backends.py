@@ -0,0 +1,110 @@
+"""
+Motores de síntesis de voz (TTS) para el resumen en audio de la póliza.
+
+`PolicyGenerator` trabaja con cualquier `TTSBackend`; el motor por defecto se
+elige con la variable de entorno TTS_BACKEND ("gtts" u "offline").
+"""
+
+import os
+import io
+import tempfile
+from abc import ABC, abstractmethod
+from typing import Optional
+
+
+class TTSBackend(ABC):
+    """Interfaz común: convierte texto en bytes de audio"""
+
+    name = "base"
+    extension = "mp3"
+    mime_type = "audio/mpeg"
+
+    @abstractmethod
+    def synthesize(self, text: str) -> bytes:
+        """Audio en el formato indicado por `extension` / `mime_type`"""
+
+
+class GTTSBackend(TTSBackend):
+    """Google Text-to-Speech (requiere red, produce MP3)"""
+
+    name = "gtts"
+    extension = "mp3"
+    mime_type = "audio/mpeg"
+
+    def __init__(self, lang: str = "es", slow: bool = False):
+        self.lang = lang
+        self.slow = slow
+
+    def synthesize(self, text: str) -> bytes:
+        from gtts import gTTS
+
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=self.lang, slow=self.slow).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class OfflineTTSBackend(TTSBackend):
+    """Motor local con pyttsx3 (espeak/SAPI/NSSpeech, sin red, produce WAV)"""
+
+    name = "offline"
+    extension = "wav"
+    mime_type = "audio/wav"
+
+    def __init__(self, lang: str = "es", rate: Optional[int] = None):
+        import pyttsx3  # Dependencia opcional; falla aquí si no está instalada
+
+        self._pyttsx3 = pyttsx3
+        self.lang = lang
+        self.rate = rate
+
+    def _select_voice(self, engine) -> None:
+        """Usa la primera voz del idioma configurado, si existe"""
+        for voice in engine.getProperty("voices"):
+            languages = [
+                lang.decode("utf-8", "ignore") if isinstance(lang, bytes) else str(lang)
+                for lang in (getattr(voice, "languages", None) or [])
+            ]
+            if any(self.lang in lang for lang in languages) or self.lang in (voice.id or ""):
+                engine.setProperty("voice", voice.id)
+                return
+
+    def synthesize(self, text: str) -> bytes:
+        engine = self._pyttsx3.init()
+        self._select_voice(engine)
+        if self.rate:
+            engine.setProperty("rate", self.rate)
+
+        fd, tmp_path = tempfile.mkstemp(suffix=".wav")
+        os.close(fd)
+        try:
+            engine.save_to_file(text, tmp_path)
+            engine.runAndWait()
+            with open(tmp_path, "rb") as audio_file:
+                return audio_file.read()
+        finally:
+            engine.stop()
+            os.remove(tmp_path)
+
+
+def get_tts_backend(name: Optional[str] = None) -> TTSBackend:
+    """
+    Crea el motor TTS indicado (o el de TTS_BACKEND)
+
+    Si se pide el motor offline y pyttsx3 no está disponible, se usa gTTS.
+    """
+    name = (name or os.environ.get("TTS_BACKEND", "gtts")).lower()
+
+    if name in ("offline", "pyttsx3", "local"):
+        try:
+            return OfflineTTSBackend()
+        except Exception as e:
+            print(f"[DEBUG] Motor TTS offline no disponible ({str(e)}), usando gTTS")
+
+    return GTTSBackend()
+
+
+def audio_mime_type(audio_path: Optional[str]) -> str:
+    """Tipo MIME según la extensión del archivo de audio"""
+    if audio_path and audio_path.lower().endswith(".wav"):
+        return "audio/wav"
+    return "audio/mpeg"
@@ -0,0 +1,139 @@
+"""
+Procesamiento en paralelo de varias imágenes subidas a la vez.
+
+Cada archivo se decodifica y clasifica en un pool de hilos; las llamadas a Vision
+(clasificación dudosa o extracción del certificado) se limitan con un semáforo.
+Al final se arma un único mensaje que resume todas las subidas, para que el
+agente responda en un solo turno en lugar de uno por archivo.
+"""
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from PIL import Image
+
+from models import BusinessInfo, ImageRef
+from image_classifier import LocalImageClassifier, CERTIFICATE, UNSURE
+from utils import normalize_image
+
+
+@dataclass
+class UploadResult:
+    """Resultado del procesamiento de un archivo subido"""
+    filename: str
+    image_type: str = "local_photo"
+    confidence: float = 0.0
+    image_ref: Optional[ImageRef] = None
+    business_info: Optional[BusinessInfo] = None
+    error: Optional[str] = None
+
+
+class UploadPipeline:
+    """Decodifica, clasifica y extrae varias imágenes en paralelo"""
+
+    def __init__(self, certificate_analyzer, classifier: Optional[LocalImageClassifier] = None,
+                 fallback_classifier: Optional[Callable[[Image.Image], str]] = None,
+                 max_workers: int = 4, max_concurrent_llm: int = 3,
+                 merge_classify_and_extract: bool = True, max_width: int = 2400):
+        self.certificate_analyzer = certificate_analyzer
+        self.classifier = classifier or LocalImageClassifier()
+        self.fallback_classifier = fallback_classifier
+        self.max_workers = max_workers
+        self.merge_classify_and_extract = merge_classify_and_extract
+        self.max_width = max_width
+        self._llm_slots = threading.BoundedSemaphore(max_concurrent_llm)
+
+    def process(self, uploaded_files: List) -> List[UploadResult]:
+        """Procesa todos los archivos y devuelve los resultados en el mismo orden"""
+        if not uploaded_files:
+            return []
+
+        workers = min(self.max_workers, len(uploaded_files))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="upload") as executor:
+            return list(executor.map(self._process_one, uploaded_files))
+
+    def _process_one(self, uploaded_file) -> UploadResult:
+        filename = getattr(uploaded_file, "name", "imagen.jpg")
+        result = UploadResult(filename=filename)
+        try:
+            # Decodificación, orientación EXIF y codificación en una sola pasada
+            image_data = normalize_image(uploaded_file, max_width=self.max_width, max_size_kb=None)
+            result.image_ref = ImageRef.from_bytes(image_data, filename)
+            # Se trabaja sobre la imagen guardada para que la caché de extracción
+            # coincida con el análisis que hará después el agente
+            stored_image = result.image_ref.to_pil_image()
+
+            result.image_type, result.confidence = self.classifier.classify(stored_image)
+            print(f"[DEBUG] {filename}: clasificación local {result.image_type} ({result.confidence:.2f})")
+
+            if result.image_type == UNSURE:
+                with self._llm_slots:
+                    if self.merge_classify_and_extract:
+                        result.image_type, result.business_info = \
+                            self.certificate_analyzer.classify_and_analyze(stored_image)
+                    elif self.fallback_classifier:
+                        result.image_type = self.fallback_classifier(stored_image)
+                    else:
+                        result.image_type = "local_photo"
+
+            if result.image_type == CERTIFICATE and result.business_info is None:
+                with self._llm_slots:
+                    result.business_info = self.certificate_analyzer.analyze_image(stored_image)
+
+        except Exception as e:
+            print(f"[DEBUG] Error procesando {filename}: {str(e)}")
+            result.error = str(e)
+
+        return result
+
+
+_SUMMARY_FIELDS = (
+    ("nombre_negocio", "negocio"),
+    ("nombre_cliente", "cliente"),
+    ("tipo_negocio", "tipo de negocio"),
+    ("metraje", "área"),
+    ("direccion", "dirección"),
+    ("ruc", "RUC"),
+)
+
+
+def _describe_business_info(business_info: Optional[BusinessInfo]) -> str:
+    """Campos principales extraídos, en una línea"""
+    if business_info is None:
+        return ""
+    parts = []
+    for field, label in _SUMMARY_FIELDS:
+        value = getattr(business_info, field, None)
+        if not value:
+            continue
+        if field == "metraje":
+            metraje = float(value)
+            value = f"{int(metraje) if metraje.is_integer() else metraje} m²"
+        parts.append(f"{label}: {value}")
+    return ", ".join(parts)
+
+
+def build_upload_summary(results: List[UploadResult]) -> str:
+    """Mensaje único para el agente que resume todas las imágenes subidas"""
+    certificates = [r for r in results if not r.error and r.image_type == CERTIFICATE]
+    photos = [r for r in results if not r.error and r.image_type != CERTIFICATE]
+    failed = [r for r in results if r.error]
+
+    lines = [f"He subido {len(results)} archivo(s):"]
+    if certificates:
+        names = ", ".join(r.filename for r in certificates)
+        lines.append(f"- Certificado de funcionamiento: {names}")
+        extracted = _describe_business_info(certificates[0].business_info)
+        if extracted:
+            lines.append(f"  Datos extraídos del certificado: {extracted}")
+    if photos:
+        names = ", ".join(r.filename for r in photos)
+        lines.append(f"- {len(photos)} foto(s) de mi local comercial: {names}")
+    if failed:
+        names = ", ".join(r.filename for r in failed)
+        lines.append(f"- No se pudieron procesar: {names}")
+    if certificates:
+        lines.append("Por favor analiza el certificado y genera mi cotización automáticamente.")
+
+    return "\n".join(lines)
@@ -0,0 +1,98 @@
+"""
+Registro del uso de tokens reportado por la API (campo `usage`).
+
+Permite seguir la tasa de aciertos de la caché de prompts del proveedor
+(`prompt_tokens_details.cached_tokens`) y el costo estimado por turno.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Dict, Optional
+
+
+# USD por millón de tokens: (entrada, entrada cacheada, salida). Referenciales.
+MODEL_PRICES = {
+    "gpt-4-turbo-preview": (10.00, 10.00, 30.00),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-3.5-turbo": (0.50, 0.50, 1.50),
+}
+
+
+class UsageTracker:
+    """Acumula tokens de prompt, cacheados y de salida por llamada y por turno"""
+
+    def __init__(self, max_records: int = 500):
+        self.records = deque(maxlen=max_records)
+        self.turn = 0
+        self.totals = {
+            "calls": 0,
+            "prompt_tokens": 0,
+            "cached_tokens": 0,
+            "completion_tokens": 0,
+            "cost_usd": 0.0
+        }
+        self._lock = threading.Lock()
+
+    def new_turn(self) -> int:
+        """Marca el inicio de un turno de conversación"""
+        with self._lock:
+            self.turn += 1
+            return self.turn
+
+    def record(self, usage: Any, model: str, label: str = "") -> Optional[Dict[str, Any]]:
+        """
+        Registra el `usage` de una respuesta (o la respuesta completa)
+
+        Returns:
+            dict con los tokens y el costo de la llamada, o None si no hay usage
+        """
+        usage = getattr(usage, "usage", usage)
+        if usage is None:
+            return None
+
+        prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+        completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+        input_price, cached_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0, 0.0))
+        cost = (
+            (prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + completion_tokens * output_price
+        ) / 1_000_000
+
+        with self._lock:
+            entry = {
+                "turn": self.turn,
+                "label": label,
+                "model": model,
+                "prompt_tokens": prompt_tokens,
+                "cached_tokens": cached_tokens,
+                "completion_tokens": completion_tokens,
+                "cost_usd": cost
+            }
+            self.records.append(entry)
+            self.totals["calls"] += 1
+            self.totals["prompt_tokens"] += prompt_tokens
+            self.totals["cached_tokens"] += cached_tokens
+            self.totals["completion_tokens"] += completion_tokens
+            self.totals["cost_usd"] += cost
+
+        hit_rate = cached_tokens / prompt_tokens if prompt_tokens else 0.0
+        print(f"[DEBUG] Uso LLM {label}: prompt={prompt_tokens} cacheados={cached_tokens} "
+              f"({hit_rate:.0%}) salida={completion_tokens} costo=${cost:.4f}")
+        return entry
+
+    def stats(self) -> Dict[str, Any]:
+        """Totales, tasa de aciertos de caché y costo promedio por turno"""
+        with self._lock:
+            totals = dict(self.totals)
+            turns = self.turn
+
+        prompt_tokens = totals["prompt_tokens"]
+        totals["cache_hit_rate"] = totals["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0
+        totals["turns"] = turns
+        totals["cost_per_turn_usd"] = totals["cost_usd"] / turns if turns else 0.0
+        return totals
@@ -4,11 +4,11 @@ Utilidades para el manejo de imágenes y archivos en el sistema de seguros
 
 import base64
 import io
-from PIL import Image
+from PIL import Image, ImageOps, UnidentifiedImageError
 from typing import List, Optional
 import streamlit as st
 
-from models import SerializableImage
+from models import ImageRef
 
 def pil_image_to_base64(pil_image: Image.Image, format: str = "JPEG") -> str:
     """
@@ -77,12 +77,12 @@ def validate_image_file(uploaded_file) -> bool:
         st.error(f"Archivo de imagen inválido: {str(e)}")
         return False
 
-def create_image_preview(images: List[SerializableImage], max_cols: int = 4) -> None:
+def create_image_preview(images: List[ImageRef], max_cols: int = 4) -> None:
     """
     Crea preview de imágenes en Streamlit
     
     Args:
-        images: Lista de imágenes serializables
+        images: Lista de referencias a imágenes
         max_cols: Número máximo de columnas para mostrar
     """
     if not images:
@@ -95,7 +95,7 @@ def create_image_preview(images: List[SerializableImage], max_cols: int = 4) ->
     for i in range(display_count):
         with cols[i]:
             try:
-                pil_image = images[i].to_pil_image()
+                pil_image = images[i].thumbnail()
                 st.image(pil_image, caption=f"Imagen {i+1}", use_column_width=True)
             except Exception as e:
                 st.error(f"Error mostrando imagen {i+1}: {str(e)}")
@@ -104,29 +104,31 @@ def create_image_preview(images: List[SerializableImage], max_cols: int = 4) ->
     if len(images) > max_cols:
         st.info(f"+ {len(images) - max_cols} imagen(es) más")
 
-def get_image_info(serializable_image: SerializableImage) -> dict:
+def get_image_info(image_ref: ImageRef) -> dict:
     """
-    Obtiene información de una imagen serializable
+    Obtiene información de una imagen del almacén
     
     Args:
-        serializable_image: Imagen serializable
+        image_ref: Referencia a la imagen
     
     Returns:
         dict: Información de la imagen
     """
     try:
-        pil_image = serializable_image.to_pil_image()
+        # Solo lee la cabecera, no decodifica los píxeles
+        pil_image = image_ref.to_pil_image()
         return {
-            "filename": serializable_image.filename,
-            "format": serializable_image.format,
+            "filename": image_ref.filename,
+            "format": image_ref.format,
+            "digest": image_ref.digest[:12],
             "size": pil_image.size,
             "mode": pil_image.mode,
-            "data_size_kb": len(serializable_image.data) * 3/4 / 1024  # Aproximado para base64
+            "data_size_kb": image_ref.size_bytes / 1024
         }
     except Exception as e:
         return {
-            "filename": serializable_image.filename,
-            "format": serializable_image.format,
+            "filename": image_ref.filename,
+            "format": image_ref.format,
             "error": str(e)
         }
 
@@ -167,7 +169,93 @@ def compress_image_if_needed(image: Image.Image, max_size_kb: int = 500) -> Imag
     
     return image.resize((new_width, new_height), Image.Resampling.LANCZOS)
 
-def batch_process_uploaded_files(uploaded_files, file_type: str = "image") -> List[SerializableImage]:
+# Orientaciones EXIF que intercambian ancho y alto
+_EXIF_TRANSPOSED = (5, 6, 7, 8)
+
+def normalize_image(source, max_width: int = 1200, max_size_kb: Optional[int] = 500,
+                    max_quality: int = 90, min_quality: int = 40) -> bytes:
+    """
+    Normaliza una imagen en una sola pasada y devuelve los bytes JPEG finales
+    
+    Abre el archivo una vez, reduce durante la decodificación con `draft()` (JPEG),
+    aplica la orientación EXIF y la conversión a RGB una sola vez, y busca por
+    bisección la mayor calidad que cabe en `max_size_kb` reutilizando un solo
+    buffer.
+    
+    Args:
+        source: Archivo subido, ruta o bytes de la imagen
+        max_width: Ancho máximo en píxeles (ya orientada)
+        max_size_kb: Tamaño máximo en KB (None = sin límite, se usa max_quality)
+        max_quality: Calidad JPEG inicial
+        min_quality: Calidad JPEG mínima antes de reducir dimensiones
+    
+    Returns:
+        bytes: Imagen JPEG lista para `ImageRef.from_bytes`
+    """
+    if isinstance(source, (bytes, bytearray)):
+        source = io.BytesIO(source)
+    
+    image = Image.open(source)
+    
+    # Ancho final tras la rotación EXIF; se reduce en la decodificación hasta
+    # un tamaño >= al necesario (solo aplica a JPEG)
+    orientation = image.getexif().get(0x0112, 1)
+    width, height = image.size
+    oriented_width = height if orientation in _EXIF_TRANSPOSED else width
+    if oriented_width > max_width:
+        scale = max_width / oriented_width
+        image.draft("RGB", (int(width * scale) + 1, int(height * scale) + 1))
+    
+    image = ImageOps.exif_transpose(image)
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    
+    if image.width > max_width:
+        new_height = int(image.height * max_width / image.width)
+        image = image.resize((max_width, new_height), Image.Resampling.LANCZOS)
+    
+    buffer = io.BytesIO()
+    
+    def encode(quality: int) -> int:
+        buffer.seek(0)
+        buffer.truncate()
+        image.save(buffer, format="JPEG", quality=quality)
+        return buffer.tell()
+    
+    size = encode(max_quality)
+    if max_size_kb is None or size <= max_size_kb * 1024:
+        return buffer.getvalue()
+    
+    budget = max_size_kb * 1024
+    
+    # Bisección de la mayor calidad que cabe en el presupuesto
+    best = None
+    low, high = min_quality, max_quality - 1
+    while low <= high:
+        quality = (low + high) // 2
+        if encode(quality) <= budget:
+            best = quality
+            low = quality + 1
+        else:
+            high = quality - 1
+    
+    if best is not None:
+        encode(best)
+        return buffer.getvalue()
+    
+    # Ni la calidad mínima alcanza: reducir dimensiones hasta entrar
+    size = encode(min_quality)
+    while size > budget and min(image.size) > 64:
+        scale = (budget / size) ** 0.5 * 0.95
+        image = image.resize(
+            (max(1, int(image.width * scale)), max(1, int(image.height * scale))),
+            Image.Resampling.LANCZOS
+        )
+        size = encode(min_quality)
+    
+    return buffer.getvalue()
+
+def batch_process_uploaded_files(uploaded_files, file_type: str = "image") -> List[ImageRef]:
     """
     Procesa múltiples archivos subidos
     
@@ -176,34 +264,31 @@ def batch_process_uploaded_files(uploaded_files, file_type: str = "image") -> Li
         file_type: Tipo de archivo esperado
     
     Returns:
-        List[SerializableImage]: Lista de imágenes procesadas
+        List[ImageRef]: Lista de imágenes procesadas
     """
     processed_images = []
     
     for i, uploaded_file in enumerate(uploaded_files):
         try:
-            if validate_image_file(uploaded_file):
-                # Resetear puntero del archivo
-                uploaded_file.seek(0)
-                
-                # Cargar imagen
-                pil_image = Image.open(uploaded_file)
-                
-                # Optimizar imagen
-                pil_image = resize_image_for_api(pil_image)
-                pil_image = compress_image_if_needed(pil_image)
-                
-                # Convertir a SerializableImage
-                filename = uploaded_file.name or f"{file_type}_{i+1}.jpg"
-                serializable_image = SerializableImage.from_pil_image(pil_image, filename)
-                processed_images.append(serializable_image)
+            # Una sola apertura: decodificar, orientar, redimensionar y comprimir.
+            # Un archivo que no es imagen o está dañado falla aquí mismo
+            try:
+                image_data = normalize_image(uploaded_file)
+            except (UnidentifiedImageError, OSError) as e:
+                st.error(f"Archivo de imagen inválido: {str(e)}")
+                continue
+            
+            # Guardar en el almacén y conservar solo la referencia
+            filename = uploaded_file.name or f"{file_type}_{i+1}.jpg"
+            image_ref = ImageRef.from_bytes(image_data, filename)
+            processed_images.append(image_ref)
                 
         except Exception as e:
             st.error(f"Error procesando {uploaded_file.name}: {str(e)}")
     
     return processed_images
 
-def display_image_gallery(images: List[SerializableImage], title: str = "Galería") -> None:
+def display_image_gallery(images: List[ImageRef], title: str = "Galería") -> None:
     """
     Muestra galería de imágenes con información detallada
     
@@ -1,35 +1,33 @@
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from models import BusinessInfo, Valuation
+from keyword_matcher import business_type_key, location_key
+from rate_tables import RateTable, RateTableStore, get_rate_table_store
 
 class ValuationEngine:
     """Motor de valuación para seguros comerciales - MEJORADO CON FOTOS OPCIONALES"""
     
-    def __init__(self):
-        # Factores base por m2 según tipo de negocio (en USD, luego convertidos a soles)
-        self.factores = {
-            "restaurante": {"inventario": 200, "mobiliario": 350, "infraestructura": 300},
-            "tienda": {"inventario": 300, "mobiliario": 150, "infraestructura": 200},
-            "oficina": {"inventario": 80, "mobiliario": 250, "infraestructura": 180},
-            "farmacia": {"inventario": 500, "mobiliario": 300, "infraestructura": 250},
-            "bar": {"inventario": 250, "mobiliario": 400, "infraestructura": 350},
-            "panadería": {"inventario": 180, "mobiliario": 280, "infraestructura": 220},
-            "taller": {"inventario": 150, "mobiliario": 200, "infraestructura": 250},
-            "consultorio": {"inventario": 50, "mobiliario": 300, "infraestructura": 150},
-            "salon": {"inventario": 100, "mobiliario": 400, "infraestructura": 200},
-            "default": {"inventario": 200, "mobiliario": 250, "infraestructura": 200}
-        }
-        
-        # Tasa de cambio USD a PEN
-        self.tasa_cambio = 3.8
-        
-        # Multiplicadores por ubicación (Lima vs provincias)
-        self.multiplicadores_ubicacion = {
-            "lima": 1.2,
-            "arequipa": 1.0,
-            "trujillo": 0.9,
-            "cusco": 0.8,
-            "default": 0.85
-        }
+    def __init__(self, rate_tables: Optional[RateTableStore] = None):
+        # Factores por m² (USD), tasa de cambio, multiplicadores por zona y tasas de
+        # riesgo: vienen de la tabla de tarifas versionada (rate_tables.json por defecto)
+        # y se recargan en caliente cuando cambia el archivo
+        self.rate_tables = rate_tables or get_rate_table_store()
+    
+    @property
+    def rate_table(self) -> RateTable:
+        """Tabla de tarifas vigente"""
+        return self.rate_tables.table
+    
+    @property
+    def factores(self) -> Dict[str, Dict[str, float]]:
+        return self.rate_table.factores()
+    
+    @property
+    def tasa_cambio(self) -> float:
+        return self.rate_table.tasa_cambio
+    
+    @property
+    def multiplicadores_ubicacion(self) -> Dict[str, float]:
+        return self.rate_table.multiplicadores_ubicacion()
     
     def estimate_property_value(self, business_info: BusinessInfo, photos_count: int = 0) -> Valuation:
         """
@@ -42,18 +40,23 @@ class ValuationEngine:
         Returns:
             Valuation: Valuación estimada
         """
+        # Una sola tabla para todo el cálculo aunque se recargue en paralelo
+        table = self.rate_table
+        
         if not business_info.metraje or business_info.metraje <= 0:
-            return Valuation(descripcion="No se pudo calcular la valuación sin el metraje")
+            return Valuation(descripcion="No se pudo calcular la valuación sin el metraje",
+                             tabla_version=table.version)
         
         if not business_info.tipo_negocio:
-            return Valuation(descripcion="No se pudo calcular la valuación sin el tipo de negocio")
+            return Valuation(descripcion="No se pudo calcular la valuación sin el tipo de negocio",
+                             tabla_version=table.version)
         
         # Buscar tipo más cercano
         factor_key = self._get_business_type_key(business_info.tipo_negocio)
-        factor = self.factores[factor_key]
+        code = table.business_code(factor_key)
         
         # Obtener multiplicador por ubicación
-        multiplicador_ubicacion = self._get_location_multiplier(business_info.direccion)
+        multiplicador_ubicacion = self._get_location_multiplier(business_info.direccion, table)
         
         # Multiplicador por cantidad de fotos (OPCIONAL - bonificación por precisión)
         # Sin fotos: valuación estándar (factor 1.0)
@@ -65,14 +68,14 @@ class ValuationEngine:
             multiplicador_fotos = 1.0  # Sin penalización por no tener fotos
         
         # Calcular valores base en soles peruanos
-        inventario = (business_info.metraje * factor["inventario"] * 
-                     self.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
+        inventario = (business_info.metraje * table.inventario[code] * 
+                     table.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
         
-        mobiliario = (business_info.metraje * factor["mobiliario"] * 
-                     self.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
+        mobiliario = (business_info.metraje * table.mobiliario[code] * 
+                     table.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
         
-        infraestructura = (business_info.metraje * factor["infraestructura"] * 
-                          self.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
+        infraestructura = (business_info.metraje * table.infraestructura[code] * 
+                          table.tasa_cambio * multiplicador_ubicacion * multiplicador_fotos)
         
         total = inventario + mobiliario + infraestructura
         
@@ -86,64 +89,168 @@ class ValuationEngine:
             mobiliario=round(mobiliario, 2),
             infraestructura=round(infraestructura, 2),
             total=round(total, 2),
-            descripcion=descripcion
+            descripcion=descripcion,
+            tabla_version=table.version
+        )
+    
+    def estimate_batch(self, records):
+        """
+        Estima valuaciones para un portafolio completo en una sola pasada vectorizada
+        
+        Args:
+            records: Lista de dicts/BusinessInfo, DataFrame de pandas o dict de arrays
+                     NumPy con columnas metraje, tipo_negocio, direccion y
+                     (opcional) photos_count
+        
+        Returns:
+            pd.DataFrame: Columnas factor_key, multiplicador_ubicacion, inventario,
+                          mobiliario, infraestructura, total, descripcion y
+                          tabla_version (mismo índice que la entrada). Los valores coinciden exactamente
+                          con estimate_property_value fila a fila.
+        """
+        import numpy as np
+        import pandas as pd
+        
+        table = self.rate_table
+        
+        if isinstance(records, list) and records and isinstance(records[0], (BusinessInfo, dict)):
+            # Solo las columnas que usa la valuación (armar el DataFrame completo cuesta más que valorizar)
+            if isinstance(records[0], BusinessInfo):
+                get = lambda record, field: getattr(record, field, None)
+            else:
+                get = lambda record, field: record.get(field)
+            index = pd.RangeIndex(len(records))
+            tipos = [get(record, "tipo_negocio") for record in records]
+            direcciones = [get(record, "direccion") for record in records]
+            metraje = pd.to_numeric(pd.Series([get(record, "metraje") for record in records], dtype=object),
+                                    errors="coerce").to_numpy(dtype=np.float64)
+            photos = np.array([get(record, "photos_count") or 0 for record in records], dtype=np.int64)
+        else:
+            df = records if isinstance(records, pd.DataFrame) else pd.DataFrame(records)
+            n = len(df)
+            index = df.index
+            empty_text = [None] * n
+            tipos = df["tipo_negocio"].to_numpy(dtype=object) if "tipo_negocio" in df else empty_text
+            direcciones = df["direccion"].to_numpy(dtype=object) if "direccion" in df else empty_text
+            metraje = pd.to_numeric(df["metraje"], errors="coerce").to_numpy(dtype=np.float64) if "metraje" in df else np.full(n, np.nan)
+            photos = df["photos_count"].fillna(0).to_numpy(dtype=np.int64) if "photos_count" in df else np.zeros(n, dtype=np.int64)
+        
+        # Resolver claves una vez por valor distinto y propagar con índices enteros
+        tipo_codes, tipo_uniques = pd.factorize(np.asarray(tipos, dtype=object), use_na_sentinel=True)
+        factor_keys = np.array(table.business_keys)
+        unique_key_idx = np.array(
+            [table.business_code(self._get_business_type_key(tipo)) for tipo in tipo_uniques]
+            + [table.default_business_code],
+            dtype=np.int64
         )
+        row_key_idx = unique_key_idx[tipo_codes]  # código -1 (NA) -> "default"
+        
+        dir_codes, dir_uniques = pd.factorize(np.asarray(direcciones, dtype=object), use_na_sentinel=True)
+        unique_mult = np.array(
+            [self._get_location_multiplier(direccion, table) for direccion in dir_uniques]
+            + [table.multiplicador[table.default_location_code]],
+            dtype=np.float64
+        )
+        mult_ubicacion = unique_mult[dir_codes]
+        
+        # Tablas densas de factores por código
+        inv_table = np.array(table.inventario, dtype=np.float64)
+        mob_table = np.array(table.mobiliario, dtype=np.float64)
+        inf_table = np.array(table.infraestructura, dtype=np.float64)
+        
+        mult_fotos = np.where(photos > 0, np.minimum(1.0 + photos * 0.03, 1.15), 1.0)
+        
+        # Mismo orden de operaciones que estimate_property_value para resultados idénticos
+        inventario = metraje * inv_table[row_key_idx] * table.tasa_cambio * mult_ubicacion * mult_fotos
+        mobiliario = metraje * mob_table[row_key_idx] * table.tasa_cambio * mult_ubicacion * mult_fotos
+        infraestructura = metraje * inf_table[row_key_idx] * table.tasa_cambio * mult_ubicacion * mult_fotos
+        total = inventario + mobiliario + infraestructura
+        
+        unique_tipo_valido = np.array([bool(tipo) for tipo in tipo_uniques] + [False], dtype=bool)
+        tipo_valido = unique_tipo_valido[tipo_codes]
+        metraje_valido = np.nan_to_num(metraje, nan=0.0) > 0
+        valid = metraje_valido & tipo_valido
+        
+        def _round(values):
+            # np.round(x, 2) = rint(x * 100) / 100 coincide con round() de Python salvo
+            # cuando x * 100 queda a un error de redondeo de un medio centavo: esos
+            # pocos casos se recalculan con round() para coincidir al centavo
+            values = np.where(valid, values, 0.0)
+            rounded = np.round(values, 2)
+            scaled = values * 100.0
+            ties = np.flatnonzero(np.abs(np.abs(scaled - np.floor(scaled)) - 0.5) <= np.abs(scaled) * 1e-12 + 1e-9)
+            for i in ties:
+                rounded[i] = round(float(values[i]), 2)
+            return rounded
+        
+        # Descripción = prefijo por tipo + metraje + sufijo por (zona, fotos), cada
+        # parte formateada una vez por valor distinto
+        prefijos = np.array(
+            [f"Estimación para {tipo} de " for tipo in tipo_uniques] + [""], dtype=object
+        )[tipo_codes]
+        metraje_codes, metraje_uniques = pd.factorize(np.where(metraje_valido, metraje, 0.0))
+        metrajes = np.array([self._format_metraje(value) for value in metraje_uniques], dtype=object)[metraje_codes]
+        zona = np.where(mult_ubicacion > 1.0, 1, np.where(mult_ubicacion < 0.9, 2, 0))
+        sufijo_codes, sufijo_uniques = pd.factorize(photos * 3 + zona)
+        sufijos = np.array(
+            [self._describe_suffix(int(key) // 3, int(key) % 3) for key in sufijo_uniques], dtype=object
+        )[sufijo_codes]
+        
+        descripciones = prefijos + metrajes + sufijos
+        descripciones[~tipo_valido] = "No se pudo calcular la valuación sin el tipo de negocio"
+        descripciones[~metraje_valido] = "No se pudo calcular la valuación sin el metraje"
+        
+        return pd.DataFrame({
+            "factor_key": factor_keys[row_key_idx],
+            "multiplicador_ubicacion": mult_ubicacion,
+            "inventario": _round(inventario),
+            "mobiliario": _round(mobiliario),
+            "infraestructura": _round(infraestructura),
+            "total": _round(total),
+            "descripcion": descripciones,
+            "tabla_version": table.version
+        }, index=index)
     
     def _get_business_type_key(self, tipo_negocio: str) -> str:
         """Encuentra la clave del tipo de negocio más cercana"""
         if not tipo_negocio:
             return "default"
         
-        tipo_lower = tipo_negocio.lower()
-        
-        # Mapeo de palabras clave a tipos de negocio
-        keyword_mapping = {
-            "restaurante": ["restaurante", "restaurant", "comida", "cocina", "cevichería"],
-            "tienda": ["tienda", "store", "comercio", "venta", "bodega", "minimarket"],
-            "oficina": ["oficina", "office", "administrativa", "servicios"],
-            "farmacia": ["farmacia", "botica", "medicinas", "droguería"],
-            "bar": ["bar", "cantina", "licores", "discoteca", "pub"],
-            "panadería": ["panadería", "bakery", "pan", "pastelería", "repostería"],
-            "taller": ["taller", "mecánica", "reparación", "automotriz"],
-            "consultorio": ["consultorio", "clínica", "médico", "dental", "veterinaria"],
-            "salon": ["salón", "peluquería", "spa", "belleza", "estética"]
-        }
-        
-        for business_type, keywords in keyword_mapping.items():
-            if any(keyword in tipo_lower for keyword in keywords):
-                return business_type
-        
-        return "default"
+        return business_type_key(tipo_negocio)
     
-    def _get_location_multiplier(self, direccion: str) -> float:
+    def _get_location_multiplier(self, direccion: str, table: Optional[RateTable] = None) -> float:
         """Obtiene el multiplicador por ubicación"""
+        table = table or self.rate_table
         if not direccion:
-            return self.multiplicadores_ubicacion["default"]
-        
-        direccion_lower = direccion.lower()
-        
-        if any(zona in direccion_lower for zona in ["lima", "miraflores", "san isidro", "surco", "la molina"]):
-            return self.multiplicadores_ubicacion["lima"]
-        elif "arequipa" in direccion_lower:
-            return self.multiplicadores_ubicacion["arequipa"]
-        elif "trujillo" in direccion_lower:
-            return self.multiplicadores_ubicacion["trujillo"]
-        elif "cusco" in direccion_lower:
-            return self.multiplicadores_ubicacion["cusco"]
-        else:
-            return self.multiplicadores_ubicacion["default"]
+            return table.multiplicador[table.default_location_code]
+        
+        return table.multiplicador[table.location_code(location_key(direccion))]
     
     def _generate_description(self, business_info: BusinessInfo, factor_key: str, 
                             photos_count: int, multiplicador_ubicacion: float) -> str:
         """Genera descripción de la valuación - MEJORADA PARA FOTOS OPCIONALES"""
-        ubicacion_desc = ""
-        if multiplicador_ubicacion > 1.0:
-            ubicacion_desc = " (zona premium)"
-        elif multiplicador_ubicacion < 0.9:
-            ubicacion_desc = " (zona económica)"
+        return self._describe(business_info.tipo_negocio, business_info.metraje,
+                              photos_count, multiplicador_ubicacion)
+    
+    def _describe(self, tipo_negocio: str, metraje: float, photos_count: int,
+                  multiplicador_ubicacion: float) -> str:
+        """Texto de la descripción a partir de valores simples (compartido con estimate_batch)"""
+        zona = 1 if multiplicador_ubicacion > 1.0 else 2 if multiplicador_ubicacion < 0.9 else 0
+        return (f"Estimación para {tipo_negocio or 'negocio comercial'} "
+                f"de {self._format_metraje(metraje)}{self._describe_suffix(photos_count, zona)}")
+    
+    @staticmethod
+    def _format_metraje(metraje: float) -> str:
+        """Metraje sin decimales de más ni truncado (50, 50.0 -> "50"; 12345.67 -> "12345.67")"""
+        value = float(metraje)
+        return str(int(value)) if value.is_integer() else repr(value)
+    
+    @staticmethod
+    def _describe_suffix(photos_count: int, zona: int) -> str:
+        """Resto de la descripción; zona: 0 estándar, 1 premium, 2 económica"""
+        ubicacion_desc = ("", " (zona premium)", " (zona económica)")[zona]
         
         # Descripción mejorada de fotos
-        fotos_desc = ""
         if photos_count > 3:
             fotos_desc = f" Análisis detallado con {photos_count} fotos del local."
         elif photos_count > 0:
@@ -151,8 +258,7 @@ class ValuationEngine:
         else:
             fotos_desc = " Valuación estándar basada en datos del negocio."
         
-        return (f"Estimación para {business_info.tipo_negocio or 'negocio comercial'} "
-                f"de {business_info.metraje}m²{ubicacion_desc}.{fotos_desc}")
+        return f"m²{ubicacion_desc}.{fotos_desc}"
     
     def calculate_premium(self, total_value: float, business_type: str = "") -> float:
         """
@@ -165,19 +271,9 @@ class ValuationEngine:
         Returns:
             float: Prima anual estimada
         """
-        # Tasas base por tipo de negocio (% del valor asegurado)
-        tasas_riesgo = {
-            "restaurante": 0.0056,  # 0.56% - riesgo alto (fuego, cocina)
-            "bar": 0.0056,          # 0.56% - riesgo muy alto (alcohol, peleas)
-            "farmacia": 0.0056,     # 0.56% - riesgo bajo (medicinas valiosas pero seguras)
-            "oficina": 0.0056,      # 0.56% - riesgo muy bajo
-            "consultorio": 0.0056,  # 0.56% - riesgo bajo
-            "tienda": 0.0056,       # 0.56% - riesgo medio
-            "taller": 0.0056,       # 0.56% - riesgo alto (maquinaria)
-            "default": 0.0056       # 0.56% - riesgo medio por defecto
-        }
-        
+        # Tasa base por tipo de negocio (% del valor asegurado), desde la tabla de tarifas
+        table = self.rate_table
         business_key = self._get_business_type_key(business_type)
-        tasa = tasas_riesgo.get(business_key, tasas_riesgo["default"])
+        tasa = table.tasa_riesgo[table.business_code(business_key)]
         
         return round(total_value * tasa, 2)
\ No newline at end of file